@@ -1,28 +1,351 @@
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
 from django.contrib import admin
-from .models import TwoWheelerEntry, FourWheelerEntry
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import Max, Min
+from django.http import QueryDict
+from django.utils import timezone
+from django.utils.functional import cached_property
+from .events import correction_event, exit_event, record_event, void_event
+from .lots import default_lot, lot_choices, lot_database
+from .plates import mark_left, mark_parked, open_plate_for
+from .report_parts import invalidate_report_days_on_commit
+from .slots import release_slot
+from .models import (
+    TwoWheelerEntry, FourWheelerEntry, GateJournalEntry, ParkingEvent, OutboundEmail, ParkingSlot, ImportRun,
+)
 
-@admin.register(TwoWheelerEntry)
-class TwoWheelerEntryAdmin(admin.ModelAdmin):
-    list_display = ['token_id', 'vehicle_no', 'entry_time', 'exit_time', 'amount', 'is_parked']
-    list_filter = ['entry_time', 'exit_time']
+
+def estimate_row_count(model, using):
+    """
+    Return the planner's row estimate for a model's table, or None if the
+    backend has no cheap estimate
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                [table],
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that uses the table statistics instead of COUNT(*) when the
+    changelist is unfiltered. Filtered changelists (open sessions, entry
+    period, search) still count exactly, over an index range.
+
+    Pages are read with OFFSET, which costs more the deeper the page, so
+    only the first MAX_PAGES are offered; older rows are reached through
+    the entry-time drill-down.
+    """
+    MAX_PAGES = 50
+
+    @property
+    def num_pages(self):
+        return min(super().num_pages, self.MAX_PAGES)
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate is not None:
+                return estimate
+        return super().count
+
+
+class OpenSessionFilter(admin.SimpleListFilter):
+    """
+    Filter on open/closed sessions via the exit_time index
+    """
+    title = 'status'
+    parameter_name = 'status'
+
+    def lookups(self, request, model_admin):
+        return [('open', 'Open sessions only'), ('closed', 'Closed sessions only')]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'open':
+            return queryset.filter(exit_time__isnull=True)
+        if self.value() == 'closed':
+            return queryset.filter(exit_time__isnull=False)
+        return queryset
+
+
+class LotFilter(admin.SimpleListFilter):
+    """
+    Lot filter with choices from settings.PARKING_LOTS instead of a
+    SELECT DISTINCT over the table
+    """
+    title = 'lot'
+    parameter_name = 'lot'
+
+    def lookups(self, request, model_admin):
+        return lot_choices()
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(lot=self.value())
+        return queryset
+
+
+class VehicleClassFilter(admin.SimpleListFilter):
+    title = 'vehicle class'
+    parameter_name = 'vehicle_class'
+
+    def lookups(self, request, model_admin):
+        return [('TW', 'Two wheelers'), ('FW', 'Four wheelers')]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(vehicle_class=self.value())
+        return queryset
+
+
+def _next_month(day):
+    return (day.replace(day=1) + timedelta(days=31)).replace(day=1)
+
+
+class EntryPeriodFilter(admin.SimpleListFilter):
+    """
+    Entry-time drill-down read over the (lot, entry_time) index: recent
+    windows, then year, month and day choices between the lots' first and
+    last entry. Replaces date_hierarchy, whose links come from a DISTINCT
+    over the whole table.
+    """
+    title = 'entry time'
+    parameter_name = 'entered'
+    PERIODS = {'today': 0, '7days': 6, '30days': 29}
+
+    def _span(self, request, model_admin):
+        """
+        (first, last) local entry day over the lots shown, or None. Each
+        lot costs one MIN/MAX read on the ends of its index.
+        """
+        queryset = model_admin.get_queryset(request)
+        lot = request.GET.get(LotFilter.parameter_name)
+        lots = [lot] if lot in settings.PARKING_LOTS else [
+            code for code in settings.PARKING_LOTS if lot_database(code) == queryset.db
+        ]
+        bounds = [
+            queryset.filter(lot=code).aggregate(first=Min('entry_time'), last=Max('entry_time'))
+            for code in lots
+        ]
+        bounds = [bound for bound in bounds if bound['first'] is not None]
+        if not bounds:
+            return None
+        return (timezone.localdate(min(bound['first'] for bound in bounds)),
+                timezone.localdate(max(bound['last'] for bound in bounds)))
+
+    def _range(self):
+        """
+        [start day, end day) of the selected year, month or day
+        """
+        value = self.value()
+        try:
+            parts = [int(part) for part in value.split('-')]
+            if len(parts) == 1:
+                return date(parts[0], 1, 1), date(parts[0] + 1, 1, 1)
+            if len(parts) == 2:
+                start = date(parts[0], parts[1], 1)
+                return start, _next_month(start)
+            if len(parts) == 3:
+                start = date(*parts)
+                return start, start + timedelta(days=1)
+        except (ValueError, OverflowError):
+            pass
+        raise IncorrectLookupParameters(f"Unknown entry time {value!r}")
+
+    def lookups(self, request, model_admin):
+        choices = [('today', 'Today'), ('7days', 'Past 7 days'), ('30days', 'Past 30 days')]
+        span = self._span(request, model_admin)
+        if span is None:
+            return choices
+        first, last = span
+        choices += [(str(year), str(year)) for year in range(last.year, first.year - 1, -1)]
+        if not self.value() or self.value() in self.PERIODS:
+            return choices
+        start, end = self._range()
+        # Months of the selected year; days of the selected month
+        months = [date(start.year, month, 1) for month in range(12, 0, -1)]
+        choices += [(f'{month:%Y-%m}', f'{month:%b %Y}') for month in months
+                    if first.replace(day=1) <= month <= last]
+        if (end - start).days <= 31:
+            month = start.replace(day=1)
+            days = [month + timedelta(days=n) for n in range((_next_month(month) - month).days - 1, -1, -1)]
+            choices += [(day.isoformat(), f'{day:%d %b %Y}') for day in days if first <= day <= last]
+        return choices
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if not value:
+            return queryset
+        if value in self.PERIODS:
+            start_day, end_day = timezone.localdate() - timedelta(days=self.PERIODS[value]), None
+        else:
+            start_day, end_day = self._range()
+        queryset = queryset.filter(entry_time__gte=timezone.make_aware(datetime.combine(start_day, time.min)))
+        if end_day is not None:
+            queryset = queryset.filter(entry_time__lt=timezone.make_aware(datetime.combine(end_day, time.min)))
+        return queryset
+
+
+class ParkingEntryAdmin(admin.ModelAdmin):
+    list_display = ['token_id', 'lot', 'vehicle_no', 'slot', 'entry_time', 'exit_time', 'amount', 'is_parked']
+    list_filter = [LotFilter, OpenSessionFilter, EntryPeriodFilter]
     search_fields = ['token_id', 'vehicle_no']
-    readonly_fields = ['token_id', 'entry_time']
+    # Sessions are opened by the gates or import_sessions. Everything the
+    # projections are keyed on is fixed here; exit_time and amount edits
+    # go through the event log.
+    readonly_fields = ['token_id', 'lot', 'slot', 'entry_time']
+    ordering = ['-id']
     list_per_page = 20
-    
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    vehicle_class = None
+
+    def lot_database_for(self, request):
+        """
+        Database of the lot the changelist is filtered on, which the change
+        and delete pages carry in _changelist_filters; the default lot's
+        database when no lot is selected
+        """
+        lot = request.GET.get(LotFilter.parameter_name)
+        if lot is None:
+            lot = QueryDict(request.GET.get('_changelist_filters', '')).get(LotFilter.parameter_name)
+        return lot_database(lot if lot in settings.PARKING_LOTS else default_lot())
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).using(self.lot_database_for(request))
+
+    @admin.display(boolean=True, description='Parked', ordering='exit_time')
     def is_parked(self, obj):
         return obj.exit_time is None
-    is_parked.boolean = True
-    is_parked.short_description = 'Parked'
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_readonly_fields(self, request, obj=None):
+        # A closed session is never reopened or re-timed; delete it instead
+        if obj is not None and obj.exit_time is not None:
+            return self.readonly_fields + ['exit_time']
+        return self.readonly_fields
+
+    def save_model(self, request, obj, form, change):
+        """
+        Closing a session here records its exit like the exit gate does;
+        amount edits on closed sessions are recorded as corrections
+        """
+        previous_plate = obj.open_plate
+        closed_before = form.initial.get('exit_time') is not None
+        obj.open_plate = open_plate_for(obj)
+        with transaction.atomic(using=lot_database(obj.lot)):
+            obj.save(using=lot_database(obj.lot))
+            if obj.exit_time is not None and not closed_before:
+                release_slot(obj.lot, self.vehicle_class, obj.token_id, obj.slot)
+                record_event(exit_event(self.vehicle_class, obj))
+            elif closed_before and 'amount' in form.changed_data:
+                record_event(correction_event(self.vehicle_class, obj, form.initial.get('amount')))
+            if obj.open_plate != previous_plate:
+                mark_left(self.vehicle_class, obj, previous_plate)
+                mark_parked(self.vehicle_class, obj)
+            invalidate_report_days_on_commit(obj.lot, [obj.entry_time, obj.exit_time])
+
+    def _delete_session(self, obj):
+        if obj.exit_time is None:
+            release_slot(obj.lot, self.vehicle_class, obj.token_id, obj.slot)
+        mark_left(self.vehicle_class, obj, obj.open_plate)
+        record_event(void_event(self.vehicle_class, obj))
+        invalidate_report_days_on_commit(obj.lot, [obj.entry_time, obj.exit_time])
+
+    def delete_model(self, request, obj):
+        """
+        Deleted sessions are voided in the event log and give back their
+        bay and plate
+        """
+        with transaction.atomic(using=lot_database(obj.lot)):
+            obj.delete(using=lot_database(obj.lot))
+            self._delete_session(obj)
+
+    def delete_queryset(self, request, queryset):
+        sessions = list(queryset)
+        with transaction.atomic(using=queryset.db):
+            super().delete_queryset(request, queryset)
+            for obj in sessions:
+                self._delete_session(obj)
+
+@admin.register(TwoWheelerEntry)
+class TwoWheelerEntryAdmin(ParkingEntryAdmin):
+    vehicle_class = 'TW'
 
 @admin.register(FourWheelerEntry)
-class FourWheelerEntryAdmin(admin.ModelAdmin):
-    list_display = ['token_id', 'vehicle_no', 'entry_time', 'exit_time', 'amount', 'is_parked']
-    list_filter = ['entry_time', 'exit_time']
+class FourWheelerEntryAdmin(ParkingEntryAdmin):
+    vehicle_class = 'FW'
+
+@admin.register(GateJournalEntry)
+class GateJournalEntryAdmin(admin.ModelAdmin):
+    list_display = ['token_id', 'lot', 'kind', 'vehicle_no', 'entry_time', 'exit_time', 'amount', 'status', 'note']
+    list_filter = ['status', 'kind', VehicleClassFilter, LotFilter]
     search_fields = ['token_id', 'vehicle_no']
-    readonly_fields = ['token_id', 'entry_time']
+    ordering = ['-id']
     list_per_page = 20
-    
-    def is_parked(self, obj):
-        return obj.exit_time is None
-    is_parked.boolean = True
-    is_parked.short_description = 'Parked'
\ No newline at end of file
+
+@admin.register(ParkingEvent)
+class ParkingEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'lot', 'vehicle_class', 'token_id', 'occurred_at', 'amount']
+    list_filter = ['kind', VehicleClassFilter, LotFilter]
+    search_fields = ['token_id']
+    ordering = ['-id']
+    list_per_page = 20
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    # The event log is append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'to', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status']
+    readonly_fields = ['created_at', 'sent_at', 'last_error']
+    ordering = ['-id']
+    list_per_page = 20
+
+@admin.register(ParkingSlot)
+class ParkingSlotAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'lot', 'vehicle_class', 'zone', 'number', 'token_id', 'occupied_at']
+    list_filter = [LotFilter, VehicleClassFilter, 'zone']
+    search_fields = ['token_id']
+    ordering = ['lot', 'vehicle_class', 'zone', 'number']
+
+@admin.register(ImportRun)
+class ImportRunAdmin(admin.ModelAdmin):
+    list_display = ['source', 'lot', 'position', 'imported', 'rejected', 'retokened', 'updated_at', 'finished_at']
+    list_filter = [LotFilter]
+    readonly_fields = ['lot', 'source', 'digest', 'position', 'imported', 'rejected', 'retokened',
+                       'started_at', 'updated_at', 'finished_at']
+    ordering = ['-id']
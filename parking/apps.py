@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ParkingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'parking'
+
+    def ready(self):
+        from . import checks  # noqa: F401  registers the system checks
+        from .auth import connect_signals
+
+        connect_signals()
@@ -0,0 +1,50 @@
+"""
+Authentication backend that keeps users in the cache.
+
+AuthenticationMiddleware loads request.user on every authenticated request,
+which for a gate terminal is one auth_user query per entry or exit. Here
+the user is read from the cache instead and dropped from it whenever the
+user row is saved or deleted. Saving covers password changes, so the
+session auth hash check still logs out other sessions at once. Updates that
+bypass save() show up within TIMEOUT seconds.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+
+USER_CACHE_DEFAULTS = {
+    'CACHE': 'default',
+    'TIMEOUT': 300,
+}
+
+def user_cache_config():
+    return {**USER_CACHE_DEFAULTS, **getattr(settings, 'PARKING_USER_CACHE', {})}
+
+def _key(user_id):
+    return f'parking:user:{user_id}'
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        config = user_cache_config()
+        cache = caches[config['CACHE']]
+        user = cache.get(_key(user_id))
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(_key(user_id), user, config['TIMEOUT'])
+        return user if self.user_can_authenticate(user) else None
+
+def forget_user(sender, instance, **kwargs):
+    """
+    Drop a saved or deleted user from the cache
+    """
+    caches[user_cache_config()['CACHE']].delete(_key(instance.pk))
+
+def connect_signals():
+    user_model = get_user_model()
+    post_save.connect(forget_user, sender=user_model, dispatch_uid='parking_forget_user_saved')
+    post_delete.connect(forget_user, sender=user_model, dispatch_uid='parking_forget_user_deleted')
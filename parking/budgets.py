@@ -0,0 +1,181 @@
+"""
+Query budgets: the most SQL queries and fetched rows each URL may cost,
+declared in one place.
+
+`query_budget` measures a block on every database connection. The test
+suite runs every route in parking/urls.py under it and fails on overrun;
+in production QueryBudgetMiddleware can log overruns as warnings.
+Budgets cover session, auth and message queries as well as the view's own.
+"""
+import logging
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Session-read row budgets are sized on the QueryBudgetTests fixture: six
+# sessions per class on each of the last 10 days, one open session per
+# class, and the two entries its route cases make. About 20% headroom over
+# what a read of those sessions fetches means a read that starts fetching
+# rows it does not need, or the same rows twice, fails the suite. They are
+# not limits for a live lot; expect WARN to report these routes there.
+FIXTURE_DAY = 2 * 6
+FIXTURE_TODAY = 2 + 2   # open sessions and route-case entries, all entered today
+FIXTURE_SESSIONS = 10 * FIXTURE_DAY + FIXTURE_TODAY
+
+def _session_rows(sessions, per_session=1):
+    """
+    Rows for reading `sessions` sessions with 20% headroom, plus 10 for
+    the session, user and summary reads around them
+    """
+    return int(sessions * per_session * 1.2) + 10
+
+# url name -> {'queries': max queries, 'rows': max rows fetched}
+# Measured with the projections caught up
+QUERY_BUDGETS = {
+    'homepage': {'queries': 10, 'rows': 20},
+    'login_view': {'queries': 3, 'rows': 3},
+    'logout_view': {'queries': 5, 'rows': 5},
+    'select_lot': {'queries': 6, 'rows': 4},
+
+    # Gate routes count on the session and user being cached
+    # (parking.auth); a cold cache adds two queries
+    'two_wheeler_entry': {'queries': 8, 'rows': 4},
+    'two_wheeler_exit_search': {'queries': 1, 'rows': 1},
+    'two_wheeler_exit': {'queries': 7, 'rows': 4},
+    'four_wheeler_entry': {'queries': 8, 'rows': 4},
+    'four_wheeler_exit_search': {'queries': 1, 'rows': 1},
+    'four_wheeler_exit': {'queries': 7, 'rows': 4},
+    'entry_success': {'queries': 1, 'rows': 1},
+    'exit_success': {'queries': 2, 'rows': 2},
+
+    'password_reset': {'queries': 4, 'rows': 4},
+    'password_reset_done': {'queries': 0, 'rows': 0},
+    'password_reset_confirm': {'queries': 6, 'rows': 3},
+    'password_reset_complete': {'queries': 0, 'rows': 0},
+
+    # Charts read hourly rollups: a fixed number of queries whatever the
+    # range, and at most 30 days x 24 hours x 2 classes rows per chart
+    'reports_analytics': {'queries': 20, 'rows': 3000},
+    # Exports read the sessions of every day without a stored report part,
+    # at worst each local day the range touches (today and the 7 or 30
+    # days before it), which for the 30-day ranges is the whole fixture
+    'daily_report': {'queries': 8, 'rows': _session_rows(FIXTURE_DAY + FIXTURE_TODAY)},
+    'weekly_report': {'queries': 8, 'rows': _session_rows(8 * FIXTURE_DAY + FIXTURE_TODAY)},
+    'monthly_report': {'queries': 8, 'rows': _session_rows(FIXTURE_SESSIONS)},
+    'export_excel': {'queries': 8, 'rows': _session_rows(FIXTURE_SESSIONS)},
+    'snapshot_analytics': {'queries': 3, 'rows': 3},
+    # Two index range reads per class, an entry and an exit timestamp per
+    # session over at most the 30-day filter
+    'occupancy_timeline': {'queries': 10, 'rows': _session_rows(FIXTURE_SESSIONS, per_session=2)},
+    'occupancy_chart': {'queries': 10, 'rows': _session_rows(FIXTURE_SESSIONS, per_session=2)},
+
+    # One keyset read per class for a JSON page, which with limit=1000
+    # holds the whole fixture; NDJSON streams read the same pages after
+    # the view has returned
+    'session_history': {'queries': 5, 'rows': _session_rows(FIXTURE_SESSIONS)},
+
+    'readiness': {'queries': 0, 'rows': 0},
+    'profile_list': {'queries': 5, 'rows': 3},
+    'profile_download': {'queries': 3, 'rows': 3},
+    'db_pool_stats': {'queries': 3, 'rows': 3},
+}
+
+BUDGET_DEFAULTS = {
+    'WARN': False,      # log overruns from QueryBudgetMiddleware
+}
+
+def budget_config():
+    return {**BUDGET_DEFAULTS, **getattr(settings, 'PARKING_QUERY_BUDGETS', {})}
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class _RowCountingCursor:
+    """
+    Proxy for a DB-API cursor that counts rows as they are fetched
+    """
+
+    def __init__(self, cursor, usage):
+        self._cursor = cursor
+        self._usage = usage
+
+    def __getattr__(self, attr):
+        return getattr(self._cursor, attr)
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._usage.rows += 1
+            yield row
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._usage.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._usage.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._usage.rows += len(rows)
+        return rows
+
+
+class BudgetUsage:
+    def __init__(self, url_name, budget):
+        self.url_name = url_name
+        self.budget = budget
+        self.queries = 0
+        self.rows = 0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        self.statements.append(sql)
+        result = execute(sql, params, many, context)
+        wrapper = context['cursor']
+        if not isinstance(wrapper.cursor, _RowCountingCursor):
+            wrapper.cursor = _RowCountingCursor(wrapper.cursor, self)
+        else:
+            wrapper.cursor._usage = self
+        return result
+
+    def overruns(self):
+        """
+        Human readable list of exceeded limits
+        """
+        problems = []
+        if self.queries > self.budget['queries']:
+            problems.append(f"{self.queries} queries > budget {self.budget['queries']}")
+        if self.rows > self.budget['rows']:
+            problems.append(f"{self.rows} rows > budget {self.budget['rows']}")
+        return problems
+
+    def report(self):
+        statements = '\n'.join(f"  {sql}" for sql in self.statements)
+        return f"{self.url_name}: {', '.join(self.overruns())}\n{statements}"
+
+
+@contextmanager
+def query_budget(url_name, enforce=True):
+    """
+    Measure the block against the budget for `url_name`. Raises
+    QueryBudgetExceeded on overrun when `enforce` is set; yields the usage.
+    """
+    if url_name not in QUERY_BUDGETS:
+        raise KeyError(f"No query budget declared for {url_name!r}")
+    usage = BudgetUsage(url_name, QUERY_BUDGETS[url_name])
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(usage))
+        yield usage
+    if enforce and usage.overruns():
+        raise QueryBudgetExceeded(usage.report())
@@ -0,0 +1,48 @@
+"""
+System checks for the parking settings
+"""
+from django.conf import settings
+from django.core import checks
+
+from .gate import NODE_ID_LENGTH, TOKEN_ALPHABET, gate_node_enabled
+from .plates import PLATE_CACHE
+
+# Backends whose set() does work proportional to the number of keys
+CULLING_BACKENDS = {'django.core.cache.backends.filebased.FileBasedCache'}
+
+@checks.register(checks.Tags.caches)
+def check_plate_cache(app_configs, **kwargs):
+    config = settings.CACHES.get(PLATE_CACHE)
+    if config is None:
+        return [checks.Error(
+            f"CACHES has no {PLATE_CACHE!r} alias for the parked-plate guard.",
+            hint="Add a LocMemCache or RedisCache under that name (see parking.plates).",
+            id='parking.E001',
+        )]
+    if config.get('BACKEND') in CULLING_BACKENDS:
+        return [checks.Error(
+            f"CACHES[{PLATE_CACHE!r}] uses {config['BACKEND']}, which lists its whole "
+            "directory on every write.",
+            hint="Use a LocMemCache per worker or a RedisCache for the plate cache.",
+            id='parking.E002',
+        )]
+    return []
+
+@checks.register()
+def check_gate_node_id(app_configs, **kwargs):
+    """
+    A node token is '<class>-<NODE_ID><sequence>' and must fit the 10
+    characters of token_id, so NODE_ID is exactly two token characters.
+    Uniqueness across nodes cannot be checked from one node.
+    """
+    if not gate_node_enabled():
+        return []
+    node_id = settings.PARKING_GATE_NODE.get('NODE_ID')
+    if not isinstance(node_id, str) or len(node_id) != NODE_ID_LENGTH or set(node_id) - set(TOKEN_ALPHABET):
+        return [checks.Error(
+            f"PARKING_GATE_NODE['NODE_ID'] is {node_id!r}; it must be {NODE_ID_LENGTH} characters "
+            "from 0-9 and A-Z.",
+            hint="Give every gate node its own two-character id, e.g. '01'.",
+            id='parking.E003',
+        )]
+    return []
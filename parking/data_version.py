@@ -0,0 +1,92 @@
+"""
+Cheap per-lot, per-class data-version stamps, bumped whenever an entry,
+exit or correction commits. The dashboards derive ETag/Last-Modified from
+them so unchanged pages are answered with 304 without running the view.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+
+from .lots import current_lot
+
+VEHICLE_CLASSES = ('TW', 'FW')
+
+def _version_key(lot, vehicle_class):
+    return f'parking:data-version:{lot}:{vehicle_class}'
+
+def _modified_key(lot):
+    return f'parking:data-modified:{lot}'
+
+def bump_data_version(lot, vehicle_class):
+    """
+    Mark a lot's data for a vehicle class as changed
+    """
+    key = _version_key(lot, vehicle_class)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Missing (evicted or never set): seed from the clock so the new
+        # value cannot repeat one a client may still hold
+        cache.set(key, time.time_ns(), None)
+    cache.set(_modified_key(lot), time.time(), None)
+
+def data_version(lot):
+    """
+    Return (version string, last modified datetime) for a lot
+    """
+    keys = [_version_key(lot, vehicle_class) for vehicle_class in VEHICLE_CLASSES]
+    values = cache.get_many(keys + [_modified_key(lot)])
+    missing = [key for key in keys if key not in values]
+    if missing:
+        now = time.time()
+        seeded = {key: time.time_ns() for key in missing}
+        cache.set_many({**seeded, _modified_key(lot): now}, None)
+        values.update(seeded)
+        values[_modified_key(lot)] = now
+    version = '-'.join(str(values[key]) for key in keys)
+    modified = values.get(_modified_key(lot)) or time.time()
+    return version, datetime.fromtimestamp(modified, tz=dt_timezone.utc)
+
+# ================================
+# CONDITIONAL GET HELPERS
+# ================================
+
+def _period_start(now, period):
+    if period == 'hour':
+        return now.replace(minute=0, second=0, microsecond=0)
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def dashboard_etag(period):
+    """
+    ETag function for condition(): data version plus everything else the
+    page depends on (user, session and CSRF token of its forms, pending
+    messages, lot, query string, current day or hour)
+    """
+    def etag_func(request, *args, **kwargs):
+        lot = current_lot(request)
+        version, _ = data_version(lot)
+        now = datetime.now(dt_timezone.utc)
+        parts = [
+            str(request.user.pk), request.session.session_key or '',
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+            request.COOKIES.get(CookieStorage.cookie_name, ''),
+            lot, version,
+            request.META.get('QUERY_STRING', ''),
+            _period_start(now, period).isoformat(),
+        ]
+        return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+    return etag_func
+
+def dashboard_last_modified(period):
+    """
+    Last-Modified function for condition(): the later of the last data
+    change and the start of the current day or hour
+    """
+    def last_modified_func(request, *args, **kwargs):
+        _, modified = data_version(current_lot(request))
+        return max(modified, _period_start(datetime.now(dt_timezone.utc), period))
+    return last_modified_func
@@ -0,0 +1,6 @@
+"""
+Database backends with a per-worker connection pool.
+
+Use 'parking.db.mysql' (or 'parking.db.sqlite3' to try it locally) as the
+ENGINE and configure the pool in OPTIONS, see parking.db.pool.
+"""
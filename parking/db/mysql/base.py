@@ -0,0 +1,12 @@
+"""
+MySQL backend with the worker connection pool (parking.db.pool)
+"""
+from django.db.backends.mysql import base
+
+from ..pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    def ping_connection(self, connection):
+        # A protocol-level ping; False stops the driver reconnecting quietly
+        connection.ping(False)
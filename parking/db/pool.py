@@ -0,0 +1,394 @@
+"""
+Connection pool shared by all threads of a worker process.
+
+Django keeps one connection per thread. With CONN_MAX_AGE that connection
+survives between requests only while the thread does; servers that run
+each request in a new thread (runserver, ASGI's sync_to_async executor)
+pay the TCP and auth handshake on every request and leak connections
+until they are collected. A pool ties connections to the worker instead:
+close() hands the raw connection back, and the next connect() in any
+thread borrows it.
+
+Enable it per alias with an ENGINE from parking.db and
+
+    'CONN_MAX_AGE': 0,
+    'OPTIONS': {'pool': {'max_size': 10, 'timeout': 5}},
+
+(see POOL_DEFAULTS for every option). Health checks replace
+CONN_HEALTH_CHECKS: a connection idle for more than `check_after` seconds
+is pinged before it is handed out, and one that is broken, or older than
+`max_lifetime`, is closed and replaced. Every pool counts its checkouts,
+new connections, waits and time in use; pool_stats() reports them for
+/admin-tools/db-pools/.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import suppress
+from functools import partial
+
+from django.core.exceptions import ImproperlyConfigured
+
+POOL_DEFAULTS = {
+    'min_size': 1,          # connections opened at warm-up and kept when idle
+    'max_size': 10,         # open connections per worker process
+    'timeout': 5.0,         # seconds to wait for a free connection
+    'max_idle': 300,        # close idle connections above min_size after this
+    'max_lifetime': 3600,   # replace connections older than this (below MySQL wait_timeout)
+    'check_after': 30,      # ping connections idle for longer than this
+}
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Bounded pool of raw DB-API connections. acquire() hands out the most
+    recently used idle connection, opens a new one while the pool is below
+    max_size, or waits up to `timeout` for one to come back.
+    """
+
+    def __init__(self, name, min_size, max_size, timeout, max_idle, max_lifetime, check_after):
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+
+        self.condition = threading.Condition()
+        # (connection, opened at, last used, never handed out), oldest first
+        self.idle = deque()
+        # connection -> opened at
+        self.in_use = {}
+        self.opening = 0
+        self.waiting = 0
+        self.created_at = self.changed_at = time.monotonic()
+        self.busy_seconds = 0.0
+        self.counters = dict.fromkeys([
+            'checkouts', 'reused', 'connects', 'connect_seconds', 'discarded', 'failed_checks',
+            'timeouts', 'waits', 'wait_seconds', 'max_wait_seconds', 'peak_in_use',
+        ], 0)
+
+    @property
+    def size(self):
+        return len(self.idle) + len(self.in_use) + self.opening
+
+    def _mark_busy(self, now):
+        # Integrates connections in use over time, for utilisation
+        self.busy_seconds += len(self.in_use) * (now - self.changed_at)
+        self.changed_at = now
+
+    def _expired(self, opened_at, now):
+        return self.max_lifetime is not None and now - opened_at >= self.max_lifetime
+
+    def _checked_out(self, started, now, waited):
+        self.counters['checkouts'] += 1
+        self.counters['peak_in_use'] = max(self.counters['peak_in_use'], len(self.in_use))
+        if waited:
+            self.counters['waits'] += 1
+            self.counters['wait_seconds'] += now - started
+            self.counters['max_wait_seconds'] = max(self.counters['max_wait_seconds'], now - started)
+
+    def _forget(self, connections):
+        """
+        Close connections that left the pool, outside the lock
+        """
+        for connection in connections:
+            with suppress(Exception):
+                connection.close()
+
+    def acquire(self, connect, ping):
+        """
+        (connection, fresh) where `fresh` is True for a connection that was
+        never handed out before, so its session state is still to be set
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        while True:
+            entry = None
+            with self.condition:
+                while not self.idle and self.size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.counters['timeouts'] += 1
+                        raise PoolTimeout(
+                            f"No connection free in pool {self.name} after {self.timeout}s "
+                            f"({self.max_size} in use)"
+                        )
+                    waited = True
+                    self.waiting += 1
+                    self.condition.wait(remaining)
+                    self.waiting -= 1
+                if self.idle:
+                    # Held as in use while it is checked
+                    entry = self.idle.pop()
+                    self._mark_busy(time.monotonic())
+                    self.in_use[entry[0]] = entry[1]
+                else:
+                    self.opening += 1
+
+            now = time.monotonic()
+            if entry is None:
+                try:
+                    connection = connect()
+                except BaseException:
+                    with self.condition:
+                        self.opening -= 1
+                        self.condition.notify()
+                    raise
+                opened = time.monotonic()
+                with self.condition:
+                    self.opening -= 1
+                    self.counters['connects'] += 1
+                    self.counters['connect_seconds'] += opened - now
+                    self._mark_busy(opened)
+                    self.in_use[connection] = opened
+                    self._checked_out(started, now, waited)
+                return connection, True
+
+            connection, opened_at, last_used, fresh = entry
+            healthy = not self._expired(opened_at, now)
+            if healthy and now - last_used > self.check_after:
+                try:
+                    ping(connection)
+                except Exception:
+                    healthy = False
+                    with self.condition:
+                        self.counters['failed_checks'] += 1
+            with self.condition:
+                if healthy:
+                    self.counters['reused'] += not fresh
+                    self._checked_out(started, now, waited)
+                else:
+                    self._mark_busy(time.monotonic())
+                    del self.in_use[connection]
+                    self.counters['discarded'] += 1
+                    self.condition.notify()
+            if healthy:
+                return connection, fresh
+            self._forget([connection])
+
+    def release(self, connection, reusable=True):
+        """
+        Give a connection back. Broken or expired connections are closed, as
+        are connections idle for max_idle while the pool is above min_size.
+        """
+        now = time.monotonic()
+        closing = []
+        with self.condition:
+            self._mark_busy(now)
+            opened_at = self.in_use.pop(connection, None)
+            if opened_at is None or not reusable or self._expired(opened_at, now):
+                self.counters['discarded'] += opened_at is not None
+                closing.append(connection)
+            else:
+                self.idle.append((connection, opened_at, now, False))
+            while self.idle and self.size > self.min_size and now - self.idle[0][2] > self.max_idle:
+                closing.append(self.idle.popleft()[0])
+            self.condition.notify()
+        self._forget(closing)
+
+    def fill(self, connect):
+        """
+        Open idle connections up to min_size; returns how many were opened
+        """
+        opened = 0
+        while True:
+            with self.condition:
+                if self.size >= self.min_size:
+                    return opened
+                self.opening += 1
+            started = time.monotonic()
+            try:
+                connection = connect()
+            finally:
+                with self.condition:
+                    self.opening -= 1
+            now = time.monotonic()
+            with self.condition:
+                self.counters['connects'] += 1
+                self.counters['connect_seconds'] += now - started
+                self.idle.append((connection, now, now, True))
+                self.condition.notify()
+            opened += 1
+
+    def close(self):
+        """
+        Close the idle connections; those in use are closed on release
+        """
+        with self.condition:
+            closing = [entry[0] for entry in self.idle]
+            self.idle.clear()
+            self.min_size = 0
+        self._forget(closing)
+
+    def stats(self):
+        now = time.monotonic()
+        with self.condition:
+            self._mark_busy(now)
+            counters = dict(self.counters)
+            in_use, idle, waiting = len(self.in_use), len(self.idle), self.waiting
+            busy, elapsed = self.busy_seconds, now - self.created_at
+        connects, waits = counters['connects'], counters['waits']
+        return {
+            'pool': self.name,
+            'min_size': self.min_size,
+            'max_size': self.max_size,
+            'open': in_use + idle,
+            'in_use': in_use,
+            'idle': idle,
+            'waiting': waiting,
+            'peak_in_use': counters['peak_in_use'],
+            # Average share of max_size in use since the pool was created
+            'utilisation': round(busy / (elapsed * self.max_size), 4) if elapsed else 0.0,
+            'checkouts': counters['checkouts'],
+            'reused': counters['reused'],
+            'connects': connects,
+            'connect_ms_avg': round(counters['connect_seconds'] * 1000 / connects, 2) if connects else None,
+            'discarded': counters['discarded'],
+            'failed_checks': counters['failed_checks'],
+            'timeouts': counters['timeouts'],
+            'waits': waits,
+            'wait_ms_avg': round(counters['wait_seconds'] * 1000 / waits, 2) if waits else None,
+            'wait_ms_max': round(counters['max_wait_seconds'] * 1000, 2),
+        }
+
+# ================================
+# POOLS PER WORKER
+# ================================
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def pool_options(settings_dict):
+    """
+    Pool options of a DATABASES entry, or None when it is not pooled
+    """
+    options = settings_dict['OPTIONS'].get('pool')
+    if not options:
+        return None
+    if settings_dict['CONN_MAX_AGE'] != 0:
+        raise ImproperlyConfigured(
+            "A pooled database needs CONN_MAX_AGE = 0: connections go back to "
+            "the pool at the end of each request instead of staying with the thread."
+        )
+    options = {**POOL_DEFAULTS, **(options if isinstance(options, dict) else {})}
+    unknown = set(options) - set(POOL_DEFAULTS)
+    if unknown:
+        raise ImproperlyConfigured(f"Unknown pool options: {', '.join(sorted(unknown))}")
+    if not 0 <= options['min_size'] <= options['max_size']:
+        raise ImproperlyConfigured("Pool options need 0 <= min_size <= max_size")
+    return options
+
+def get_pool(alias, database, options):
+    """
+    The worker's pool for a database alias. The database name is part of
+    the key, so the test database gets its own pool.
+    """
+    key = (alias, str(database))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(f'{alias}:{database}', **options)
+        return _pools[key]
+
+def pool_stats():
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+def _forget_inherited_pools():
+    """
+    A forked worker must not use the parent's sockets; drop its pools
+    without closing them
+    """
+    _pools.clear()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_inherited_pools)
+
+# ================================
+# DATABASE WRAPPER
+# ================================
+
+class PooledDatabaseWrapperMixin:
+    """
+    DatabaseWrapper mixin that borrows raw connections from the worker's
+    pool in connect() and gives them back in close(). Without
+    OPTIONS['pool'] the backend behaves like the one it extends.
+    """
+
+    _fresh_connection = True
+
+    @property
+    def pool(self):
+        options = pool_options(self.settings_dict)
+        if options is None:
+            return None
+        return get_pool(self.alias, self.settings_dict['NAME'], options)
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def ping_connection(self, connection):
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            self._fresh_connection = True
+            return super().get_new_connection(conn_params)
+        try:
+            connection, self._fresh_connection = pool.acquire(
+                partial(super().get_new_connection, conn_params), self.ping_connection,
+            )
+        except PoolTimeout as exc:
+            raise self.Database.OperationalError(str(exc)) from exc
+        return connection
+
+    def init_connection_state(self):
+        # Session settings (isolation level, sql mode) stay with a pooled
+        # connection, so they are set once, not on every checkout
+        if self._fresh_connection:
+            super().init_connection_state()
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        # A connection closed inside atomic() stays referenced by this
+        # wrapper, and one with errors may be broken: neither goes back
+        reusable = not self.in_atomic_block and (not self.errors_occurred or self.is_usable())
+        if reusable and not self.autocommit:
+            try:
+                self.connection.rollback()
+            except self.Database.Error:
+                reusable = False
+        pool.release(self.connection, reusable)
+
+    def fill_pool(self):
+        """
+        Open the pool's min_size connections; returns how many were opened
+        """
+        pool = self.pool
+        if pool is None:
+            return 0
+        return pool.fill(partial(super().get_new_connection, self.get_connection_params()))
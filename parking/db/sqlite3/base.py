@@ -0,0 +1,11 @@
+"""
+SQLite backend with the worker connection pool (parking.db.pool), for
+trying the pool locally
+"""
+from django.db.backends.sqlite3 import base
+
+from ..pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,408 @@
+"""
+Append-only parking event log and the projections derived from it.
+
+Views append an event in the same transaction as the session row. A
+consumer (apply_pending, run by `consume_events`) folds new events into
+the projections in id order, plus events that commit late into an id gap
+it already passed; rebuild_projections replays the whole log from
+scratch. Dashboards call catch_up before reading, which folds a bounded
+number of events and never waits for another consumer.
+"""
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .data_version import bump_data_version
+from .lots import lot_database
+from .models import (
+    TwoWheelerEntry, FourWheelerEntry, ParkingEvent, OpenSession,
+    OccupancyProjection, HourlyRollup, ProjectionCheckpoint,
+)
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = 'projections'
+
+# An id gap below the checkpoint may still be filled by a transaction that
+# has not committed yet (a gate journal sync or an import batch can stay
+# open for minutes), so the consumer remembers it and applies its events
+# when they appear. A gap still empty after GAP_RETENTION is taken for
+# rolled-back inserts: auto-increment ids are never reused.
+GAP_RETENTION = timedelta(hours=6)
+MAX_GAPS = 200  # each gap is one OR-ed id range in the query
+
+# Events a dashboard request folds at most before reading; a larger
+# backlog (an import, a gate journal sync) is left to consume_events
+REQUEST_FOLD_LIMIT = 500
+
+# ================================
+# WRITING EVENTS
+# ================================
+
+def entry_event(vehicle_class, entry):
+    return ParkingEvent(
+        lot=entry.lot,
+        vehicle_class=vehicle_class,
+        kind=ParkingEvent.ENTRY,
+        token_id=entry.token_id,
+        vehicle_no=entry.vehicle_no,
+        occurred_at=entry.entry_time,
+    )
+
+def exit_event(vehicle_class, entry):
+    return ParkingEvent(
+        lot=entry.lot,
+        vehicle_class=vehicle_class,
+        kind=ParkingEvent.EXIT,
+        token_id=entry.token_id,
+        vehicle_no=entry.vehicle_no,
+        occurred_at=entry.exit_time,
+        amount=entry.amount,
+        data={'entry_time': entry.entry_time.isoformat()},
+    )
+
+def correction_event(vehicle_class, entry, previous_amount):
+    """
+    Amount correction on a closed session; revenue moves in the exit hour
+    """
+    return ParkingEvent(
+        lot=entry.lot,
+        vehicle_class=vehicle_class,
+        kind=ParkingEvent.CORRECTION,
+        token_id=entry.token_id,
+        vehicle_no=entry.vehicle_no,
+        occurred_at=timezone.now(),
+        amount=entry.amount,
+        data={
+            'exit_time': entry.exit_time.isoformat(),
+            'previous_amount': str(previous_amount or 0),
+        },
+    )
+
+def void_event(vehicle_class, entry):
+    """
+    Session deleted in the admin; takes back its entry, and its exit and
+    revenue if it was closed
+    """
+    return ParkingEvent(
+        lot=entry.lot,
+        vehicle_class=vehicle_class,
+        kind=ParkingEvent.VOID,
+        token_id=entry.token_id,
+        vehicle_no=entry.vehicle_no,
+        occurred_at=timezone.now(),
+        amount=entry.amount,
+        data={
+            'entry_time': entry.entry_time.isoformat(),
+            'exit_time': entry.exit_time.isoformat() if entry.exit_time else None,
+        },
+    )
+
+def _bump_on_commit(events, using):
+    changed = {(event.lot, event.vehicle_class) for event in events}
+    transaction.on_commit(
+        lambda: [bump_data_version(lot, vehicle_class) for lot, vehicle_class in changed],
+        using=using,
+    )
+
+def record_event(event):
+    """
+    Append one event to its lot's log
+    """
+    using = lot_database(event.lot)
+    event.save(using=using)
+    _bump_on_commit([event], using)
+
+def record_events(events, using):
+    """
+    Append events to the log of one database
+    """
+    ParkingEvent.objects.using(using).bulk_create(events)
+    _bump_on_commit(events, using)
+
+# ================================
+# PROJECTIONS
+# ================================
+
+def _hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+class _ProjectionBatch:
+    """
+    Accumulates the effect of a run of events so each projection table is
+    written once per batch
+    """
+
+    def __init__(self):
+        self.occupancy = defaultdict(int)
+        self.hourly = defaultdict(lambda: [0, 0, Decimal('0')])
+        self.opened = {}
+        self.closed = set()
+
+    def apply(self, event):
+        key = (event.lot, event.vehicle_class)
+        token_key = key + (event.token_id,)
+        if event.kind == ParkingEvent.ENTRY:
+            self.occupancy[key] += 1
+            self.hourly[key + (_hour(event.occurred_at),)][0] += 1
+            self.opened[token_key] = OpenSession(
+                lot=event.lot,
+                vehicle_class=event.vehicle_class,
+                token_id=event.token_id,
+                vehicle_no=event.vehicle_no,
+                entry_time=event.occurred_at,
+            )
+        elif event.kind == ParkingEvent.EXIT:
+            self.occupancy[key] -= 1
+            bucket = self.hourly[key + (_hour(event.occurred_at),)]
+            bucket[1] += 1
+            bucket[2] += event.amount or 0
+            if self.opened.pop(token_key, None) is None:
+                self.closed.add(token_key)
+        elif event.kind == ParkingEvent.CORRECTION:
+            exit_time = datetime.fromisoformat(event.data['exit_time'])
+            delta = (event.amount or 0) - Decimal(event.data.get('previous_amount') or 0)
+            self.hourly[key + (_hour(exit_time),)][2] += delta
+        elif event.kind == ParkingEvent.VOID:
+            self.hourly[key + (_hour(datetime.fromisoformat(event.data['entry_time'])),)][0] -= 1
+            if event.data.get('exit_time'):
+                bucket = self.hourly[key + (_hour(datetime.fromisoformat(event.data['exit_time'])),)]
+                bucket[1] -= 1
+                bucket[2] -= event.amount or 0
+            else:
+                self.occupancy[key] -= 1
+                if self.opened.pop(token_key, None) is None:
+                    self.closed.add(token_key)
+
+    def write(self, using):
+        for (lot, vehicle_class), delta in self.occupancy.items():
+            if delta and not OccupancyProjection.objects.using(using).filter(
+                lot=lot, vehicle_class=vehicle_class
+            ).update(parked=F('parked') + delta):
+                OccupancyProjection.objects.using(using).create(
+                    lot=lot, vehicle_class=vehicle_class, parked=delta
+                )
+
+        if self.hourly:
+            lots = {key[0] for key in self.hourly}
+            hours = {key[2] for key in self.hourly}
+            existing = {
+                (row.lot, row.vehicle_class, row.hour): row
+                for row in HourlyRollup.objects.using(using).filter(
+                    lot__in=lots, hour__gte=min(hours), hour__lte=max(hours)
+                )
+            }
+            changed, created = [], []
+            for key, (entries, exits, revenue) in self.hourly.items():
+                row = existing.get(key)
+                if row is None:
+                    created.append(HourlyRollup(
+                        lot=key[0], vehicle_class=key[1], hour=key[2],
+                        entries=entries, exits=exits, revenue=revenue,
+                    ))
+                else:
+                    row.entries += entries
+                    row.exits += exits
+                    row.revenue += revenue
+                    changed.append(row)
+            HourlyRollup.objects.using(using).bulk_update(changed, ['entries', 'exits', 'revenue'])
+            HourlyRollup.objects.using(using).bulk_create(created)
+
+        closed_by_key = defaultdict(list)
+        for lot, vehicle_class, token_id in self.closed:
+            closed_by_key[(lot, vehicle_class)].append(token_id)
+        for (lot, vehicle_class), tokens in closed_by_key.items():
+            OpenSession.objects.using(using).filter(
+                lot=lot, vehicle_class=vehicle_class, token_id__in=tokens
+            ).delete()
+        OpenSession.objects.using(using).bulk_create(self.opened.values())
+
+def _gap_filter(gaps):
+    condition = Q()
+    for first, last, _ in gaps:
+        condition |= Q(id__range=(first, last))
+    return condition
+
+def _new_gaps(events, last_event_id, seen):
+    """
+    Id ranges missing between the checkpoint and the events just read
+    """
+    gaps = []
+    expected = last_event_id + 1
+    for event in events:
+        if event.id > expected:
+            gaps.append([expected, event.id - 1, seen])
+        expected = event.id + 1
+    return gaps
+
+def _open_gaps(gaps, filled, seen):
+    """
+    Gaps left once the `filled` ids are applied, without those older than
+    GAP_RETENTION
+    """
+    cutoff = seen - GAP_RETENTION.total_seconds()
+    filled = sorted(filled)
+    remaining = []
+    for first, last, first_seen in gaps:
+        if first_seen < cutoff:
+            continue
+        for event_id in filled:
+            if first <= event_id <= last:
+                if event_id > first:
+                    remaining.append([first, event_id - 1, first_seen])
+                first = event_id + 1
+        if first <= last:
+            remaining.append([first, last, first_seen])
+    if len(remaining) > MAX_GAPS:
+        logger.warning("Event consumer dropped %d id gaps over MAX_GAPS", len(remaining) - MAX_GAPS)
+        remaining = sorted(remaining, key=lambda gap: gap[2])[-MAX_GAPS:]
+    return sorted(remaining)
+
+def read_since(using, last_event_id, gaps, limit=None):
+    """
+    Events a reader positioned at (last_event_id, gaps) has not seen: those
+    that filled one of its gaps, and up to `limit` past last_event_id.
+    Returns (filled, events, last_event_id, gaps), the last two being the
+    reader's next position.
+    """
+    seen = time.time()
+    filled = []
+    if gaps:
+        filled = list(ParkingEvent.objects.using(using).filter(_gap_filter(gaps)).order_by('id'))
+    events = ParkingEvent.objects.using(using).filter(id__gt=last_event_id).order_by('id')
+    events = list(events if limit is None else events[:limit])
+    next_gaps = _open_gaps(gaps, [event.id for event in filled], seen)
+    next_gaps += _new_gaps(events, last_event_id, seen)
+    if events:
+        last_event_id = events[-1].id
+    return filled, events, last_event_id, next_gaps
+
+def _lock_checkpoint(using, wait):
+    """
+    The checkpoint row, locked until the transaction ends. None when `wait`
+    is False and another consumer holds it. The row comes with migration
+    0013; a consumer that finds it missing creates it, and one that loses
+    that race locks the winner's row.
+    """
+    checkpoints = ProjectionCheckpoint.objects.using(using).select_for_update(skip_locked=not wait)
+    checkpoint = checkpoints.filter(name=CHECKPOINT_NAME).first()
+    if checkpoint is not None:
+        return checkpoint
+    if not wait and ProjectionCheckpoint.objects.using(using).filter(name=CHECKPOINT_NAME).exists():
+        return None
+    try:
+        with transaction.atomic(using=using):
+            return ProjectionCheckpoint.objects.using(using).create(name=CHECKPOINT_NAME)
+    except IntegrityError:
+        return checkpoints.filter(name=CHECKPOINT_NAME).first()
+
+def apply_pending(using='default', batch_size=5000, limit=None, wait=True):
+    """
+    Fold events recorded since the checkpoint, and events that filled a
+    remembered id gap, into the projections. Stops after about `limit`
+    events when one is given; with wait=False returns at once when another
+    consumer holds the checkpoint. Returns the number of events applied.
+    """
+    applied = 0
+    while limit is None or applied < limit:
+        with transaction.atomic(using=using):
+            checkpoint = _lock_checkpoint(using, wait)
+            if checkpoint is None:
+                return applied
+            size = batch_size if limit is None else min(batch_size, limit - applied)
+            filled, events, last_event_id, gaps = read_since(
+                using, checkpoint.last_event_id, checkpoint.gaps, size
+            )
+            if not filled and not events:
+                if gaps != checkpoint.gaps:
+                    checkpoint.gaps = gaps
+                    checkpoint.save(update_fields=['gaps'])
+                return applied
+            batch = _ProjectionBatch()
+            for event in filled + events:
+                batch.apply(event)
+            batch.write(using)
+            checkpoint.last_event_id = last_event_id
+            checkpoint.gaps = gaps
+            checkpoint.save(update_fields=['last_event_id', 'gaps'])
+        applied += len(filled) + len(events)
+        if len(events) < size:
+            return applied
+    return applied
+
+def catch_up(using):
+    """
+    Fold up to REQUEST_FOLD_LIMIT pending events before a dashboard reads
+    the projections, skipping the fold while another consumer holds the
+    checkpoint. A larger backlog shows up as projections that lag until
+    consume_events catches up.
+    """
+    return apply_pending(using, batch_size=REQUEST_FOLD_LIMIT, limit=REQUEST_FOLD_LIMIT, wait=False)
+
+def rebuild_projections(using='default', batch_size=20000):
+    """
+    Drop the projections and replay the whole event log.
+    Returns (events applied, seconds taken).
+    """
+    started = time.perf_counter()
+    with transaction.atomic(using=using):
+        OpenSession.objects.using(using).all().delete()
+        OccupancyProjection.objects.using(using).all().delete()
+        HourlyRollup.objects.using(using).all().delete()
+        ProjectionCheckpoint.objects.using(using).filter(name=CHECKPOINT_NAME).update(last_event_id=0, gaps=[])
+        applied = apply_pending(using, batch_size=batch_size)
+    return applied, time.perf_counter() - started
+
+def backfill_events(using='default', chunk_size=5000):
+    """
+    Seed an empty event log from existing session rows, so projections can
+    be built for data recorded before the log existed
+    """
+    if ParkingEvent.objects.using(using).exists():
+        raise ValueError(f"Event log in '{using}' is not empty")
+    created = 0
+    for vehicle_class, model in (('TW', TwoWheelerEntry), ('FW', FourWheelerEntry)):
+        events = []
+        for entry in model.objects.using(using).order_by('id').iterator(chunk_size=chunk_size):
+            events.append(entry_event(vehicle_class, entry))
+            if entry.exit_time is not None:
+                events.append(exit_event(vehicle_class, entry))
+            if len(events) >= chunk_size:
+                record_events(events, using)
+                created += len(events)
+                events = []
+        record_events(events, using)
+        created += len(events)
+    return created
+
+# ================================
+# READING PROJECTIONS
+# ================================
+
+def parked_counts(lot, using='default'):
+    """
+    Vehicles currently parked, by vehicle class
+    """
+    counts = {'TW': 0, 'FW': 0}
+    counts.update(
+        OccupancyProjection.objects.using(using).filter(lot=lot).values_list('vehicle_class', 'parked')
+    )
+    return counts
+
+def rollups(lot, start, end=None, using='default'):
+    """
+    Hourly rollup rows for a lot from the hour containing start
+    """
+    queryset = HourlyRollup.objects.using(using).filter(lot=lot, hour__gte=_hour(start))
+    if end is not None:
+        queryset = queryset.filter(hour__lt=end)
+    return queryset
+
+def revenue_since(lot, start, using='default'):
+    return rollups(lot, start, using=using).aggregate(total=Sum('revenue'))['total'] or 0
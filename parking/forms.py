@@ -1,6 +1,9 @@
 from django import forms
-from django.contrib.auth.forms import AuthenticationForm
+from django.contrib.auth.forms import AuthenticationForm, PasswordResetForm
+from django.template import loader
+from .lots import lot_choices
 from .models import TwoWheelerEntry, FourWheelerEntry
+from .outbox import enqueue_email
 
 class LoginForm(AuthenticationForm):
     username = forms.CharField(
@@ -18,6 +21,19 @@ class LoginForm(AuthenticationForm):
         })
     )
 
+class OutboxPasswordResetForm(PasswordResetForm):
+    def send_mail(self, subject_template_name, email_template_name, context,
+                  from_email, to_email, html_email_template_name=None):
+        """
+        Queue the reset email in the outbox instead of sending it inline
+        """
+        subject = ''.join(loader.render_to_string(subject_template_name, context).splitlines())
+        body = loader.render_to_string(email_template_name, context)
+        html_body = ''
+        if html_email_template_name is not None:
+            html_body = loader.render_to_string(html_email_template_name, context)
+        enqueue_email(subject, body, from_email, [to_email], html_body)
+
 class TwoWheelerEntryForm(forms.ModelForm):
     class Meta:
         model = TwoWheelerEntry
@@ -52,4 +68,13 @@ class FourWheelerEntryForm(forms.ModelForm):
                 'placeholder': 'Enter phone number (optional)',
                 'required': False
             }),
-        }
\ No newline at end of file
+        }
+
+class LotSelectForm(forms.Form):
+    lot = forms.ChoiceField(
+        choices=lot_choices,
+        widget=forms.Select(attrs={
+            'class': 'form-control',
+            'onchange': 'this.form.submit()'
+        })
+    )
@@ -0,0 +1,245 @@
+"""
+Gate node mode: entries and exits go to a local journal first and are
+pushed to the central database in batches
+"""
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .events import entry_event, exit_event, record_events
+from .lots import lot_database, lot_entries
+from .models import TwoWheelerEntry, FourWheelerEntry, GateJournalEntry, GateSequence
+from .plates import mark_left, mark_parked, normalize_plate
+from .report_parts import invalidate_report_days_on_commit
+from .routers import JOURNAL_DATABASE
+from .slots import LotFull, allocate_slot, release_slot
+
+logger = logging.getLogger(__name__)
+
+ENTRY_MODELS = {'TW': TwoWheelerEntry, 'FW': FourWheelerEntry}
+TOKEN_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+SEQUENCE_WIDTH = 5
+NODE_ID_LENGTH = 2  # checked at start-up by parking.checks
+
+def gate_node_enabled():
+    """
+    True when this server runs as a gate node
+    """
+    return bool(getattr(settings, 'PARKING_GATE_NODE', {}).get('ENABLED'))
+
+def _base36(value, width):
+    digits = ''
+    while value:
+        value, remainder = divmod(value, 36)
+        digits = TOKEN_ALPHABET[remainder] + digits
+    if len(digits) > width:
+        raise ValueError("Gate node token range exhausted")
+    return digits.rjust(width, '0')
+
+def issue_node_token(vehicle_class):
+    """
+    Issue the next token from this node's reserved range, e.g. TW-01000A7.
+    The '-' never appears in centrally generated tokens.
+    """
+    with transaction.atomic(using=JOURNAL_DATABASE):
+        sequence, _ = GateSequence.objects.get_or_create(vehicle_class=vehicle_class)
+        GateSequence.objects.filter(pk=sequence.pk).update(last_value=F('last_value') + 1)
+        sequence.refresh_from_db(fields=['last_value'])
+    node_id = settings.PARKING_GATE_NODE['NODE_ID']
+    return f"{vehicle_class}-{node_id}{_base36(sequence.last_value, SEQUENCE_WIDTH)}"
+
+def record_entry(vehicle_class, lot, vehicle_no, phone_number=None):
+    """
+    Journal a vehicle entry and return the journal row
+    """
+    return GateJournalEntry.objects.create(
+        kind=GateJournalEntry.ENTRY,
+        lot=lot,
+        vehicle_class=vehicle_class,
+        token_id=issue_node_token(vehicle_class),
+        vehicle_no=vehicle_no,
+        phone_number=phone_number,
+        entry_time=timezone.now(),
+    )
+
+def find_open_session(vehicle_class, lot, token_id):
+    """
+    Find the open session for a token: the local journal first, then the
+    central database for tokens issued elsewhere. Returns None when the token
+    is unknown, already exited here, or the central database is unreachable.
+    """
+    journal = {row.kind: row for row in GateJournalEntry.objects.filter(lot=lot, token_id=token_id)}
+    if GateJournalEntry.EXIT in journal:
+        return None
+    if GateJournalEntry.ENTRY in journal:
+        return journal[GateJournalEntry.ENTRY]
+    try:
+        return lot_entries(ENTRY_MODELS[vehicle_class], lot).filter(
+            token_id=token_id, exit_time__isnull=True
+        ).first()
+    except DatabaseError:
+        logger.warning("Central database unreachable while looking up %s", token_id)
+        return None
+
+def record_exit(vehicle_class, session, exit_time, amount):
+    """
+    Journal a vehicle exit for an open session found by find_open_session
+    """
+    issued_here = isinstance(session, GateJournalEntry)
+    return GateJournalEntry.objects.create(
+        kind=GateJournalEntry.EXIT,
+        lot=session.lot,
+        vehicle_class=vehicle_class,
+        token_id=session.token_id,
+        vehicle_no=session.vehicle_no,
+        phone_number=session.phone_number,
+        entry_time=session.entry_time,
+        exit_time=exit_time,
+        amount=amount,
+        note='' if issued_here else 'issued elsewhere',
+    )
+
+def find_exit(lot, token_id):
+    """
+    Return the journalled exit for a token, if any
+    """
+    return GateJournalEntry.objects.filter(lot=lot, token_id=token_id, kind=GateJournalEntry.EXIT).first()
+
+# ================================
+# SYNC TO CENTRAL DATABASE
+# ================================
+
+def _group(events, key):
+    grouped = defaultdict(list)
+    for event in events:
+        grouped[key(event)].append(event)
+    return grouped
+
+def _apply_entries(events, outcomes):
+    for (vehicle_class, lot), group in _group(events, lambda e: (e.vehicle_class, e.lot)).items():
+        model = ENTRY_MODELS[vehicle_class]
+        existing = {
+            row.token_id: row
+            for row in lot_entries(model, lot).filter(token_id__in=[event.token_id for event in group])
+        }
+        parked = dict(
+            lot_entries(model, lot).filter(
+                open_plate__in={normalize_plate(event.vehicle_no) for event in group}
+            ).values_list('open_plate', 'token_id')
+        )
+        new_rows = []
+        for event in group:
+            row = existing.get(event.token_id)
+            if row is None:
+                try:
+                    slot = allocate_slot(lot, vehicle_class, event.token_id)
+                except LotFull:
+                    # The node admitted it while the central lot was full
+                    outcomes[event.pk] = (GateJournalEntry.CONFLICT, 'no free bay in the lot')
+                    continue
+                # Offline gates cannot refuse a plate that is already parked,
+                # so the duplicate is synced without open_plate and flagged
+                plate = normalize_plate(event.vehicle_no) or None
+                note = ''
+                if plate in parked:
+                    note = f'plate already parked with token {parked[plate]}'
+                    plate = None
+                elif plate:
+                    parked[plate] = event.token_id
+                new_rows.append(model(
+                    lot=lot,
+                    token_id=event.token_id,
+                    vehicle_no=event.vehicle_no,
+                    phone_number=event.phone_number,
+                    entry_time=event.entry_time,
+                    slot=slot,
+                    open_plate=plate,
+                ))
+                outcomes[event.pk] = (GateJournalEntry.SYNCED, note)
+            elif row.entry_time == event.entry_time and row.vehicle_no == event.vehicle_no:
+                outcomes[event.pk] = (GateJournalEntry.SYNCED, 'already applied')
+            else:
+                outcomes[event.pk] = (GateJournalEntry.CONFLICT, f'token already used centrally by {row.vehicle_no}')
+        model.objects.using(lot_database(lot)).bulk_create(new_rows)
+        record_events([entry_event(vehicle_class, row) for row in new_rows], lot_database(lot))
+        for row in new_rows:
+            mark_parked(vehicle_class, row)
+        # Late entries from a gate node may land on days already reported
+        invalidate_report_days_on_commit(lot, [row.entry_time for row in new_rows])
+
+def _apply_exits(events, outcomes):
+    for (vehicle_class, lot), group in _group(events, lambda e: (e.vehicle_class, e.lot)).items():
+        model = ENTRY_MODELS[vehicle_class]
+        rows = {
+            row.token_id: row
+            for row in lot_entries(model, lot).select_for_update().filter(
+                token_id__in=[event.token_id for event in group]
+            )
+        }
+        closed = []
+        for event in group:
+            row = rows.get(event.token_id)
+            if row is None:
+                # Entry issued by another node that has not synced yet
+                outcomes[event.pk] = (GateJournalEntry.PENDING, 'waiting for entry to reach central database')
+            elif row.exit_time is None:
+                release_slot(lot, vehicle_class, row.token_id, row.slot)
+                mark_left(vehicle_class, row, row.open_plate)
+                row.exit_time = event.exit_time
+                row.amount = event.amount
+                row.open_plate = None
+                closed.append(row)
+                outcomes[event.pk] = (GateJournalEntry.SYNCED, event.note)
+            elif row.exit_time == event.exit_time:
+                outcomes[event.pk] = (GateJournalEntry.SYNCED, 'already applied')
+            else:
+                outcomes[event.pk] = (
+                    GateJournalEntry.CONFLICT,
+                    f"already exited centrally at {row.exit_time:%Y-%m-%d %H:%M:%S}",
+                )
+        model.objects.using(lot_database(lot)).bulk_update(closed, ['exit_time', 'amount', 'open_plate'])
+        invalidate_report_days_on_commit(lot, [row.entry_time for row in closed])
+        record_events([exit_event(vehicle_class, row) for row in closed], lot_database(lot))
+
+def _mark(outcomes):
+    grouped = defaultdict(list)
+    for pk, outcome in outcomes.items():
+        grouped[outcome].append(pk)
+    now = timezone.now()
+    for (status, note), pks in grouped.items():
+        GateJournalEntry.objects.filter(pk__in=pks).update(
+            status=status,
+            note=note,
+            synced_at=now if status == GateJournalEntry.SYNCED else None,
+        )
+
+def sync_journal(batch_size=500):
+    """
+    Push pending journal rows to the central database, one transaction per
+    batch and lot database. Safe to re-run after a failure: rows that already reached the
+    central database are recognised and marked synced.
+    """
+    totals = defaultdict(int)
+    last_id = 0
+    while True:
+        batch = list(
+            GateJournalEntry.objects.filter(status=GateJournalEntry.PENDING, id__gt=last_id)
+            .order_by('id')[:batch_size]
+        )
+        if not batch:
+            break
+        last_id = batch[-1].id
+        outcomes = {}
+        for database, events in _group(batch, lambda e: lot_database(e.lot)).items():
+            with transaction.atomic(using=database):
+                # Entries first so an exit in the same batch finds its session
+                _apply_entries([e for e in events if e.kind == GateJournalEntry.ENTRY], outcomes)
+                _apply_exits([e for e in events if e.kind == GateJournalEntry.EXIT], outcomes)
+        _mark(outcomes)
+        for status, _ in outcomes.values():
+            totals[status] += 1
+    return dict(totals)
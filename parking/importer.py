@@ -0,0 +1,386 @@
+"""
+Bulk import of historical sessions from legacy CSV or XLSX files.
+
+Files use the columns the Excel reports write: token_id, vehicle_no,
+phone_number, entry_time, exit_time and amount. In a workbook the vehicle
+class comes from the sheet name ('Two Wheelers', 'Four Wheelers'), as in
+the reports. A CSV file needs a `class` column (TW/FW), or one class for
+the whole file. Naive times are read in the current time zone, as the
+reports write them.
+
+Files are parsed as a stream and loaded in batches. Each batch is one
+transaction: the sessions, their events, and the file's ImportRun
+position. A failed run therefore resumes after the last committed batch.
+Rows without an exit time are rejected unless open sessions are allowed:
+an open legacy row becomes a live session that holds its plate and
+counts towards occupancy until someone closes it.
+A legacy token is kept unless it is blank or already used in the lot.
+Such rows get fresh tokens, reserved for the whole batch at once.
+"""
+import csv
+import hashlib
+import random
+import string
+from decimal import Decimal, InvalidOperation
+from datetime import datetime
+from pathlib import Path
+
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .events import entry_event, exit_event, record_events
+from .lots import lot_database, lot_entries
+from .models import TwoWheelerEntry, FourWheelerEntry, ImportRun
+from .plates import normalize_plate
+from .report_parts import ROW_FIELDS, invalidate_report_days_on_commit
+
+SESSION_MODELS = {'TW': TwoWheelerEntry, 'FW': FourWheelerEntry}
+SHEET_CLASSES = {'Two Wheelers': 'TW', 'Four Wheelers': 'FW'}
+
+
+class RowError(ValueError):
+    pass
+
+# ================================
+# READING
+# ================================
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_csv(path, vehicle_class=None):
+    """
+    (line, vehicle class, {column: value}) for each data row
+    """
+    with open(path, newline='', encoding='utf-8-sig') as handle:
+        reader = csv.DictReader(handle)
+        for record in reader:
+            yield reader.line_num, record.get('class') or vehicle_class, record
+
+def read_xlsx(path):
+    """
+    ('sheet!row', vehicle class, {column: value}) for each data row of the
+    vehicle sheets, read in openpyxl's streaming mode
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sheet_name, vehicle_class in SHEET_CLASSES.items():
+            if sheet_name not in workbook.sheetnames:
+                continue
+            rows = workbook[sheet_name].iter_rows(values_only=True)
+            header = [str(name).strip() if name is not None else '' for name in next(rows, [])]
+            for number, values in enumerate(rows, start=2):
+                if not any(value not in (None, '') for value in values):
+                    continue
+                yield f'{sheet_name}!{number}', vehicle_class, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+def read_rows(path, vehicle_class=None):
+    if Path(path).suffix.lower() in ('.xlsx', '.xlsm'):
+        return read_xlsx(path)
+    return read_csv(path, vehicle_class)
+
+# ================================
+# VALIDATION
+# ================================
+
+def _text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+def _time(value, name):
+    if value in (None, ''):
+        return None
+    if not isinstance(value, datetime):
+        try:
+            value = parse_datetime(_text(value))
+        except ValueError:
+            value = None
+        if value is None:
+            raise RowError(f"{name} is not a date and time")
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+def clean_row(vehicle_class, record):
+    """
+    Validated field values of one input row. Raises RowError.
+    """
+    if vehicle_class not in SESSION_MODELS:
+        raise RowError(f"unknown vehicle class {vehicle_class!r}")
+    token_id = _text(record.get('token_id'))
+    vehicle_no = _text(record.get('vehicle_no'))
+    phone_number = _text(record.get('phone_number')) or None
+    if not vehicle_no:
+        raise RowError("vehicle_no is missing")
+    if len(vehicle_no) > 20 or len(token_id) > 10 or len(phone_number or '') > 15:
+        raise RowError("value too long")
+
+    entry_time = _time(record.get('entry_time'), 'entry_time')
+    if entry_time is None:
+        raise RowError("entry_time is missing")
+    exit_time = _time(record.get('exit_time'), 'exit_time')
+    if exit_time is not None and exit_time < entry_time:
+        raise RowError("exit_time is before entry_time")
+
+    amount = _text(record.get('amount'))
+    if amount:
+        try:
+            amount = Decimal(amount)
+        except InvalidOperation:
+            raise RowError("amount is not a number")
+        if not amount.is_finite():
+            raise RowError("amount is not a number")
+        amount = amount.quantize(Decimal('0.01'))
+        if amount < 0 or amount >= 10 ** 8:
+            raise RowError("amount out of range")
+    return {
+        'vehicle_class': vehicle_class,
+        'token_id': token_id,
+        'vehicle_no': vehicle_no,
+        'phone_number': phone_number,
+        'entry_time': entry_time,
+        'exit_time': exit_time,
+        'amount': amount if amount != '' else None,
+    }
+
+# ================================
+# TOKENS
+# ================================
+
+def _used_tokens(lot, tokens):
+    used = set()
+    for model in SESSION_MODELS.values():
+        used.update(lot_entries(model, lot).filter(token_id__in=tokens).values_list('token_id', flat=True))
+    return used
+
+def reserve_tokens(lot, vehicle_class, count, taken):
+    """
+    `count` unused token ids in the same format as the gates issue. Each
+    round checks all candidates with one query per class, instead of two
+    queries per token. Reserved tokens are added to `taken`.
+    """
+    tokens = []
+    while len(tokens) < count:
+        candidates = {
+            vehicle_class + ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+            for _ in range(count - len(tokens))
+        } - taken
+        fresh = candidates - _used_tokens(lot, candidates)
+        taken.update(fresh)
+        tokens.extend(fresh)
+    return tokens
+
+# ================================
+# SECONDARY INDEXES
+# ================================
+
+def _existing_indexes(connection, model):
+    with connection.cursor() as cursor:
+        return set(connection.introspection.get_constraints(cursor, model._meta.db_table))
+
+def _editor(lot):
+    """
+    Schema editor for single DDL statements. It is not entered as a
+    context manager, which SQLite refuses inside a transaction.
+    """
+    editor = connections[lot_database(lot)].schema_editor()
+    editor.deferred_sql = []
+    return editor
+
+def drop_secondary_indexes(lot):
+    """
+    Drop the non-unique session indexes of the lot's database. Unique
+    constraints stay, since they guard the data. Returns the names dropped.
+    """
+    editor = _editor(lot)
+    dropped = []
+    for model in SESSION_MODELS.values():
+        existing = _existing_indexes(editor.connection, model)
+        for index in model._meta.indexes:
+            if index.name in existing:
+                editor.remove_index(model, index)
+                dropped.append(index.name)
+    return dropped
+
+def restore_secondary_indexes(lot):
+    """
+    Create any declared session index missing from the lot's database
+    """
+    editor = _editor(lot)
+    created = []
+    for model in SESSION_MODELS.values():
+        existing = _existing_indexes(editor.connection, model)
+        for index in model._meta.indexes:
+            if index.name not in existing:
+                editor.add_index(model, index)
+                created.append(index.name)
+    return created
+
+# ================================
+# LOADING
+# ================================
+
+class SessionImporter:
+    """
+    Loads one file into a lot in batches, recording progress in its
+    ImportRun
+    """
+
+    def __init__(self, lot, path, vehicle_class=None, batch_size=5000, new_tokens=False, rejects=None,
+                 allow_open=False):
+        self.lot = lot
+        self.path = Path(path)
+        self.vehicle_class = vehicle_class
+        self.batch_size = batch_size
+        self.new_tokens = new_tokens
+        self.allow_open = allow_open
+        self.using = lot_database(lot)
+        self.rejects_path = Path(rejects) if rejects else self.path.with_name(self.path.name + '.rejects.csv')
+        self.run, _ = ImportRun.objects.using(self.using).get_or_create(
+            lot=lot, digest=file_digest(self.path), defaults={'source': self.path.name},
+        )
+        self.open_plate_clashes = 0
+        self.open_rejected = 0
+        self.earliest_exit = None
+
+    def batches(self):
+        """
+        Lists of (position, where, vehicle class, record) after the run's
+        position
+        """
+        batch = []
+        for position, (where, vehicle_class, record) in enumerate(read_rows(self.path, self.vehicle_class), start=1):
+            if position <= self.run.position:
+                continue
+            batch.append((position, where, vehicle_class, record))
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def load(self, batch):
+        """
+        Validate and insert one batch in a single transaction. Returns the
+        rejected rows as (where, vehicle class, reason, record).
+        """
+        rows, rejects = [], []
+        for _, where, vehicle_class, record in batch:
+            try:
+                row = clean_row(vehicle_class, record)
+                if row['exit_time'] is None and not self.allow_open:
+                    self.open_rejected += 1
+                    raise RowError("session is still open")
+                rows.append(row)
+            except RowError as exc:
+                rejects.append((where, vehicle_class, str(exc), record))
+
+        with transaction.atomic(using=self.using):
+            retokened = self._assign_tokens(rows)
+            sessions = self._build_sessions(rows)
+            events = []
+            for vehicle_class, objects in sessions.items():
+                SESSION_MODELS[vehicle_class].objects.using(self.using).bulk_create(objects)
+                for session in objects:
+                    events.append(entry_event(vehicle_class, session))
+                    if session.exit_time is not None:
+                        events.append(exit_event(vehicle_class, session))
+            record_events(events, self.using)
+            invalidate_report_days_on_commit(self.lot, {row['entry_time'] for row in rows})
+            exits = [row['exit_time'] for row in rows if row['exit_time'] is not None]
+            if exits:
+                self.earliest_exit = min(exits + [self.earliest_exit or exits[0]])
+
+            self.run.position = batch[-1][0]
+            self.run.imported += len(rows)
+            self.run.rejected += len(rejects)
+            self.run.retokened += retokened
+            self.run.updated_at = timezone.now()
+            self.run.save(using=self.using)
+        return rejects
+
+    def _assign_tokens(self, rows):
+        """
+        Keep unused legacy tokens; reserve fresh ones for the rest
+        """
+        keep = set()
+        if not self.new_tokens:
+            wanted = {row['token_id'] for row in rows if row['token_id']}
+            keep = wanted - _used_tokens(self.lot, wanted)
+        needs_token, taken = [], set()
+        for row in rows:
+            if row['token_id'] in keep and row['token_id'] not in taken:
+                taken.add(row['token_id'])
+            else:
+                # Blank, used in the lot, or repeated in the file
+                needs_token.append(row)
+        for vehicle_class in SESSION_MODELS:
+            group = [row for row in needs_token if row['vehicle_class'] == vehicle_class]
+            for row, token_id in zip(group, reserve_tokens(self.lot, vehicle_class, len(group), taken)):
+                row['token_id'] = token_id
+        return len(needs_token)
+
+    def _build_sessions(self, rows):
+        """
+        Model instances per class. Open sessions carry their plate unless
+        the plate is already parked; historical sessions get no bay.
+        """
+        sessions = {vehicle_class: [] for vehicle_class in SESSION_MODELS}
+        for vehicle_class, model in SESSION_MODELS.items():
+            group = [row for row in rows if row['vehicle_class'] == vehicle_class]
+            open_plates = {normalize_plate(row['vehicle_no']) for row in group if row['exit_time'] is None}
+            parked = set(
+                lot_entries(model, self.lot).filter(open_plate__in=open_plates - {''})
+                .values_list('open_plate', flat=True)
+            ) if open_plates else set()
+            for row in group:
+                plate = None
+                if row['exit_time'] is None:
+                    plate = normalize_plate(row['vehicle_no']) or None
+                    if plate in parked:
+                        self.open_plate_clashes += 1
+                        plate = None
+                    elif plate:
+                        parked.add(plate)
+                sessions[vehicle_class].append(model(
+                    lot=self.lot,
+                    token_id=row['token_id'],
+                    vehicle_no=row['vehicle_no'],
+                    phone_number=row['phone_number'],
+                    entry_time=row['entry_time'],
+                    exit_time=row['exit_time'],
+                    amount=row['amount'],
+                    open_plate=plate,
+                ))
+        return sessions
+
+    def write_rejects(self, rejects):
+        """
+        Append rejected rows, with where they came from and why, to the
+        rejects file
+        """
+        if not rejects:
+            return
+        is_new = not self.rejects_path.exists()
+        with open(self.rejects_path, 'a', newline='', encoding='utf-8') as handle:
+            writer = csv.writer(handle)
+            if is_new:
+                writer.writerow(['where', 'reason', 'class', *ROW_FIELDS])
+            for where, vehicle_class, reason, record in rejects:
+                writer.writerow([where, reason, vehicle_class or '', *(_text(record.get(name)) for name in ROW_FIELDS)])
+
+    def finish(self):
+        self.run.finished_at = timezone.now()
+        self.run.save(using=self.using, update_fields=['finished_at'])
@@ -0,0 +1,218 @@
+"""
+Traffic replay against a running server: simulated gates doing
+entry -> dwell -> exit lookup -> exit, plus staff opening dashboards and
+reports. Timings are grouped by URL name (resolved against parking.urls)
+so results line up with the routes and can be compared between versions.
+Vehicle numbers carry a per-run nonce, so vehicles still parked from an
+earlier run never turn entries into "already parked" refusals.
+"""
+import http.cookiejar
+import json
+import random
+import re
+import secrets
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+from django.urls import Resolver404, resolve
+
+VEHICLE_PATHS = {
+    'TW': ('/two-wheeler-entry/', '/two-wheeler-exit/{token}/'),
+    'FW': ('/four-wheeler-entry/', '/four-wheeler-exit/{token}/'),
+}
+TOKEN_IN_LOCATION = re.compile(r'/entry-success/([^/]+)/')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class LoadTestResults:
+    """
+    Latencies and status codes per URL name, shared by all workers
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, url_name, seconds, status, expected=None):
+        """
+        Count a response; it is an error when it fails or, given an
+        expected status, has any other one
+        """
+        with self.lock:
+            self.latencies[url_name].append(seconds)
+            self.statuses[url_name][status] += 1
+            if status >= 400 or (expected is not None and status != expected):
+                self.errors[url_name] += 1
+
+    def summary(self, elapsed):
+        rows = []
+        for url_name in sorted(self.latencies):
+            values = sorted(self.latencies[url_name])
+            count = len(values)
+
+            def percentile(p):
+                return round(values[min(count - 1, int(count * p))] * 1000, 1)
+
+            rows.append({
+                'url_name': url_name,
+                'requests': count,
+                'errors': self.errors[url_name],
+                'statuses': dict(self.statuses[url_name]),
+                'rps': round(count / elapsed, 2) if elapsed else 0,
+                'p50_ms': percentile(0.50),
+                'p90_ms': percentile(0.90),
+                'p99_ms': percentile(0.99),
+                'max_ms': round(values[-1] * 1000, 1),
+            })
+        return rows
+
+
+class Session:
+    """
+    One simulated client holding a copy of the recorded login cookies
+    """
+
+    def __init__(self, base_url, cookies, results):
+        self.base_url = base_url.rstrip('/')
+        self.results = results
+        self.jar = http.cookiejar.CookieJar()
+        for cookie in cookies:
+            self.jar.set_cookie(cookie)
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.jar), _NoRedirect()
+        )
+
+    @property
+    def csrf_token(self):
+        for cookie in self.jar:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def request(self, path, data=None, headers=None, expected=None):
+        """
+        Send one request, record it under its URL name and return
+        (status, headers, body). Redirects are not followed.
+        """
+        if data is not None:
+            data = urllib.parse.urlencode({**data, 'csrfmiddlewaretoken': self.csrf_token}).encode()
+        request = urllib.request.Request(self.base_url + path, data=data, headers={
+            'Referer': self.base_url + '/',
+            **(headers or {}),
+        })
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                status, response_headers, body = response.status, response.headers, response.read()
+        except urllib.error.HTTPError as exc:
+            status, response_headers, body = exc.code, exc.headers, exc.read()
+        except OSError:
+            status, response_headers, body = 599, {}, b''
+        self.results.record(_url_name(path), time.perf_counter() - started, status, expected)
+        return status, response_headers, body
+
+
+def _url_name(path):
+    try:
+        return resolve(urllib.parse.urlsplit(path).path).url_name or path
+    except Resolver404:
+        return path
+
+
+def login(base_url, username, password, lot=None):
+    """
+    Log in once and return the cookies every worker starts from
+    """
+    results = LoadTestResults()
+    session = Session(base_url, [], results)
+    session.request('/login/')
+    status, headers, _ = session.request('/login/', {'username': username, 'password': password})
+    if status != 302 or not any(cookie.name == 'sessionid' for cookie in session.jar):
+        raise RuntimeError(f"Login as {username} failed (HTTP {status})")
+    if lot:
+        session.request('/lot/', {'lot': lot})
+    return list(session.jar)
+
+
+def _gate_worker(index, scenario, base_url, cookies, results, deadline, nonce):
+    config = scenario['gates']
+    rng = random.Random(f"{scenario['seed']}-gate-{index}")
+    session = Session(base_url, cookies, results)
+    classes = list(config['vehicle_mix'])
+    weights = [config['vehicle_mix'][name] for name in classes]
+    cycle = 0
+    while time.monotonic() < deadline:
+        cycle += 1
+        vehicle_class = rng.choices(classes, weights)[0]
+        entry_path, exit_path = VEHICLE_PATHS[vehicle_class]
+        vehicle_no = f"LT{nonce}{index:02d}{vehicle_class}{cycle:05d}"
+
+        # A refused entry re-renders the form with 200
+        status, headers, _ = session.request(
+            entry_path, {'vehicle_no': vehicle_no, 'phone_number': ''}, expected=302
+        )
+        match = TOKEN_IN_LOCATION.search(headers.get('Location', '') if status == 302 else '')
+        if not match:
+            time.sleep(rng.uniform(*config['think_seconds']))
+            continue
+        token = match.group(1)
+        session.request(headers['Location'])
+
+        time.sleep(rng.uniform(*config['dwell_seconds']))
+
+        path = exit_path.format(token=token)
+        session.request(path, headers={'X-Requested-With': 'XMLHttpRequest'})
+        status, headers, _ = session.request(path, {}, expected=302)
+        if status == 302:
+            session.request(headers['Location'])
+        time.sleep(rng.uniform(*config['think_seconds']))
+
+
+def _staff_worker(index, scenario, base_url, cookies, results, deadline):
+    config = scenario['staff']
+    rng = random.Random(f"{scenario['seed']}-staff-{index}")
+    session = Session(base_url, cookies, results)
+    paths = [page['path'] for page in config['pages']]
+    weights = [page['weight'] for page in config['pages']]
+    while time.monotonic() < deadline:
+        session.request(rng.choices(paths, weights)[0])
+        time.sleep(rng.uniform(*config['think_seconds']))
+
+
+def load_scenario(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def run_scenario(scenario, base_url, cookies):
+    """
+    Run all gate and staff workers until the scenario's duration is up.
+    Returns (summary rows, elapsed seconds).
+    """
+    results = LoadTestResults()
+    nonce = secrets.token_hex(2).upper()
+    deadline = time.monotonic() + scenario['duration_seconds']
+    workers = [
+        threading.Thread(target=_gate_worker, args=(i, scenario, base_url, cookies, results, deadline, nonce))
+        for i in range(scenario['gates']['count'])
+    ] + [
+        threading.Thread(target=_staff_worker, args=(i, scenario, base_url, cookies, results, deadline))
+        for i in range(scenario.get('staff', {}).get('count', 0))
+    ]
+    started = time.monotonic()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.monotonic() - started
+    return results.summary(elapsed), elapsed
@@ -0,0 +1,41 @@
+"""
+Parking lot scoping: every session belongs to a lot, and each lot's
+sessions can live in their own database alias
+"""
+from django.conf import settings
+
+SESSION_KEY = 'parking_lot'
+
+def default_lot():
+    """
+    Lot code used when none is selected (also the model field default)
+    """
+    return getattr(settings, 'PARKING_DEFAULT_LOT', 'main')
+
+def lot_choices():
+    """
+    (code, name) pairs for every configured lot
+    """
+    return [(code, lot.get('name', code)) for code, lot in settings.PARKING_LOTS.items()]
+
+def lot_database(lot):
+    """
+    Database alias holding a lot's sessions
+    """
+    return settings.PARKING_LOTS.get(lot, {}).get('database', 'default')
+
+def current_lot(request):
+    """
+    Lot selected for this terminal, falling back to the default lot
+    """
+    lot = request.session.get(SESSION_KEY)
+    if lot in settings.PARKING_LOTS:
+        return lot
+    return default_lot()
+
+def lot_entries(model, lot):
+    """
+    Queryset of a lot's sessions, routed to the lot's database. Filtering on
+    lot first keeps every query on the lot-leading indexes.
+    """
+    return model.objects.using(lot_database(lot)).filter(lot=lot)
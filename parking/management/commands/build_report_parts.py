@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from parking.report_parts import day_parts
+
+
+class Command(BaseCommand):
+    help = "Materialize the per-day report parts of recently closed days"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lot', action='append', help="Lot code (repeatable); defaults to all lots")
+        parser.add_argument('--days', type=int, default=31, help="How many days back to cover")
+
+    def handle(self, *args, **options):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        for lot in options['lot'] or settings.PARKING_LOTS:
+            parts, built = day_parts(lot, yesterday - timedelta(days=options['days'] - 1), yesterday)
+            stored = sum(part['closed'] for part in parts)
+            self.stdout.write(f"{lot}: built {built} parts, {stored} of {len(parts)} days closed")
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from parking.snapshot import build_snapshot
+
+
+class Command(BaseCommand):
+    help = "Append closed sessions to the columnar analytics snapshot of each lot"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lot', action='append', help="Lot code (repeatable); defaults to all lots")
+        parser.add_argument('--rebuild', action='store_true', help="Discard the snapshot and build it again")
+
+    def handle(self, *args, **options):
+        for lot in options['lot'] or settings.PARKING_LOTS:
+            appended = build_snapshot(lot, rebuild=options['rebuild'])
+            self.stdout.write(f"{lot}: appended {appended} sessions")
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from parking.events import apply_pending
+
+
+class Command(BaseCommand):
+    help = "Fold new parking events into the open-session, occupancy and hourly projections"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help="Keep consuming every INTERVAL seconds instead of running once",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            applied = apply_pending(options['database'], batch_size=options['batch_size'])
+            if applied:
+                self.stdout.write(f"applied {applied} events")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,100 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from parking.importer import (
+    SESSION_MODELS, SessionImporter, drop_secondary_indexes, restore_secondary_indexes,
+)
+from parking.lots import default_lot
+from parking.plates import rebuild_parked_plates
+from parking.snapshot import load_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Import historical sessions from a legacy CSV or XLSX file in the report "
+        "layout. Rerunning the same file resumes after the last committed batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--lot', default=None, help="Lot code; defaults to the default lot")
+        parser.add_argument('--class', dest='vehicle_class', choices=list(SESSION_MODELS),
+                            help="Vehicle class of a CSV file without a class column")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per transaction")
+        parser.add_argument('--new-tokens', action='store_true', help="Issue fresh tokens for every row")
+        parser.add_argument(
+            '--allow-open', action='store_true',
+            help="Import rows without an exit time as open sessions. They hold their "
+                 "plate and count as parked until they are closed.",
+        )
+        parser.add_argument('--rejects', help="CSV file for rejected rows (default: <path>.rejects.csv)")
+        parser.add_argument(
+            '--drop-indexes', action='store_true',
+            help="Drop the secondary session indexes while loading and recreate them "
+                 "afterwards. Queries on the lot are slow meanwhile.",
+        )
+
+    def handle(self, *args, **options):
+        lot = options['lot'] or default_lot()
+        if lot not in settings.PARKING_LOTS:
+            raise CommandError(f"Unknown lot {lot!r}")
+        try:
+            importer = SessionImporter(
+                lot, options['path'],
+                vehicle_class=options['vehicle_class'],
+                batch_size=options['batch_size'],
+                new_tokens=options['new_tokens'],
+                rejects=options['rejects'],
+                allow_open=options['allow_open'],
+            )
+        except FileNotFoundError as exc:
+            raise CommandError(exc)
+        run = importer.run
+        if run.finished_at:
+            self.stdout.write(f"{run.source} was already imported into {lot} on {run.finished_at:%Y-%m-%d %H:%M}")
+            return
+        if run.position:
+            self.stdout.write(f"Resuming {run.source} after row {run.position}")
+
+        if options['drop_indexes']:
+            dropped = drop_secondary_indexes(lot)
+            self.stdout.write(f"Dropped indexes: {', '.join(dropped) or 'none'}")
+        started = time.monotonic()
+        loaded = 0
+        try:
+            for batch in importer.batches():
+                rejects = importer.load(batch)
+                importer.write_rejects(rejects)
+                loaded += len(batch)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"row {run.position}: imported={run.imported} rejected={run.rejected} "
+                    f"({loaded / max(elapsed, 1e-9):,.0f} rows/s)"
+                )
+        finally:
+            # Never leave the live lot without its indexes, even on failure
+            created = restore_secondary_indexes(lot)
+            if created:
+                self.stdout.write(f"Recreated indexes: {', '.join(created)}")
+        importer.finish()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {run.imported} sessions into {lot}, rejected {run.rejected}, "
+            f"new tokens for {run.retokened}, in {elapsed:.1f}s ({loaded / max(elapsed, 1e-9):,.0f} rows/s)"
+        ))
+        if run.rejected:
+            self.stdout.write(f"Rejected rows: {importer.rejects_path}")
+        if importer.open_rejected:
+            self.stdout.write(f"{importer.open_rejected} rows have no exit time and were rejected; import "
+                              f"{importer.rejects_path} with --allow-open to load them as open sessions")
+        if importer.open_plate_clashes:
+            self.stdout.write(f"{importer.open_plate_clashes} open sessions share a plate already parked; "
+                              "they were imported without the parked-plate guard")
+        rebuild_parked_plates(lot)
+        if importer.earliest_exit and importer.earliest_exit < load_snapshot(lot)['watermark']:
+            self.stdout.write("Imported sessions closed before the analytics snapshot watermark; "
+                              f"the next `build_snapshot` reads the snapshot again from {importer.earliest_exit}")
+        self.stdout.write("Run `consume_events` to fold the imported events into the projections")
@@ -0,0 +1,50 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from parking.loadtest import load_scenario, login, run_scenario
+
+DEFAULT_SCENARIO = Path(__file__).resolve().parents[2] / 'scenarios' / 'rush_hour.json'
+
+
+class Command(BaseCommand):
+    help = "Simulate gates and staff against a running server and report latency per URL name"
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', nargs='?', default=str(DEFAULT_SCENARIO), help="Scenario JSON file")
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--username', required=True)
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--lot', help="Lot the simulated terminals work on")
+        parser.add_argument('--duration', type=float, help="Override the scenario duration (seconds)")
+        parser.add_argument('--output', help="Also write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        scenario = load_scenario(options['scenario'])
+        if options['duration']:
+            scenario['duration_seconds'] = options['duration']
+        try:
+            cookies = login(options['base_url'], options['username'], options['password'], options['lot'])
+        except (RuntimeError, OSError) as exc:
+            raise CommandError(exc)
+
+        self.stdout.write(
+            f"Running '{scenario['name']}': {scenario['gates']['count']} gates, "
+            f"{scenario.get('staff', {}).get('count', 0)} staff, {scenario['duration_seconds']}s"
+        )
+        rows, elapsed = run_scenario(scenario, options['base_url'], cookies)
+
+        header = f"{'url name':<26}{'reqs':>7}{'errs':>6}{'req/s':>8}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}"
+        self.stdout.write(header)
+        for row in rows:
+            self.stdout.write(
+                f"{row['url_name']:<26}{row['requests']:>7}{row['errors']:>6}{row['rps']:>8}"
+                f"{row['p50_ms']:>9}{row['p90_ms']:>9}{row['p99_ms']:>9}{row['max_ms']:>9}"
+            )
+        total = sum(row['requests'] for row in rows)
+        self.stdout.write(f"{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump({'scenario': scenario, 'elapsed': elapsed, 'results': rows}, handle, indent=2)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from parking.events import backfill_events, rebuild_projections
+
+
+class Command(BaseCommand):
+    help = "Drop the parking projections and rebuild them by replaying the event log"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--batch-size', type=int, default=20000)
+        parser.add_argument(
+            '--backfill', action='store_true',
+            help="Seed an empty event log from existing session rows first",
+        )
+
+    def handle(self, *args, **options):
+        database = options['database']
+        if options['backfill']:
+            try:
+                created = backfill_events(database)
+            except ValueError as exc:
+                raise CommandError(exc)
+            self.stdout.write(f"backfilled {created} events")
+
+        applied, seconds = rebuild_projections(database, batch_size=options['batch_size'])
+        rate = applied / seconds if seconds else 0
+        self.stdout.write(f"replayed {applied} events in {seconds:.2f}s ({rate:,.0f} events/s)")
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from parking.outbox import send_pending
+
+
+class Command(BaseCommand):
+    help = "Deliver queued outbox emails in batches over one connection"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help="Keep sending every INTERVAL seconds instead of running once",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            # Drain everything that is due before sleeping
+            while True:
+                sent, failed = send_pending(options['batch_size'])
+                if sent or failed:
+                    self.stdout.write(f"sent={sent} failed={failed}")
+                if not sent:
+                    break
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from parking.gate import sync_journal
+
+
+class Command(BaseCommand):
+    help = "Push pending gate node journal entries and exits to the central database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help="Keep syncing every INTERVAL seconds instead of running once",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            totals = sync_journal(batch_size=options['batch_size'])
+            if totals:
+                self.stdout.write(
+                    f"synced={totals.get('synced', 0)} "
+                    f"conflict={totals.get('conflict', 0)} "
+                    f"pending={totals.get('pending', 0)}"
+                )
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
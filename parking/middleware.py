@@ -0,0 +1,192 @@
+"""
+Middleware for the parking app
+"""
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+
+from .budgets import QUERY_BUDGETS, budget_config, logger as budget_logger, query_budget
+from .profiling import profiling_config, run_profiled, should_profile
+
+ADMISSION_DEFAULTS = {
+    # URL names whose latency is protected
+    'GATE_URLS': [
+        'two_wheeler_entry', 'two_wheeler_exit_search', 'two_wheeler_exit',
+        'four_wheeler_entry', 'four_wheeler_exit_search', 'four_wheeler_exit',
+        'entry_success', 'exit_success',
+    ],
+    # URL names that may be queued or shed
+    'BACKGROUND_URLS': [
+        'reports_analytics', 'daily_report', 'weekly_report', 'monthly_report',
+        'export_excel', 'snapshot_analytics', 'occupancy_timeline', 'occupancy_chart',
+        'session_history',
+    ],
+    'MAX_BACKGROUND': 2,              # concurrent background requests per worker
+    'QUEUE_TIMEOUT': 2.0,             # seconds to wait for a background slot
+    'GATE_LATENCY_THRESHOLD_MS': 500, # shed background work above this gate p99
+    'GATE_WINDOW_SECONDS': 60,        # gate latencies considered for the p99
+    'MIN_GATE_SAMPLES': 50,           # gate requests in the window before the p99 can shed
+    'RETRY_AFTER': 10,
+}
+
+def url_name_for(request):
+    """
+    URL name the request resolves to, or None
+    """
+    try:
+        return resolve(request.path_info).url_name
+    except Resolver404:
+        return None
+
+
+class _ReleaseOnClose:
+    """
+    Streaming content that calls `release` once when the response closes
+    """
+
+    def __init__(self, content, release):
+        self.content = content
+        self.release = release
+        self.released = False
+
+    def __iter__(self):
+        return iter(self.content)
+
+    def close(self):
+        try:
+            if hasattr(self.content, 'close'):
+                self.content.close()
+        finally:
+            if not self.released:
+                self.released = True
+                self.release()
+
+
+class AdmissionControlMiddleware:
+    """
+    Keep report and export traffic from slowing the gates down. Background
+    requests run through a bounded semaphore, and are answered with 503 and
+    Retry-After when no slot frees up in time or the recent gate p99 is
+    above the threshold. A streamed response (the NDJSON session export)
+    keeps its slot until it has been sent.
+
+    Both the semaphore and the p99 are per worker process. MAX_BACKGROUND
+    only limits anything in threaded or async workers; a sync worker runs
+    one request at a time whatever its value, so there the limit is the
+    number of workers. The p99 only sees the gate requests of its own
+    process and needs MIN_GATE_SAMPLES of them before it sheds, so one
+    slow gate request on a quiet worker does not turn reports away.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = {**ADMISSION_DEFAULTS, **getattr(settings, 'PARKING_ADMISSION', {})}
+        self.gate_urls = set(config['GATE_URLS'])
+        self.background_urls = set(config['BACKGROUND_URLS'])
+        self.slots = threading.BoundedSemaphore(config['MAX_BACKGROUND'])
+        self.queue_timeout = config['QUEUE_TIMEOUT']
+        self.threshold = config['GATE_LATENCY_THRESHOLD_MS'] / 1000
+        self.window = config['GATE_WINDOW_SECONDS']
+        self.min_samples = config['MIN_GATE_SAMPLES']
+        self.retry_after = config['RETRY_AFTER']
+        self.gate_latencies = deque(maxlen=1000)
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        url_name = url_name_for(request)
+
+        if url_name in self.gate_urls:
+            started = time.monotonic()
+            response = self.get_response(request)
+            finished = time.monotonic()
+            with self.lock:
+                self.gate_latencies.append((finished, finished - started))
+            return response
+
+        if url_name in self.background_urls:
+            if self.gate_p99() > self.threshold:
+                return self._shed("Gate traffic is busy")
+            if not self.slots.acquire(timeout=self.queue_timeout):
+                return self._shed("Too many reports running")
+            try:
+                response = self.get_response(request)
+            except BaseException:
+                self.slots.release()
+                raise
+            if response.streaming:
+                # A stream does its work after this returns: hold the slot
+                # until the server closes the response
+                response.streaming_content = _ReleaseOnClose(response.streaming_content, self.slots.release)
+            else:
+                self.slots.release()
+            return response
+
+        return self.get_response(request)
+
+    def gate_p99(self):
+        """
+        99th percentile gate latency (seconds) over the recent window, or 0
+        with fewer than MIN_GATE_SAMPLES requests in it
+        """
+        horizon = time.monotonic() - self.window
+        with self.lock:
+            latencies = sorted(latency for at, latency in self.gate_latencies if at >= horizon)
+        if not latencies or len(latencies) < self.min_samples:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+    def _shed(self, reason):
+        response = HttpResponse(
+            f"{reason}, please try again shortly.",
+            status=503,
+            content_type='text/plain',
+        )
+        response['Retry-After'] = str(self.retry_after)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profile the request when a staff user asks for it with the
+    X-Parking-Profile header or ?_profile=1 (see parking.profiling).
+    Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = profiling_config()
+        if not should_profile(request, config):
+            return self.get_response(request)
+        response, profile_id = run_profiled(request, self.get_response, url_name_for(request), config)
+        response['X-Parking-Profile-Id'] = profile_id
+        return response
+
+
+class QueryBudgetMiddleware:
+    """
+    Log a warning when a request goes over its query budget (see
+    parking.budgets). Only installed when PARKING_QUERY_BUDGETS['WARN'] is
+    set, so it costs nothing otherwise.
+    """
+
+    def __init__(self, get_response):
+        if not budget_config()['WARN']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        url_name = url_name_for(request)
+        if url_name not in QUERY_BUDGETS:
+            return self.get_response(request)
+        with query_budget(url_name, enforce=False) as usage:
+            response = self.get_response(request)
+        if usage.overruns():
+            budget_logger.warning("Query budget exceeded: %s", usage.report())
+        return response
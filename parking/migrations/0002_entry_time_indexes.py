@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fourwheelerentry',
+            name='phone_number',
+            field=models.CharField(blank=True, max_length=15, null=True),
+        ),
+        migrations.AddField(
+            model_name='twowheelerentry',
+            name='phone_number',
+            field=models.CharField(blank=True, max_length=15, null=True),
+        ),
+        migrations.AlterField(
+            model_name='fourwheelerentry',
+            name='token_id',
+            field=models.CharField(max_length=10, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='twowheelerentry',
+            name='token_id',
+            field=models.CharField(max_length=10, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='fourwheelerentry',
+            index=models.Index(fields=['entry_time'], name='fw_entry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fourwheelerentry',
+            index=models.Index(fields=['exit_time'], name='fw_exit_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='twowheelerentry',
+            index=models.Index(fields=['entry_time'], name='tw_entry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='twowheelerentry',
+            index=models.Index(fields=['exit_time'], name='tw_exit_idx'),
+        ),
+    ]
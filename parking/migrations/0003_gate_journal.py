@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:58
+
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0002_entry_time_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GateSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vehicle_class', models.CharField(max_length=2, unique=True)),
+                ('last_value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GateJournalEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('kind', models.CharField(choices=[('entry', 'Entry'), ('exit', 'Exit')], max_length=5)),
+                ('vehicle_class', models.CharField(max_length=2)),
+                ('token_id', models.CharField(max_length=10)),
+                ('vehicle_no', models.CharField(blank=True, max_length=20)),
+                ('phone_number', models.CharField(blank=True, max_length=15, null=True)),
+                ('entry_time', models.DateTimeField(blank=True, null=True)),
+                ('exit_time', models.DateTimeField(blank=True, null=True)),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('synced', 'Synced'), ('conflict', 'Conflict')], default='pending', max_length=8)),
+                ('note', models.CharField(blank=True, max_length=255)),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('synced_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='journal_status_idx'), models.Index(fields=['token_id', 'kind'], name='journal_token_idx')],
+            },
+        ),
+    ]
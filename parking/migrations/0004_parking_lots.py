@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:59
+
+import parking.lots
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0003_gate_journal'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='fourwheelerentry',
+            name='fw_entry_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='fourwheelerentry',
+            name='fw_exit_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='gatejournalentry',
+            name='journal_token_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='twowheelerentry',
+            name='tw_entry_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='twowheelerentry',
+            name='tw_exit_idx',
+        ),
+        migrations.AddField(
+            model_name='fourwheelerentry',
+            name='lot',
+            field=models.CharField(default=parking.lots.default_lot, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='gatejournalentry',
+            name='lot',
+            field=models.CharField(default=parking.lots.default_lot, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='twowheelerentry',
+            name='lot',
+            field=models.CharField(default=parking.lots.default_lot, max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='fourwheelerentry',
+            name='token_id',
+            field=models.CharField(max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='twowheelerentry',
+            name='token_id',
+            field=models.CharField(max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='fourwheelerentry',
+            index=models.Index(fields=['lot', 'entry_time'], name='fw_lot_entry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fourwheelerentry',
+            index=models.Index(fields=['lot', 'exit_time'], name='fw_lot_exit_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gatejournalentry',
+            index=models.Index(fields=['lot', 'token_id'], name='journal_lot_token_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='twowheelerentry',
+            index=models.Index(fields=['lot', 'entry_time'], name='tw_lot_entry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='twowheelerentry',
+            index=models.Index(fields=['lot', 'exit_time'], name='tw_lot_exit_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='fourwheelerentry',
+            constraint=models.UniqueConstraint(fields=('lot', 'token_id'), name='fw_lot_token_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='twowheelerentry',
+            constraint=models.UniqueConstraint(fields=('lot', 'token_id'), name='tw_lot_token_uniq'),
+        ),
+    ]
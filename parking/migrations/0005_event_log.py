@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:02
+
+import django.utils.timezone
+import parking.lots
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0004_parking_lots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParkingEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lot', models.CharField(default=parking.lots.default_lot, max_length=20)),
+                ('vehicle_class', models.CharField(max_length=2)),
+                ('kind', models.CharField(choices=[('entry', 'Entry'), ('exit', 'Exit'), ('correction', 'Correction')], max_length=10)),
+                ('token_id', models.CharField(max_length=10)),
+                ('vehicle_no', models.CharField(blank=True, max_length=20)),
+                ('occurred_at', models.DateTimeField()),
+                ('amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('recorded_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProjectionCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_event_id', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lot', models.CharField(max_length=20)),
+                ('vehicle_class', models.CharField(max_length=2)),
+                ('hour', models.DateTimeField()),
+                ('entries', models.IntegerField(default=0)),
+                ('exits', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('lot', 'hour', 'vehicle_class'), name='hourly_rollup_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='OccupancyProjection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lot', models.CharField(max_length=20)),
+                ('vehicle_class', models.CharField(max_length=2)),
+                ('parked', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('lot', 'vehicle_class'), name='occupancy_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='OpenSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lot', models.CharField(max_length=20)),
+                ('vehicle_class', models.CharField(max_length=2)),
+                ('token_id', models.CharField(max_length=10)),
+                ('vehicle_no', models.CharField(blank=True, max_length=20)),
+                ('entry_time', models.DateTimeField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('lot', 'vehicle_class', 'token_id'), name='open_session_uniq')],
+            },
+        ),
+    ]
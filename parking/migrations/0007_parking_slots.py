@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:17
+
+import parking.lots
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0006_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fourwheelerentry',
+            name='slot',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='twowheelerentry',
+            name='slot',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='ParkingSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lot', models.CharField(default=parking.lots.default_lot, max_length=20)),
+                ('vehicle_class', models.CharField(max_length=2)),
+                ('zone', models.CharField(max_length=10)),
+                ('number', models.PositiveIntegerField()),
+                ('token_id', models.CharField(blank=True, max_length=10, null=True)),
+                ('occupied_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('lot', 'vehicle_class', 'zone', 'number'), name='slot_bay_uniq'), models.UniqueConstraint(fields=('lot', 'vehicle_class', 'token_id'), name='slot_token_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:18
+
+import re
+
+from django.db import migrations, models
+
+
+def backfill_open_plates(apps, schema_editor):
+    """
+    Give open sessions their normalized plate. Where a plate is already
+    open more than once, only the latest session gets it so the unique
+    constraint can be created.
+    """
+    db = schema_editor.connection.alias
+    for model_name in ('TwoWheelerEntry', 'FourWheelerEntry'):
+        model = apps.get_model('parking', model_name)
+        seen = set()
+        updates = []
+        open_rows = model.objects.using(db).filter(exit_time__isnull=True).order_by('-id')
+        for row in open_rows.only('id', 'lot', 'vehicle_no').iterator(chunk_size=5000):
+            plate = re.sub(r'[^A-Z0-9]', '', (row.vehicle_no or '').upper())
+            if plate and (row.lot, plate) not in seen:
+                seen.add((row.lot, plate))
+                row.open_plate = plate
+                updates.append(row)
+        model.objects.using(db).bulk_update(updates, ['open_plate'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0007_parking_slots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fourwheelerentry',
+            name='open_plate',
+            field=models.CharField(blank=True, editable=False, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='twowheelerentry',
+            name='open_plate',
+            field=models.CharField(blank=True, editable=False, max_length=20, null=True),
+        ),
+        migrations.RunPython(backfill_open_plates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='fourwheelerentry',
+            constraint=models.UniqueConstraint(fields=('lot', 'open_plate'), name='fw_lot_open_plate_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='twowheelerentry',
+            constraint=models.UniqueConstraint(fields=('lot', 'open_plate'), name='tw_lot_open_plate_uniq'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0010_checkpoint_gaps'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='parkingevent',
+            name='kind',
+            field=models.CharField(choices=[('entry', 'Entry'), ('exit', 'Exit'), ('correction', 'Correction'), ('void', 'Void')], max_length=10),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0011_void_events'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fourwheelerentry',
+            index=models.Index(fields=['lot', 'exit_time', 'entry_time'], name='fw_lot_open_entry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='twowheelerentry',
+            index=models.Index(fields=['lot', 'exit_time', 'entry_time'], name='tw_lot_open_entry_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+def create_checkpoint(apps, schema_editor):
+    """
+    Seed the projection checkpoint, so consumers lock an existing row
+    instead of racing to insert it
+    """
+    ProjectionCheckpoint = apps.get_model('parking', 'ProjectionCheckpoint')
+    ProjectionCheckpoint.objects.using(schema_editor.connection.alias).get_or_create(name='projections')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parking', '0012_open_entry_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_checkpoint, migrations.RunPython.noop),
+    ]
@@ -1,25 +1,303 @@
+import uuid
+
 from django.db import models
 from django.utils import timezone
 
+from .lots import default_lot
+
 class TwoWheelerEntry(models.Model):
-    token_id = models.CharField(max_length=10, unique=True)
+    lot = models.CharField(max_length=20, default=default_lot)
+    token_id = models.CharField(max_length=10)
     vehicle_no = models.CharField(max_length=20)
     phone_number = models.CharField(max_length=15, blank=True, null=True)  # Add this field
     entry_time = models.DateTimeField(default=timezone.now)
     exit_time = models.DateTimeField(null=True, blank=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    slot = models.CharField(max_length=20, blank=True, default='')
+    # Normalized plate while the session is open, NULL after exit
+    open_plate = models.CharField(max_length=20, null=True, blank=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['lot', 'token_id'], name='tw_lot_token_uniq'),
+            models.UniqueConstraint(fields=['lot', 'open_plate'], name='tw_lot_open_plate_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['lot', 'entry_time'], name='tw_lot_entry_idx'),
+            models.Index(fields=['lot', 'exit_time'], name='tw_lot_exit_idx'),
+            # Open sessions in entry order (exit_time IS NULL is one key range)
+            models.Index(fields=['lot', 'exit_time', 'entry_time'], name='tw_lot_open_entry_idx'),
+        ]
 
     def __str__(self):
         return f"{self.token_id} - {self.vehicle_no}"
 
 class FourWheelerEntry(models.Model):
-    token_id = models.CharField(max_length=10, unique=True)
+    lot = models.CharField(max_length=20, default=default_lot)
+    token_id = models.CharField(max_length=10)
     vehicle_no = models.CharField(max_length=20)
     phone_number = models.CharField(max_length=15, blank=True, null=True)  # Add this field
     entry_time = models.DateTimeField(default=timezone.now)
     exit_time = models.DateTimeField(null=True, blank=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    slot = models.CharField(max_length=20, blank=True, default='')
+    # Normalized plate while the session is open, NULL after exit
+    open_plate = models.CharField(max_length=20, null=True, blank=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['lot', 'token_id'], name='fw_lot_token_uniq'),
+            models.UniqueConstraint(fields=['lot', 'open_plate'], name='fw_lot_open_plate_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['lot', 'entry_time'], name='fw_lot_entry_idx'),
+            models.Index(fields=['lot', 'exit_time'], name='fw_lot_exit_idx'),
+            # Open sessions in entry order (exit_time IS NULL is one key range)
+            models.Index(fields=['lot', 'exit_time', 'entry_time'], name='fw_lot_open_entry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.token_id} - {self.vehicle_no}"
+
+
+
+# ================================
+# PARKING SLOTS
+# ================================
+
+class ParkingSlot(models.Model):
+    """
+    One bay; token_id is set while a vehicle occupies it. Assignment is a
+    conditional UPDATE on token_id IS NULL, so two gates can never take
+    the same bay (see parking.slots).
+    """
+    lot = models.CharField(max_length=20, default=default_lot)
+    vehicle_class = models.CharField(max_length=2)
+    zone = models.CharField(max_length=10)
+    number = models.PositiveIntegerField()
+    token_id = models.CharField(max_length=10, null=True, blank=True)
+    occupied_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['lot', 'vehicle_class', 'zone', 'number'], name='slot_bay_uniq'),
+            models.UniqueConstraint(fields=['lot', 'vehicle_class', 'token_id'], name='slot_token_uniq'),
+        ]
+
+    @property
+    def label(self):
+        return f"{self.zone}-{self.number:03d}"
+
+    def __str__(self):
+        return f"{self.lot} {self.vehicle_class} {self.label}"
+
+# ================================
+# GATE NODE JOURNAL (local SQLite)
+# ================================
+
+class GateJournalEntry(models.Model):
+    """
+    Entry or exit recorded on a gate node, waiting to be synced to the
+    central database
+    """
+    ENTRY = 'entry'
+    EXIT = 'exit'
+    KIND_CHOICES = [(ENTRY, 'Entry'), (EXIT, 'Exit')]
+
+    PENDING = 'pending'
+    SYNCED = 'synced'
+    CONFLICT = 'conflict'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (SYNCED, 'Synced'), (CONFLICT, 'Conflict')]
+
+    event_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    kind = models.CharField(max_length=5, choices=KIND_CHOICES)
+    lot = models.CharField(max_length=20, default=default_lot)
+    vehicle_class = models.CharField(max_length=2)  # 'TW' or 'FW', same as the token prefix
+    token_id = models.CharField(max_length=10)
+    vehicle_no = models.CharField(max_length=20, blank=True)
+    phone_number = models.CharField(max_length=15, blank=True, null=True)
+    entry_time = models.DateTimeField(null=True, blank=True)
+    exit_time = models.DateTimeField(null=True, blank=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=PENDING)
+    note = models.CharField(max_length=255, blank=True)
+    recorded_at = models.DateTimeField(default=timezone.now)
+    synced_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='journal_status_idx'),
+            models.Index(fields=['lot', 'token_id'], name='journal_lot_token_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.token_id} ({self.status})"
+
+class GateSequence(models.Model):
+    """
+    Per-class counter for tokens issued from this node's reserved range
+    """
+    vehicle_class = models.CharField(max_length=2, unique=True)
+    last_value = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.vehicle_class}: {self.last_value}"
+
+
+# ================================
+# EVENT LOG AND PROJECTIONS
+# ================================
+
+class ParkingEvent(models.Model):
+    """
+    Append-only log of session entries, exits, corrections and voids
+    (sessions deleted in the admin). Rows are never updated; projections
+    are derived from them in id order.
+    """
+    ENTRY = 'entry'
+    EXIT = 'exit'
+    CORRECTION = 'correction'
+    VOID = 'void'
+    KIND_CHOICES = [(ENTRY, 'Entry'), (EXIT, 'Exit'), (CORRECTION, 'Correction'), (VOID, 'Void')]
+
+    lot = models.CharField(max_length=20, default=default_lot)
+    vehicle_class = models.CharField(max_length=2)  # 'TW' or 'FW'
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    token_id = models.CharField(max_length=10)
+    vehicle_no = models.CharField(max_length=20, blank=True)
+    occurred_at = models.DateTimeField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    data = models.JSONField(default=dict, blank=True)
+    recorded_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} {self.token_id}"
+
+class OpenSession(models.Model):
+    """
+    Projection: sessions currently inside the lot
+    """
+    lot = models.CharField(max_length=20)
+    vehicle_class = models.CharField(max_length=2)
+    token_id = models.CharField(max_length=10)
+    vehicle_no = models.CharField(max_length=20, blank=True)
+    entry_time = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['lot', 'vehicle_class', 'token_id'], name='open_session_uniq'),
+        ]
 
     def __str__(self):
         return f"{self.token_id} - {self.vehicle_no}"
 
+class OccupancyProjection(models.Model):
+    """
+    Projection: number of vehicles parked per lot and class
+    """
+    lot = models.CharField(max_length=20)
+    vehicle_class = models.CharField(max_length=2)
+    parked = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['lot', 'vehicle_class'], name='occupancy_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.lot} {self.vehicle_class}: {self.parked}"
+
+class HourlyRollup(models.Model):
+    """
+    Projection: entries, exits and revenue per lot, class and hour
+    """
+    lot = models.CharField(max_length=20)
+    vehicle_class = models.CharField(max_length=2)
+    hour = models.DateTimeField()
+    entries = models.IntegerField(default=0)
+    exits = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['lot', 'hour', 'vehicle_class'], name='hourly_rollup_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.lot} {self.vehicle_class} {self.hour:%Y-%m-%d %H}:00"
+
+class ProjectionCheckpoint(models.Model):
+    """
+    Id of the last event applied to the projections in this database, and
+    the id gaps below it that a transaction still open may fill
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    # [[first id, last id, epoch seconds first seen], ...]
+    gaps = models.JSONField(default=list, blank=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_event_id}"
+
+
+# ================================
+# EMAIL OUTBOX
+# ================================
+
+class OutboundEmail(models.Model):
+    """
+    Message queued by a request and delivered later by `send_outbox`
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (SENT, 'Sent'), (FAILED, 'Failed')]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
+
+# ================================
+# SESSION IMPORTS
+# ================================
+
+class ImportRun(models.Model):
+    """
+    Progress of one legacy file being imported into a lot. `position` is
+    advanced in the same transaction as each batch of sessions, so a
+    failed run resumes exactly after the last committed batch.
+    """
+    lot = models.CharField(max_length=20, default=default_lot)
+    source = models.CharField(max_length=255)
+    digest = models.CharField(max_length=64)
+    position = models.PositiveBigIntegerField(default=0)
+    imported = models.PositiveBigIntegerField(default=0)
+    rejected = models.PositiveBigIntegerField(default=0)
+    retokened = models.PositiveBigIntegerField(default=0)
+    started_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['lot', 'digest'], name='import_lot_digest_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.source} -> {self.lot} ({self.position} rows)"
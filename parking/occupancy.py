@@ -0,0 +1,145 @@
+"""
+Occupancy over time: how many vehicles were inside at each moment.
+
+The sweep starts from the number inside at the start of the window. That
+number comes from the projections: vehicles parked now, minus the net
+entries in the hourly rollups since the window start. So the window start
+is rounded down to the hour, and nothing before it is read.
+
+The window's entry and exit timestamps are read as two sorted arrays from
+the (lot, entry_time) and (lot, exit_time) indexes. They become +1 and -1
+events. A stable sort puts exits before entries in the same second, and a
+cumulative sum gives the exact occupancy after every event. The
+per-minute series, the peak and the time at capacity all come from those
+levels.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.db import connections
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .events import parked_counts, rollups
+from .lots import lot_database, lot_entries
+from .models import TwoWheelerEntry, FourWheelerEntry
+from .slots import configured_bays
+
+SESSION_MODELS = {'TW': TwoWheelerEntry, 'FW': FourWheelerEntry}
+NAIVE_EPOCH = datetime(1970, 1, 1)
+# Supported bucket sizes in minutes
+RESOLUTIONS = [1, 5, 15, 60]
+
+def _timestamps(queryset, field):
+    """
+    Epoch seconds of `field`, in index order. Read from the raw cursor:
+    with USE_TZ both backends return naive UTC datetimes, and subtracting
+    the epoch is several times cheaper than the ORM making each one aware.
+    """
+    sql, params = queryset.order_by(field).values_list(field).query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return np.fromiter(((value - NAIVE_EPOCH).total_seconds() for value, in rows),
+                       dtype=np.float64, count=len(rows)).astype(np.int64)
+
+def fetch_events(lot, start, end):
+    """
+    {vehicle class: (entry timestamps, exit timestamps)} within [start, end)
+    """
+    events = {}
+    for vehicle_class, model in SESSION_MODELS.items():
+        sessions = lot_entries(model, lot)
+        events[vehicle_class] = (
+            _timestamps(sessions.filter(entry_time__gte=start, entry_time__lt=end), 'entry_time'),
+            _timestamps(sessions.filter(exit_time__gte=start, exit_time__lt=end), 'exit_time'),
+        )
+    return events
+
+def occupancy_at(lot, start, using):
+    """
+    {vehicle class: vehicles inside at `start`}, which must be on the hour
+    and projections must be caught up
+    """
+    inside = parked_counts(lot, using)
+    net = (
+        rollups(lot, start, using=using)
+        .values_list('vehicle_class')
+        .annotate(net=Sum(F('entries') - F('exits')))
+    )
+    for vehicle_class, change in net:
+        inside[vehicle_class] = inside.get(vehicle_class, 0) - change
+    return inside
+
+def sweep(entry_ts, exit_ts, initial, start_ts, end_ts, capacity=None, resolution=60):
+    """
+    Occupancy timeline from unsorted entry and exit timestamps: the most
+    vehicles inside in each `resolution`-second bucket, the peak and when
+    it was first reached, and the seconds spent at or above capacity
+    """
+    times = np.concatenate([exit_ts, entry_ts])
+    deltas = np.concatenate([np.full(len(exit_ts), -1, dtype=np.int64), np.ones(len(entry_ts), dtype=np.int64)])
+    order = np.argsort(times, kind='stable')
+    times, deltas = times[order], deltas[order]
+    levels = initial + np.cumsum(deltas)
+
+    buckets = -(-(end_ts - start_ts) // resolution)
+    bucket = (times - start_ts) // resolution
+    net = np.bincount(bucket, weights=deltas, minlength=buckets).astype(np.int64)
+    series = initial + np.concatenate([[0], np.cumsum(net)[:-1]])
+    np.maximum.at(series, bucket, levels)
+
+    # Occupancy holds between consecutive events
+    bounds = np.concatenate([[start_ts], times, [end_ts]])
+    held = np.concatenate([[initial], levels])
+    peak_index = int(np.argmax(held))
+    at_capacity = None
+    if capacity is not None:
+        at_capacity = int(np.diff(bounds)[held >= capacity].sum())
+    return {
+        'series': series.tolist(),
+        'peak': int(held[peak_index]),
+        'peak_at': int(bounds[peak_index]),
+        'capacity': capacity,
+        'seconds_at_capacity': at_capacity,
+    }
+
+def occupancy_timeline(lot, start, end=None, resolution_minutes=1):
+    """
+    Occupancy per vehicle class and in total over [start, end); start is
+    rounded down to the hour and end defaults to now
+    """
+    now = timezone.now()
+    start = start.replace(minute=0, second=0, microsecond=0)
+    end = min(end or now, now)
+    start_ts, end_ts = int(start.timestamp()), max(int(end.timestamp()), int(start.timestamp()) + 1)
+    resolution = resolution_minutes * 60
+
+    initial = occupancy_at(lot, start, lot_database(lot))
+    events = fetch_events(lot, start, end)
+    capacity = {
+        vehicle_class: sum(count for _, count in configured_bays(lot, vehicle_class)) or None
+        for vehicle_class in SESSION_MODELS
+    }
+    classes = {
+        vehicle_class: sweep(*events[vehicle_class], initial[vehicle_class], start_ts, end_ts,
+                             capacity[vehicle_class], resolution)
+        for vehicle_class in SESSION_MODELS
+    }
+    total_capacity = sum(capacity.values()) if all(capacity.values()) else None
+    total = sweep(
+        np.concatenate([entries for entries, _ in events.values()]),
+        np.concatenate([exits for _, exits in events.values()]),
+        sum(initial[vehicle_class] for vehicle_class in SESSION_MODELS),
+        start_ts, end_ts, total_capacity, resolution,
+    )
+    for result in (*classes.values(), total):
+        result['peak_at'] = datetime.fromtimestamp(result['peak_at'], tz=dt_timezone.utc).isoformat()
+    return {
+        'lot': lot,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'resolution_minutes': resolution_minutes,
+        'classes': classes,
+        'total': total,
+    }
@@ -0,0 +1,121 @@
+"""
+Email outbox: requests queue messages as rows and return immediately;
+send_pending delivers them in batches over one reused connection, with
+exponential backoff between attempts.
+
+A batch is claimed in a short transaction that pushes its rows'
+next_attempt_at out by CLAIM_SECONDS, and sent after the transaction has
+committed, so no row locks are held while talking to the mail server.
+Each row's result is saved on its own. A worker that dies mid-batch
+leaves its unsent rows to be claimed again once the claim runs out.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+OUTBOX_DEFAULTS = {
+    'BATCH_SIZE': 50,
+    'MAX_ATTEMPTS': 6,
+    'BACKOFF_SECONDS': 30,      # doubled after every failed attempt
+    'MAX_BACKOFF_SECONDS': 3600,
+    'CLAIM_SECONDS': 300,       # rows of a batch being sent are not claimed again before this
+    'EMAIL_BACKEND': None,      # defaults to settings.EMAIL_BACKEND
+}
+
+def outbox_config():
+    return {**OUTBOX_DEFAULTS, **getattr(settings, 'PARKING_OUTBOX', {})}
+
+def enqueue_email(subject, body, from_email, to, html_body=''):
+    """
+    Queue a message for delivery and return the outbox row
+    """
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=body,
+        html_body=html_body or '',
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(to),
+    )
+
+def _backoff(attempts, config):
+    seconds = config['BACKOFF_SECONDS'] * 2 ** (attempts - 1)
+    return timedelta(seconds=min(seconds, config['MAX_BACKOFF_SECONDS']))
+
+def _message(row, connection):
+    message = EmailMultiAlternatives(
+        subject=row.subject,
+        body=row.body,
+        from_email=row.from_email,
+        to=row.to,
+        connection=connection,
+    )
+    if row.html_body:
+        message.attach_alternative(row.html_body, 'text/html')
+    return message
+
+def _record_failure(row, error, config, now):
+    row.attempts += 1
+    row.last_error = str(error)[:1000]
+    if row.attempts >= config['MAX_ATTEMPTS']:
+        row.status = OutboundEmail.FAILED
+    else:
+        row.next_attempt_at = now + _backoff(row.attempts, config)
+    row.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+def _claim(batch_size, config):
+    """
+    Due rows for this worker, taken out of the due set for CLAIM_SECONDS
+    """
+    with transaction.atomic():
+        now = timezone.now()
+        rows = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboundEmail.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        OutboundEmail.objects.filter(pk__in=[row.pk for row in rows]).update(
+            next_attempt_at=now + timedelta(seconds=config['CLAIM_SECONDS'])
+        )
+    return rows
+
+def send_pending(batch_size=None):
+    """
+    Deliver one batch of due messages. Returns (sent, failed attempts).
+    """
+    config = outbox_config()
+    batch_size = batch_size or config['BATCH_SIZE']
+    sent = failed = 0
+    rows = _claim(batch_size, config)
+    if not rows:
+        return sent, failed
+
+    connection = get_connection(backend=config['EMAIL_BACKEND'], fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        now = timezone.now()
+        for row in rows:
+            _record_failure(row, exc, config, now)
+        return sent, len(rows)
+
+    try:
+        for row in rows:
+            try:
+                _message(row, connection).send()
+            except Exception as exc:
+                _record_failure(row, exc, config, timezone.now())
+                failed += 1
+            else:
+                row.status = OutboundEmail.SENT
+                row.attempts += 1
+                row.sent_at = timezone.now()
+                row.save(update_fields=['status', 'attempts', 'sent_at'])
+                sent += 1
+    finally:
+        connection.close()
+    return sent, failed
@@ -0,0 +1,112 @@
+"""
+"Already parked" guard on vehicle numbers.
+
+Open sessions carry their normalized plate in `open_plate` (NULL once
+exited) under a unique constraint per lot, which is the backstop. In front
+of it the PLATE_CACHE alias holds one key per parked plate, kept in sync
+on commit of every entry and exit, so the usual entry costs one cache
+lookup and no query. A cache hit is confirmed against the database before
+an entry is refused. A miss is only trusted while the lot's plate set is
+marked as loaded (rebuild_parked_plates sets the mark, a cache flush or
+eviction drops it); otherwise the database answers. A stale miss that
+still gets through is caught by the constraint.
+
+The plate cache must not cost more per write as it fills up, which rules
+out FileBasedCache: it lists its whole directory on every set to decide
+whether to cull (parking.checks refuses it). A LocMemCache per worker is
+enough, since each worker loads the plates at warm-up and misses from
+other workers' entries end at the constraint; Redis shares the set.
+"""
+import re
+
+from django.core.cache import caches
+from django.db import transaction
+
+from .lots import lot_database, lot_entries
+from .models import TwoWheelerEntry, FourWheelerEntry
+
+SESSION_MODELS = {'TW': TwoWheelerEntry, 'FW': FourWheelerEntry}
+PLATE_CACHE = 'plates'
+
+def plate_cache():
+    return caches[PLATE_CACHE]
+
+def normalize_plate(vehicle_no):
+    """
+    'ka-01 ab 1234' -> 'KA01AB1234'
+    """
+    return re.sub(r'[^A-Z0-9]', '', (vehicle_no or '').upper())
+
+def open_plate_for(entry):
+    """
+    Value of `open_plate` for a session: its plate while open, else NULL
+    """
+    if entry.exit_time is not None:
+        return None
+    return normalize_plate(entry.vehicle_no) or None
+
+def _key(lot, vehicle_class, plate):
+    return f'parking:parked:{lot}:{vehicle_class}:{plate}'
+
+def _loaded_key(lot):
+    return f'parking:parked-loaded:{lot}'
+
+def open_session_token(vehicle_class, lot, plate):
+    """
+    Token of the open session for a plate, straight from the database
+    """
+    return lot_entries(SESSION_MODELS[vehicle_class], lot).filter(
+        open_plate=plate
+    ).values_list('token_id', flat=True).first()
+
+def parked_token(vehicle_class, lot, plate):
+    """
+    Token of the open session for a plate, or None. Only a cache hit, or a
+    miss while the lot's plates are not loaded, costs a query.
+    """
+    if not plate:
+        return None
+    values = plate_cache().get_many([_key(lot, vehicle_class, plate), _loaded_key(lot)])
+    if _key(lot, vehicle_class, plate) not in values and _loaded_key(lot) in values:
+        return None
+    token_id = open_session_token(vehicle_class, lot, plate)
+    if token_id is None:
+        plate_cache().delete(_key(lot, vehicle_class, plate))
+    return token_id
+
+def mark_parked(vehicle_class, entry):
+    """
+    Add the session's plate to the parked set once the entry commits
+    """
+    if entry.open_plate:
+        key = _key(entry.lot, vehicle_class, entry.open_plate)
+        transaction.on_commit(lambda: plate_cache().set(key, entry.token_id, None), using=lot_database(entry.lot))
+
+def mark_left(vehicle_class, entry, plate):
+    """
+    Drop a plate from the parked set once the exit commits
+    """
+    if plate:
+        key = _key(entry.lot, vehicle_class, plate)
+        transaction.on_commit(lambda: plate_cache().delete(key), using=lot_database(entry.lot))
+
+def rebuild_parked_plates(lot, chunk_size=5000):
+    """
+    Load every open session's plate into the cache (after a cache flush or
+    at start-up). Returns the number of plates.
+    """
+    cache = plate_cache()
+    loaded = 0
+    for vehicle_class, model in SESSION_MODELS.items():
+        batch = {}
+        rows = lot_entries(model, lot).filter(open_plate__isnull=False).values_list('open_plate', 'token_id')
+        for plate, token_id in rows.iterator(chunk_size=chunk_size):
+            batch[_key(lot, vehicle_class, plate)] = token_id
+            if len(batch) >= chunk_size:
+                cache.set_many(batch, None)
+                loaded += len(batch)
+                batch = {}
+        cache.set_many(batch, None)
+        loaded += len(batch)
+    cache.set(_loaded_key(lot), True, None)
+    return loaded
@@ -0,0 +1,197 @@
+"""
+Opt-in per-request profiling for staff.
+
+A profiled request runs under cProfile plus a stack sampler, and ORM time
+is measured with a database execute wrapper. Each run writes
+<id>.pstats (for snakeviz/pstats), <id>.collapsed (folded stacks for
+flamegraph.pl/speedscope) and <id>.json (summary) into a bounded ring
+directory.
+"""
+import cProfile
+import json
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+PROFILING_DEFAULTS = {
+    'HEADER': 'HTTP_X_PARKING_PROFILE',
+    'QUERY_PARAM': '_profile',
+    'SAMPLE_RATE': 1.0,          # fraction of triggered requests that are profiled
+    'SAMPLE_INTERVAL': 0.001,    # seconds between stack samples
+    'MAX_PROFILES': 50,          # ring size
+    'DIR': None,                 # defaults to BASE_DIR / 'profiles'
+}
+
+# Third-party code whose own time is reported as a separate section
+SECTIONS = {
+    'matplotlib': ('/matplotlib/',),
+    'pandas': ('/pandas/', '/openpyxl/'),
+    'numpy': ('/numpy/',),
+}
+
+def profiling_config():
+    config = {**PROFILING_DEFAULTS, **getattr(settings, 'PARKING_PROFILING', {})}
+    if config['DIR'] is None:
+        config['DIR'] = Path(settings.BASE_DIR) / 'profiles'
+    return config
+
+def profile_dir():
+    return Path(profiling_config()['DIR'])
+
+def should_profile(request, config):
+    """
+    Staff asked for a profile with the header or query parameter, and the
+    request falls inside the sample rate
+    """
+    triggered = request.META.get(config['HEADER']) or request.GET.get(config['QUERY_PARAM'])
+    if not triggered:
+        return False
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_staff:
+        return False
+    return random.random() < config['SAMPLE_RATE']
+
+class _StackSampler(threading.Thread):
+    """
+    Samples the profiled thread's stack at a fixed interval and counts
+    folded stacks
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+class _QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+def _section_of(filename):
+    for section, markers in SECTIONS.items():
+        if any(marker in filename for marker in markers):
+            return section
+    return None
+
+def _section_times(stats):
+    """
+    Time spent inside each third-party section, including the C functions
+    it calls: the cumulative time of calls into the section from code
+    outside every section (or from outside the profiler). A section called
+    from another one counts towards the outer section.
+    """
+    totals = dict.fromkeys(SECTIONS, 0.0)
+    for (filename, _, _), (_, _, _, cumtime, callers) in stats.stats.items():
+        section = _section_of(filename)
+        if section is None:
+            continue
+        if not callers:
+            totals[section] += cumtime
+        for (caller_filename, _, _), (_, _, _, entered) in callers.items():
+            if _section_of(caller_filename) is None:
+                totals[section] += entered
+    return totals
+
+def run_profiled(request, get_response, url_name, config):
+    """
+    Run the rest of the request under the profilers and save the result.
+    Returns (response, profile id).
+    """
+    profiler = cProfile.Profile()
+    sampler = _StackSampler(threading.get_ident(), config['SAMPLE_INTERVAL'])
+    queries = _QueryTimer()
+
+    started = time.perf_counter()
+    sampler.start()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(queries))
+        profiler.enable()
+        try:
+            response = get_response(request)
+        finally:
+            profiler.disable()
+            sampler.stopped.set()
+    sampler.join()
+    elapsed = time.perf_counter() - started
+
+    profile_id = f"{timezone.now():%Y%m%d-%H%M%S-%f}-{url_name or 'unknown'}"
+    directory = Path(config['DIR'])
+    directory.mkdir(parents=True, exist_ok=True)
+
+    stats = pstats.Stats(profiler)
+    stats.dump_stats(directory / f'{profile_id}.pstats')
+    with open(directory / f'{profile_id}.collapsed', 'w') as handle:
+        for stack_line, count in sampler.stacks.most_common():
+            handle.write(f"{stack_line} {count}\n")
+
+    sections = {name: round(seconds * 1000, 2) for name, seconds in _section_times(stats).items()}
+    sections['orm'] = round(queries.seconds * 1000, 2)
+    summary = {
+        'id': profile_id,
+        'url_name': url_name,
+        'path': request.get_full_path(),
+        'method': request.method,
+        'user': request.user.get_username(),
+        'status': response.status_code,
+        'recorded_at': timezone.now().isoformat(),
+        'total_ms': round(elapsed * 1000, 2),
+        'queries': queries.count,
+        'sections_ms': sections,
+        'samples': sum(sampler.stacks.values()),
+    }
+    with open(directory / f'{profile_id}.json', 'w') as handle:
+        json.dump(summary, handle)
+
+    _trim_ring(directory, config['MAX_PROFILES'])
+    return response, profile_id
+
+def _trim_ring(directory, keep):
+    summaries = sorted(directory.glob('*.json'))
+    for summary in summaries[:-keep] if keep else summaries:
+        for suffix in ('.pstats', '.collapsed', '.json'):
+            summary.with_suffix(suffix).unlink(missing_ok=True)
+
+def recent_profiles():
+    """
+    Summaries of the profiles in the ring, newest first
+    """
+    directory = profile_dir()
+    summaries = []
+    for path in sorted(directory.glob('*.json'), reverse=True):
+        try:
+            with open(path) as handle:
+                summaries.append(json.load(handle))
+        except (OSError, ValueError):
+            continue
+    return summaries
@@ -0,0 +1,201 @@
+"""
+Excel reports assembled from immutable per-day parts.
+
+A part holds one local day's sessions (by entry time) for a lot: summary
+numbers per vehicle class plus the rows already rendered as sheet XML
+(see parking.xlsx).
+Once a day has ended and every session entered on it has exited, its
+part is written to PARKING_REPORT_PARTS_DIR/<lot>/<YYYY-MM-DD>.json.gz
+(gzipped JSON carrying FORMAT_VERSION) and never queried again. A part
+that cannot be read, or has another version, is rebuilt. A report over
+any range loads the stored parts, builds the missing ones from one query
+per vehicle class for each run of consecutive missing days, and queries
+only today live, plus the first day when the range starts inside it.
+
+Anything that changes a closed day afterwards (admin edits, late gate
+journal syncs, imports) must call invalidate_report_days, after its
+transaction commits: a report running before the commit still reads the
+old rows and would store them again. invalidate_report_days_on_commit
+defers it.
+"""
+import gzip
+import json
+import os
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .lots import lot_database, lot_entries
+from .models import TwoWheelerEntry, FourWheelerEntry
+from .xlsx import render_rows
+
+SESSION_MODELS = {'TW': TwoWheelerEntry, 'FW': FourWheelerEntry}
+ROW_FIELDS = ['token_id', 'vehicle_no', 'phone_number', 'entry_time', 'exit_time', 'amount']
+FORMAT_VERSION = 3
+
+def parts_dir(lot):
+    return Path(settings.PARKING_REPORT_PARTS_DIR) / lot
+
+def _part_path(lot, day):
+    return parts_dir(lot) / f'{day.isoformat()}.json.gz'
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+def _local_day(value):
+    return timezone.localtime(value).date()
+
+def _make_part(day, rows_by_class):
+    """
+    Part for one day from {vehicle class: [row tuples]}
+    """
+    summary = {}
+    sheet_rows = {}
+    is_closed = True
+    for vehicle_class in SESSION_MODELS:
+        rows = rows_by_class.get(vehicle_class, [])
+        exited = [row for row in rows if row[4] is not None]
+        is_closed = is_closed and len(exited) == len(rows)
+        summary[vehicle_class] = {
+            'sessions': len(rows),
+            'revenue': sum((row[5] or Decimal(0) for row in exited), Decimal(0)),
+        }
+        sheet_rows[vehicle_class] = render_rows(rows)
+    return {'version': FORMAT_VERSION, 'day': day, 'summary': summary, 'rows': sheet_rows, 'closed': is_closed}
+
+def _fetch(lot, start, end):
+    """
+    {vehicle class: rows} of sessions entered in [start, end)
+    """
+    return {
+        vehicle_class: list(
+            lot_entries(model, lot).filter(entry_time__gte=start, entry_time__lt=end)
+            .order_by('entry_time').values_list(*ROW_FIELDS)
+        )
+        for vehicle_class, model in SESSION_MODELS.items()
+    }
+
+def _encode(part):
+    return {
+        'version': FORMAT_VERSION,
+        'day': part['day'].isoformat(),
+        'closed': part['closed'],
+        'summary': {
+            vehicle_class: {'sessions': totals['sessions'], 'revenue': str(totals['revenue'])}
+            for vehicle_class, totals in part['summary'].items()
+        },
+        'rows': {vehicle_class: rows.decode('utf-8') for vehicle_class, rows in part['rows'].items()},
+    }
+
+def _decode(data):
+    return {
+        'version': data['version'],
+        'day': date.fromisoformat(data['day']),
+        'closed': data['closed'],
+        'summary': {
+            vehicle_class: {'sessions': int(totals['sessions']), 'revenue': Decimal(totals['revenue'])}
+            for vehicle_class, totals in data['summary'].items()
+        },
+        'rows': {vehicle_class: rows.encode('utf-8') for vehicle_class, rows in data['rows'].items()},
+    }
+
+def load_part(lot, day):
+    """
+    The stored part of a day, or None when it is missing, unreadable or
+    of another format version
+    """
+    try:
+        with gzip.open(_part_path(lot, day), 'rt', encoding='utf-8') as handle:
+            data = json.load(handle)
+        if data.get('version') != FORMAT_VERSION:
+            return None
+        return _decode(data)
+    except (OSError, EOFError, ValueError, KeyError, TypeError, AttributeError, InvalidOperation):
+        return None
+
+def save_part(lot, part):
+    directory = parts_dir(lot)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = _part_path(lot, part['day'])
+    tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+    with gzip.open(tmp, 'wt', encoding='utf-8', compresslevel=6) as handle:
+        json.dump(_encode(part), handle)
+    os.replace(tmp, path)
+
+def invalidate_report_days(lot, times):
+    """
+    Drop the stored parts of the local days containing `times`
+    """
+    for day in {_local_day(value) for value in times if value is not None}:
+        _part_path(lot, day).unlink(missing_ok=True)
+
+def invalidate_report_days_on_commit(lot, times):
+    """
+    invalidate_report_days once the lot's database transaction commits
+    """
+    times = list(times)
+    transaction.on_commit(lambda: invalidate_report_days(lot, times), using=lot_database(lot))
+
+def day_parts(lot, start_day, end_day):
+    """
+    One part per local day in [start_day, end_day]. Closed days come from
+    storage or are built and stored; today is always live. Returns
+    (parts, days queried).
+    """
+    today = timezone.localdate()
+    days = [start_day + timedelta(days=n) for n in range((end_day - start_day).days + 1)]
+    parts = {day: load_part(lot, day) for day in days if day < today}
+    missing = [day for day in days if parts.get(day) is None]
+    for run in _runs(missing):
+        by_day = defaultdict(lambda: defaultdict(list))
+        for vehicle_class, rows in _fetch(lot, _day_start(run[0]), _day_start(run[-1] + timedelta(days=1))).items():
+            for row in rows:
+                by_day[_local_day(row[3])][vehicle_class].append(row)
+        for day in run:
+            part = _make_part(day, by_day[day])
+            if day < today and part['closed']:
+                save_part(lot, part)
+            parts[day] = part
+    return [parts[day] for day in days], len(missing)
+
+def _runs(days):
+    """
+    Split sorted days into runs of consecutive days
+    """
+    runs = []
+    for day in days:
+        if runs and day - runs[-1][-1] == timedelta(days=1):
+            runs[-1].append(day)
+        else:
+            runs.append([day])
+    return runs
+
+def assemble_report(lot, start, end_day):
+    """
+    Summary totals and per-class lists of sheet row fragments for the
+    sessions entered from `start` (aware) to the end of end_day. Whole
+    days come from day_parts; a start inside a day reads the rest of that
+    day live.
+    """
+    first_day = _local_day(start)
+    parts = []
+    if start > _day_start(first_day):
+        next_day = first_day + timedelta(days=1)
+        parts.append(_make_part(first_day, _fetch(lot, start, _day_start(next_day))))
+        first_day = next_day
+    if first_day <= end_day:
+        parts += day_parts(lot, first_day, end_day)[0]
+    summary = {
+        vehicle_class: {
+            'sessions': sum(part['summary'][vehicle_class]['sessions'] for part in parts),
+            'revenue': sum((part['summary'][vehicle_class]['revenue'] for part in parts), Decimal(0)),
+        }
+        for vehicle_class in SESSION_MODELS
+    }
+    rows = {vehicle_class: [part['rows'][vehicle_class] for part in parts] for vehicle_class in SESSION_MODELS}
+    return summary, rows
@@ -0,0 +1,37 @@
+"""
+Database routers for the parking app
+"""
+
+JOURNAL_DATABASE = 'journal'
+JOURNAL_MODELS = {'gatejournalentry', 'gatesequence'}
+
+
+class GateJournalRouter:
+    """
+    Keep the gate node journal in its own local database and everything
+    else out of it
+    """
+
+    def _is_journal_model(self, model):
+        return model._meta.app_label == 'parking' and model._meta.model_name in JOURNAL_MODELS
+
+    def db_for_read(self, model, **hints):
+        if self._is_journal_model(model):
+            return JOURNAL_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        if self._is_journal_model(model):
+            return JOURNAL_DATABASE
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        is_journal = app_label == 'parking' and model_name in JOURNAL_MODELS
+        if db == JOURNAL_DATABASE:
+            return is_journal
+        if is_journal:
+            return False
+        return None
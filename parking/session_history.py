@@ -0,0 +1,213 @@
+"""
+Session history for integrations, paged by keyset.
+
+Sessions of both classes are ordered by (key time, class, id), where the
+key time is entry_time or exit_time. A cursor is the position of the last
+row returned, and the next page is every row strictly after it. Each
+class then costs one range read on its (lot, entry_time) or
+(lot, exit_time) index, which InnoDB and SQLite already end with the
+primary key. That cost is the same however deep the cursor is, where
+OFFSET would rescan every row before the page. Open sessions read the
+(lot, exit_time, entry_time) index, whose exit_time IS NULL range holds
+only them in entry order, so they never walk the closed history.
+
+Gate-node syncs can insert sessions behind a cursor that has already
+passed their time, so billing pulls should order by exit time and allow
+for the sync lag.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime, time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .lots import lot_entries
+from .models import TwoWheelerEntry, FourWheelerEntry
+
+SESSION_MODELS = {'TW': TwoWheelerEntry, 'FW': FourWheelerEntry}
+CLASS_ORDER = list(SESSION_MODELS)
+ORDER_FIELDS = {'entry': 'entry_time', 'exit': 'exit_time'}
+FIELDS = ['lot', 'class', 'token_id', 'vehicle_no', 'phone_number', 'entry_time', 'exit_time', 'amount', 'slot']
+DEFAULT_FIELDS = ['class', 'token_id', 'vehicle_no', 'entry_time', 'exit_time', 'amount']
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidQuery(ValueError):
+    pass
+
+# ================================
+# CURSORS
+# ================================
+
+def encode_cursor(order, key_time, vehicle_class, pk):
+    raw = json.dumps([order, key_time.isoformat(), vehicle_class, pk], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, order):
+    """
+    (key time, class, id) from a cursor issued for the same ordering
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_order, key_time, vehicle_class, pk = json.loads(raw)
+        key_time = datetime.fromisoformat(key_time)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidQuery("cursor is not valid")
+    if cursor_order != order or vehicle_class not in SESSION_MODELS or not isinstance(pk, int):
+        raise InvalidQuery("cursor does not belong to this ordering")
+    return key_time, vehicle_class, pk
+
+def _after(field, vehicle_class, position):
+    """
+    Filter for the rows of one class that sort after `position`
+    """
+    key_time, cursor_class, pk = position
+    if vehicle_class == cursor_class:
+        # The >= bound alone gives the planner an index range to start from
+        return Q(**{f'{field}__gte': key_time}) & (Q(**{f'{field}__gt': key_time}) | Q(id__gt=pk))
+    if CLASS_ORDER.index(vehicle_class) > CLASS_ORDER.index(cursor_class):
+        return Q(**{f'{field}__gte': key_time})
+    return Q(**{f'{field}__gt': key_time})
+
+# ================================
+# QUERIES
+# ================================
+
+def _parse_time(value, name):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise InvalidQuery(f"{name} must be an ISO date or datetime")
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class HistoryQuery:
+    """
+    Validated history request: what to read and which fields to return
+    """
+
+    def __init__(self, lot, params):
+        self.lot = lot
+        self.order = params.get('order', 'entry')
+        if self.order not in ORDER_FIELDS:
+            raise InvalidQuery("order must be 'entry' or 'exit'")
+        self.field = ORDER_FIELDS[self.order]
+
+        vehicle_class = params.get('class')
+        if vehicle_class and vehicle_class not in SESSION_MODELS:
+            raise InvalidQuery(f"class must be one of {', '.join(SESSION_MODELS)}")
+        self.classes = [vehicle_class] if vehicle_class else CLASS_ORDER
+
+        self.status = params.get('status', 'all')
+        if self.status not in ('all', 'open', 'closed'):
+            raise InvalidQuery("status must be 'all', 'open' or 'closed'")
+        if self.order == 'exit' and self.status == 'open':
+            raise InvalidQuery("open sessions have no exit time to order by")
+
+        self.since = _parse_time(params.get('since'), 'since')
+        self.until = _parse_time(params.get('until'), 'until')
+
+        self.fields = [name for name in params.get('fields', '').split(',') if name] or DEFAULT_FIELDS
+        unknown = set(self.fields) - set(FIELDS)
+        if unknown:
+            raise InvalidQuery(f"unknown fields: {', '.join(sorted(unknown))}")
+
+        try:
+            self.page_size = min(MAX_PAGE_SIZE, max(1, int(params.get('limit', DEFAULT_PAGE_SIZE))))
+        except ValueError:
+            raise InvalidQuery("limit must be a number")
+
+        cursor = params.get('cursor')
+        self.position = decode_cursor(cursor, self.order) if cursor else None
+
+    def _class_page(self, vehicle_class, position, limit):
+        """
+        Up to `limit` rows of one class after `position`, as
+        (key time, class, id, values) in key order
+        """
+        queryset = lot_entries(SESSION_MODELS[vehicle_class], self.lot)
+        if self.status == 'open':
+            queryset = queryset.filter(exit_time__isnull=True)
+        elif self.status == 'closed' or self.order == 'exit':
+            queryset = queryset.filter(exit_time__isnull=False)
+        if self.since:
+            queryset = queryset.filter(**{f'{self.field}__gte': self.since})
+        if self.until:
+            queryset = queryset.filter(**{f'{self.field}__lt': self.until})
+        if position:
+            queryset = queryset.filter(_after(self.field, vehicle_class, position))
+
+        columns = [name for name in self.fields if name != 'class']
+        rows = queryset.order_by(self.field, 'id').values_list(self.field, 'id', *columns)[:limit]
+        return [(row[0], vehicle_class, row[1], row[2:]) for row in rows]
+
+    def page(self, position, limit):
+        """
+        Next `limit` rows after `position` across the requested classes:
+        one bounded query per class, merged by (key time, class, id)
+        """
+        rows = []
+        for vehicle_class in self.classes:
+            rows.extend(self._class_page(vehicle_class, position, limit))
+        rows.sort(key=lambda row: (row[0], CLASS_ORDER.index(row[1]), row[2]))
+        return rows[:limit]
+
+    def record(self, row):
+        key_time, vehicle_class, pk, values = row
+        values = iter(values)
+        return {name: vehicle_class if name == 'class' else next(values) for name in self.fields}
+
+    def cursor_after(self, row):
+        return encode_cursor(self.order, row[0], row[1], row[2])
+
+# ================================
+# RESPONSES
+# ================================
+
+def history_page(query):
+    """
+    One page as a JSON-ready dict. next_cursor is always set, so a client
+    polling for new sessions keeps passing the last cursor it got.
+    """
+    rows = query.page(query.position, query.page_size + 1)
+    has_more = len(rows) > query.page_size
+    rows = rows[:query.page_size]
+    if rows:
+        next_cursor = query.cursor_after(rows[-1])
+    else:
+        next_cursor = encode_cursor(query.order, *query.position) if query.position else None
+    return {
+        'lot': query.lot,
+        'order': query.order,
+        'sessions': [query.record(row) for row in rows],
+        'next_cursor': next_cursor,
+        'has_more': has_more,
+    }
+
+def stream_history(query):
+    """
+    NDJSON lines for every row after the cursor, read MAX_PAGE_SIZE rows
+    at a time, then a final {"next_cursor": ...} line
+    """
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    position = query.position
+    while True:
+        rows = query.page(position, MAX_PAGE_SIZE)
+        if rows:
+            yield ''.join(encoder.encode(query.record(row)) + '\n' for row in rows)
+            position = rows[-1][:3]
+        if len(rows) < MAX_PAGE_SIZE:
+            break
+    cursor = encode_cursor(query.order, *position) if position else None
+    yield encoder.encode({'next_cursor': cursor}) + '\n'
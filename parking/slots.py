@@ -0,0 +1,164 @@
+"""
+Bay allocation.
+
+Each worker keeps, per lot and vehicle class, a bitmap of the bays it
+believes are free: bit i is set when bay i is free, with bays ordered by
+zone and number so the lowest set bit is the first bay in the lot. Taking
+it (`free & -free`) costs the same however full the lot is.
+
+The database is the arbiter. A bay only belongs to a token once the
+conditional UPDATE on `token_id IS NULL` succeeds, so concurrent gates in
+other workers can never share a bay. A stale bit costs one extra UPDATE.
+When the bitmap runs dry it is rebuilt from the database, and only then
+is the lot declared full.
+
+Bays come from PARKING_LOTS[lot]['zones']; a lot without zones has no
+bays and no capacity limit.
+"""
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+
+from .data_version import VEHICLE_CLASSES
+from .lots import lot_database
+from .models import ParkingSlot
+
+class LotFull(Exception):
+    pass
+
+def configured_bays(lot, vehicle_class):
+    """
+    [(zone, bay count)] for a vehicle class, in configuration order
+    """
+    zones = settings.PARKING_LOTS.get(lot, {}).get('zones', {})
+    return [(zone, counts[vehicle_class]) for zone, counts in zones.items() if counts.get(vehicle_class)]
+
+
+class SlotAllocator:
+    def __init__(self, lot, vehicle_class):
+        self.lot = lot
+        self.vehicle_class = vehicle_class
+        self.using = lot_database(lot)
+        self.lock = threading.Lock()
+        self.slot_ids = []
+        self.labels = []
+        self.index_by_label = {}
+        self.free = 0
+        self.loaded = False
+
+    def _slots(self):
+        return ParkingSlot.objects.using(self.using).filter(lot=self.lot, vehicle_class=self.vehicle_class)
+
+    def _create_missing(self):
+        ParkingSlot.objects.using(self.using).bulk_create([
+            ParkingSlot(lot=self.lot, vehicle_class=self.vehicle_class, zone=zone, number=number)
+            for zone, count in configured_bays(self.lot, self.vehicle_class)
+            for number in range(1, count + 1)
+        ], ignore_conflicts=True)
+
+    def load(self):
+        """
+        Rebuild the bitmap from the database, creating configured bays
+        that have no row yet
+        """
+        configured = sum(count for _, count in configured_bays(self.lot, self.vehicle_class))
+        rows = list(self._slots().order_by('zone', 'number').values_list('id', 'zone', 'number', 'token_id'))
+        if len(rows) < configured:
+            self._create_missing()
+            rows = list(self._slots().order_by('zone', 'number').values_list('id', 'zone', 'number', 'token_id'))
+
+        free = 0
+        for index, (_, _, _, token_id) in enumerate(rows):
+            if token_id is None:
+                free |= 1 << index
+        self.slot_ids = [row[0] for row in rows]
+        self.labels = [ParkingSlot(zone=zone, number=number).label for _, zone, number, _ in rows]
+        self.index_by_label = {label: index for index, label in enumerate(self.labels)}
+        self.free = free
+        self.loaded = True
+
+    def _take_lowest(self, reloaded):
+        """
+        Clear and return the lowest free bit, reloading once when empty
+        """
+        with self.lock:
+            if not self.loaded or (not self.free and not reloaded):
+                self.load()
+                reloaded = True
+            if not self.free:
+                raise LotFull(f"No free {self.vehicle_class} bays in {self.lot}")
+            lowest = self.free & -self.free
+            self.free ^= lowest
+            return lowest.bit_length() - 1, reloaded
+
+    def allocate(self, token_id):
+        """
+        Assign the first free bay to token_id and return its label. Call
+        inside the entry's transaction so a failed entry frees the bay.
+        """
+        reloaded = False
+        while True:
+            index, reloaded = self._take_lowest(reloaded)
+            taken = self._slots().filter(pk=self.slot_ids[index], token_id__isnull=True).update(
+                token_id=token_id, occupied_at=timezone.now(),
+            )
+            if taken:
+                return self.labels[index]
+            # Another worker holds it; the bit stays clear
+
+    def release(self, token_id, label):
+        """
+        Free the bay held by token_id
+        """
+        released = self._slots().filter(token_id=token_id).update(token_id=None, occupied_at=None)
+        index = self.index_by_label.get(label)
+        if released and index is not None:
+            with self.lock:
+                self.free |= 1 << index
+        return released
+
+# ================================
+# PER-WORKER REGISTRY
+# ================================
+
+_allocators = {}
+_registry_lock = threading.Lock()
+
+def allocator(lot, vehicle_class):
+    key = (lot, vehicle_class)
+    with _registry_lock:
+        if key not in _allocators:
+            _allocators[key] = SlotAllocator(lot, vehicle_class)
+        return _allocators[key]
+
+def allocate_slot(lot, vehicle_class, token_id):
+    """
+    Assign a bay to a new session. Returns its label, or '' when the lot
+    has no bays configured. Raises LotFull.
+    """
+    if not configured_bays(lot, vehicle_class):
+        return ''
+    return allocator(lot, vehicle_class).allocate(token_id)
+
+def release_slot(lot, vehicle_class, token_id, label):
+    """
+    Free the bay of a closed session
+    """
+    if not label or not configured_bays(lot, vehicle_class):
+        return 0
+    return allocator(lot, vehicle_class).release(token_id, label)
+
+def load_allocators():
+    """
+    Build every configured bitmap (run at worker start-up)
+    """
+    loaded = 0
+    for lot in settings.PARKING_LOTS:
+        for vehicle_class in VEHICLE_CLASSES:
+            if configured_bays(lot, vehicle_class):
+                slots = allocator(lot, vehicle_class)
+                with slots.lock:
+                    slots.load()
+                loaded += 1
+    return loaded
@@ -0,0 +1,260 @@
+"""
+Columnar snapshot of closed sessions for heavy analytics.
+
+Each lot gets a directory of fixed-width column files (NumPy memmaps)
+sorted by exit time, plus meta.json holding the row count, the exit-time
+watermark and a position in the event log. build_snapshot appends sessions
+closed since the watermark. Exits, corrections and voids recorded since the
+event position that fall behind the watermark (late gate journal syncs,
+admin edits, imports) rewind the snapshot to the earliest of them, which is
+then read again. The analytics functions are vectorised scans that never
+touch the database.
+"""
+import json
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from .events import read_since
+from .lots import lot_database, lot_entries
+from .models import TwoWheelerEntry, FourWheelerEntry, ParkingEvent
+
+COLUMNS = {
+    'entry_ts': np.int64,       # epoch seconds
+    'exit_ts': np.int64,        # epoch seconds, ascending
+    'vehicle_class': np.int8,   # 0 = two wheeler, 1 = four wheeler
+    'amount': np.int64,         # paise
+}
+CLASS_CODES = {'TW': 0, 'FW': 1}
+ENTRY_MODELS = {'TW': TwoWheelerEntry, 'FW': FourWheelerEntry}
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# Sessions closing in the last minute may still be in flight
+DEFAULT_LAG = timedelta(minutes=1)
+WINDOW = timedelta(days=30)
+# Longest range, in 30-day months, the snapshot analytics serve
+MAX_MONTHS = 36
+EVENT_BATCH = 20000
+
+def snapshot_dir(lot):
+    return Path(settings.PARKING_SNAPSHOT_DIR) / lot
+
+def _read_meta(directory):
+    try:
+        with open(directory / 'meta.json') as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return {'rows': 0, 'watermark': EPOCH.isoformat()}
+
+def _write_meta(directory, meta):
+    tmp = directory / 'meta.json.tmp'
+    with open(tmp, 'w') as handle:
+        json.dump(meta, handle)
+    os.replace(tmp, directory / 'meta.json')
+
+def _truncate(directory, rows):
+    for name, dtype in COLUMNS.items():
+        path = directory / f'{name}.bin'
+        if path.exists():
+            os.truncate(path, rows * np.dtype(dtype).itemsize)
+
+def _changed_exit_time(event):
+    """
+    Exit time of the closed session an event adds, corrects or voids
+    """
+    if event.kind == ParkingEvent.EXIT:
+        return event.occurred_at
+    if event.kind in (ParkingEvent.CORRECTION, ParkingEvent.VOID) and event.data.get('exit_time'):
+        return datetime.fromisoformat(event.data['exit_time'])
+    return None
+
+def _earliest_change(lot, meta):
+    """
+    Earliest exit time changed by the lot's events since the snapshot's
+    event position, and move the position past them. A snapshot without a
+    position starts at the end of the log.
+    """
+    using = lot_database(lot)
+    if meta.get('event_id') is None:
+        meta['event_id'] = ParkingEvent.objects.using(using).aggregate(last=Max('id'))['last'] or 0
+        meta['gaps'] = []
+        return None
+    earliest = None
+    while True:
+        filled, events, meta['event_id'], meta['gaps'] = read_since(
+            using, meta['event_id'], meta['gaps'], EVENT_BATCH
+        )
+        for event in filled + events:
+            changed = _changed_exit_time(event) if event.lot == lot else None
+            if changed is not None and (earliest is None or changed < earliest):
+                earliest = changed
+        if len(events) < EVENT_BATCH:
+            return earliest
+
+def _epoch(values):
+    return np.array([(value - EPOCH).total_seconds() for value in values], dtype=np.int64)
+
+def _fetch_window(lot, start, end):
+    """
+    Closed sessions of both classes with exit_time in [start, end), as
+    columns sorted by exit time
+    """
+    parts = []
+    for vehicle_class, model in ENTRY_MODELS.items():
+        rows = list(
+            lot_entries(model, lot)
+            .filter(exit_time__gte=start, exit_time__lt=end)
+            .values_list('entry_time', 'exit_time', 'amount')
+        )
+        if rows:
+            entry_times, exit_times, amounts = zip(*rows)
+            parts.append({
+                'entry_ts': _epoch(entry_times),
+                'exit_ts': _epoch(exit_times),
+                'vehicle_class': np.full(len(rows), CLASS_CODES[vehicle_class], dtype=np.int8),
+                'amount': np.array([int((amount or 0) * 100) for amount in amounts], dtype=np.int64),
+            })
+    if not parts:
+        return None
+    columns = {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+    order = np.argsort(columns['exit_ts'], kind='stable')
+    return {name: values[order] for name, values in columns.items()}
+
+def build_snapshot(lot, lag=DEFAULT_LAG, rebuild=False):
+    """
+    Append sessions closed since the watermark to the lot's snapshot, after
+    rewinding it to the earliest exit time changed by new events. Works in
+    30-day windows and commits meta.json after each, so an interrupted
+    build resumes where it stopped. Returns rows appended.
+    """
+    directory = snapshot_dir(lot)
+    directory.mkdir(parents=True, exist_ok=True)
+    if rebuild:
+        for name in COLUMNS:
+            (directory / f'{name}.bin').unlink(missing_ok=True)
+        (directory / 'meta.json').unlink(missing_ok=True)
+
+    meta = _read_meta(directory)
+    # Drop anything written past the committed row count by a failed run
+    _truncate(directory, meta['rows'])
+
+    cutoff = timezone.now() - lag
+    watermark = datetime.fromisoformat(meta['watermark'])
+    earliest = _earliest_change(lot, meta)
+    if earliest is not None and earliest < watermark:
+        # Rows are cut and read again from the start of that second
+        second = _to_epoch(earliest)
+        if meta['rows']:
+            exit_ts = np.memmap(directory / 'exit_ts.bin', dtype=np.int64, mode='r', shape=(meta['rows'],))
+            meta['rows'] = int(np.searchsorted(exit_ts, second, side='left'))
+            del exit_ts
+        _truncate(directory, meta['rows'])
+        watermark = EPOCH + timedelta(seconds=second)
+        meta['watermark'] = watermark.isoformat()
+    _write_meta(directory, meta)
+    if watermark == EPOCH:
+        first_exits = [
+            lot_entries(model, lot).filter(exit_time__isnull=False).order_by('exit_time')
+            .values_list('exit_time', flat=True).first()
+            for model in ENTRY_MODELS.values()
+        ]
+        first_exits = [value for value in first_exits if value is not None]
+        if first_exits:
+            watermark = min(first_exits)
+
+    appended = 0
+    while watermark < cutoff:
+        window_end = min(watermark + WINDOW, cutoff)
+        columns = _fetch_window(lot, watermark, window_end)
+        if columns is not None:
+            for name in COLUMNS:
+                with open(directory / f'{name}.bin', 'ab') as handle:
+                    columns[name].tofile(handle)
+            appended += len(columns['exit_ts'])
+            meta['rows'] += len(columns['exit_ts'])
+        watermark = window_end
+        meta['watermark'] = watermark.isoformat()
+        _write_meta(directory, meta)
+    return appended
+
+def load_snapshot(lot):
+    """
+    Read-only memmaps of the lot's snapshot columns
+    """
+    directory = snapshot_dir(lot)
+    meta = _read_meta(directory)
+    columns = {}
+    for name, dtype in COLUMNS.items():
+        if meta['rows']:
+            columns[name] = np.memmap(directory / f'{name}.bin', dtype=dtype, mode='r', shape=(meta['rows'],))
+        else:
+            columns[name] = np.empty(0, dtype=dtype)
+    columns['watermark'] = datetime.fromisoformat(meta['watermark'])
+    return columns
+
+# ================================
+# VECTORISED ANALYTICS
+# ================================
+
+def _to_epoch(value):
+    return int((value - EPOCH).total_seconds())
+
+def select_range(columns, start, end):
+    """
+    Slice of the snapshot with exit time in [start, end); a binary search
+    because exit_ts is sorted
+    """
+    exit_ts = columns['exit_ts']
+    lo = np.searchsorted(exit_ts, _to_epoch(start), side='left')
+    hi = np.searchsorted(exit_ts, _to_epoch(end), side='left')
+    return {name: columns[name][lo:hi] for name in COLUMNS}
+
+def occupancy_curve(entry_ts, exit_ts, grid):
+    """
+    Vehicles inside at each grid instant: sessions entered at or before t
+    minus sessions exited at or before t
+    """
+    entered = np.searchsorted(np.sort(entry_ts), grid, side='right')
+    exited = np.searchsorted(np.sort(exit_ts), grid, side='right')
+    return entered - exited
+
+def duration_distribution(columns, bin_minutes=30, max_hours=24):
+    """
+    Histogram of parking durations; the last bin collects longer stays
+    """
+    minutes = (columns['exit_ts'] - columns['entry_ts']) // 60
+    edges = np.arange(0, max_hours * 60 + bin_minutes, bin_minutes)
+    counts, _ = np.histogram(np.minimum(minutes, edges[-1] - 1), bins=edges)
+    return {'bin_minutes': bin_minutes, 'counts': counts.tolist()}
+
+def daily_peak_occupancy(columns, start, end, resolution_minutes=5):
+    """
+    Peak number of vehicles inside per day, sampled every few minutes.
+    Takes the whole snapshot: sessions that exit after end still count.
+    """
+    day_start = _to_epoch(start.replace(hour=0, minute=0, second=0, microsecond=0))
+    days = max(1, -(-(_to_epoch(end) - day_start) // 86400))
+    step = resolution_minutes * 60
+    grid = np.arange(day_start, day_start + days * 86400, step)
+    lo = np.searchsorted(columns['exit_ts'], day_start, side='left')
+    curve = occupancy_curve(columns['entry_ts'][lo:], columns['exit_ts'][lo:], grid)
+    peaks = curve.reshape(days, -1).max(axis=1)
+    return [
+        {'date': (EPOCH + timedelta(seconds=int(day_start) + day * 86400)).date().isoformat(), 'peak': int(peak)}
+        for day, peak in enumerate(peaks)
+    ]
+
+def revenue_by_weekday_hour(columns):
+    """
+    7 x 24 revenue matrix (Monday first, UTC hours) by exit time
+    """
+    exit_ts = columns['exit_ts']
+    weekday = (exit_ts // 86400 + 3) % 7  # 1970-01-01 was a Thursday
+    hour = exit_ts // 3600 % 24
+    totals = np.bincount(weekday * 24 + hour, weights=columns['amount'], minlength=7 * 24)
+    return (totals.reshape(7, 24) / 100).round(2).tolist()
@@ -1,3 +1,1410 @@
-from django.test import TestCase
+import cProfile
+import csv
+import gzip
+import io
+import json
+import pstats
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock, skipUnless
+
+import numpy as np
+import pandas as pd
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.mail.backends import locmem
+from django.core.mail.backends.base import BaseEmailBackend
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import LiveServerTestCase, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError, connection, transaction
+from django.db.models import QuerySet
+from django.db.utils import ConnectionHandler
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlencode, urlsafe_base64_encode
+
+from . import plates, slots, urls
+from .admin import EstimatedCountPaginator
+from .checks import check_gate_node_id, check_plate_cache
+from .db.pool import close_pools
+from .budgets import QUERY_BUDGETS, QueryBudgetExceeded, query_budget
+from .events import (
+    apply_pending, backfill_events, correction_event, exit_event, parked_counts, rebuild_projections, record_event,
+    void_event,
+)
+from .gate import record_entry, record_exit, sync_journal
+from .importer import SessionImporter, _editor
+from .loadtest import LoadTestResults
+from .lots import lot_database, lot_entries
+from .middleware import AdmissionControlMiddleware
+from .models import (
+    FourWheelerEntry, GateJournalEntry, HourlyRollup, ImportRun, OccupancyProjection, OpenSession, OutboundEmail,
+    ParkingEvent, ParkingSlot, ProjectionCheckpoint, TwoWheelerEntry,
+)
+from .occupancy import sweep
+from .outbox import enqueue_email, send_pending
+from .profiling import _section_times
+from .report_parts import day_parts, invalidate_report_days, load_part, save_part
+from .snapshot import MAX_MONTHS, build_snapshot, load_snapshot
+from . import warmup
+from .warmup import warm_up
+
+LOCMEM_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+LOCMEM_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'plates': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-plates'},
+}
+ZONED_LOTS = {'main': {'name': 'Main Lot', 'database': 'default', 'zones': {'A': {'TW': 100, 'FW': 50}}}}
+
+
+class FailingBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise OSError("mail server unavailable")
+
+
+class ConcurrentSenderBackend(locmem.EmailBackend):
+    """
+    Runs another send_pending while its batch is being sent
+    """
+    results = []
+
+    def send_messages(self, email_messages):
+        ConcurrentSenderBackend.results.append(send_pending())
+        return super().send_messages(email_messages)
+
+
+class CountingBackend(locmem.EmailBackend):
+    opened = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+        return True
+
+
+@override_settings(EMAIL_BACKEND=LOCMEM_BACKEND, PARKING_OUTBOX={'BACKOFF_SECONDS': 30, 'MAX_ATTEMPTS': 2})
+class OutboxTests(TestCase):
+    def test_password_reset_queues_without_sending(self):
+        User.objects.create_user('staff', 'staff@example.com', 'pw')
+        response = self.client.post(reverse('password_reset'), {'email': 'staff@example.com'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+
+        row = OutboundEmail.objects.get()
+        self.assertEqual(row.to, ['staff@example.com'])
+        self.assertNotIn('\n', row.subject)
+
+        self.assertEqual(send_pending(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['staff@example.com'])
+        row.refresh_from_db()
+        self.assertEqual(row.status, OutboundEmail.SENT)
+
+    @override_settings(PARKING_OUTBOX={'EMAIL_BACKEND': f'{__name__}.CountingBackend'})
+    def test_batch_reuses_one_connection(self):
+        CountingBackend.opened = 0
+        for i in range(3):
+            enqueue_email(f"Subject {i}", "Body", None, [f"user{i}@example.com"])
+        self.assertEqual(send_pending(batch_size=2), (2, 0))
+        self.assertEqual(CountingBackend.opened, 1)
+        self.assertEqual(send_pending(batch_size=2), (1, 0))
+        self.assertEqual(send_pending(batch_size=2), (0, 0))
+        self.assertEqual(CountingBackend.opened, 2)
+        self.assertEqual(len(mail.outbox), 3)
+
+    @override_settings(PARKING_OUTBOX={'EMAIL_BACKEND': f'{__name__}.ConcurrentSenderBackend'})
+    def test_claimed_rows_are_not_sent_by_another_worker(self):
+        ConcurrentSenderBackend.results = []
+        row = enqueue_email("Subject", "Body", None, ['user@example.com'])
+        self.assertEqual(send_pending(), (1, 0))
+        self.assertEqual(ConcurrentSenderBackend.results, [(0, 0)])
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), (OutboundEmail.SENT, 1))
+
+    def test_failure_backs_off_then_gives_up(self):
+        row = enqueue_email("Subject", "Body", None, ['user@example.com'])
+        with override_settings(PARKING_OUTBOX={'BACKOFF_SECONDS': 30, 'MAX_ATTEMPTS': 2,
+                                               'EMAIL_BACKEND': f'{__name__}.FailingBackend'}):
+            self.assertEqual(send_pending(), (0, 1))
+            row.refresh_from_db()
+            self.assertEqual(row.status, OutboundEmail.PENDING)
+            self.assertGreater(row.next_attempt_at, timezone.now() + timedelta(seconds=25))
+
+            # Not due yet
+            self.assertEqual(send_pending(), (0, 0))
+
+            OutboundEmail.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(send_pending(), (0, 1))
+            row.refresh_from_db()
+            self.assertEqual(row.status, OutboundEmail.FAILED)
+            self.assertIn("unavailable", row.last_error)
+
+
+class TemporaryPartsMixin:
+    """
+    Keep report parts written by a test class out of the configured directory
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.parts_dir = tempfile.mkdtemp()
+        cls.parts_override = override_settings(PARKING_REPORT_PARTS_DIR=cls.parts_dir)
+        cls.parts_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.parts_override.disable()
+        shutil.rmtree(cls.parts_dir, ignore_errors=True)
+
+
+@override_settings(EMAIL_BACKEND=LOCMEM_BACKEND, PARKING_LOTS=ZONED_LOTS)
+class QueryBudgetTests(TemporaryPartsMixin, TestCase):
+    """
+    Every route must stay within its budget in parking/budgets.py
+    """
+    databases = {'default', 'journal'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('staff', 'staff@example.com', 'pw', is_staff=True)
+        now = timezone.now()
+        for model, prefix, rate in ((TwoWheelerEntry, 'TW', 30), (FourWheelerEntry, 'FW', 50)):
+            sessions = []
+            for day in range(10):
+                for n in range(6):
+                    entry_time = now - timedelta(days=day, hours=n + 1)
+                    sessions.append(model(
+                        token_id=f"{prefix}{day:02d}{n:02d}",
+                        vehicle_no=f"KA01{prefix}{day:02d}{n:02d}",
+                        entry_time=entry_time,
+                        exit_time=entry_time + timedelta(minutes=50),
+                        amount=rate,
+                    ))
+            sessions.append(model(token_id=f"{prefix}OPEN", vehicle_no=f"KA02{prefix}0001", entry_time=now))
+            model.objects.bulk_create(sessions)
+        backfill_events()
+        rebuild_projections()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        slots._allocators.clear()
+
+    def route_cases(self):
+        uid = urlsafe_base64_encode(force_bytes(self.user.pk))
+        token = default_token_generator.make_token(self.user)
+        return [
+            ('homepage', 'get', {}, {}),
+            ('login_view', 'get', {}, {}),
+            ('select_lot', 'post', {}, {'lot': 'main'}),
+            ('two_wheeler_entry', 'post', {}, {'vehicle_no': 'KA03AB1234'}),
+            ('two_wheeler_exit_search', 'get', {}, {}),
+            ('two_wheeler_exit', 'get', {'token_id': 'TW0000'}, {}),
+            ('two_wheeler_exit', 'post', {'token_id': 'TWOPEN'}, {}),
+            ('four_wheeler_entry', 'post', {}, {'vehicle_no': 'KA03CD5678'}),
+            ('four_wheeler_exit_search', 'get', {}, {}),
+            ('four_wheeler_exit', 'get', {'token_id': 'FW0000'}, {}),
+            ('four_wheeler_exit', 'post', {'token_id': 'FWOPEN'}, {}),
+            ('entry_success', 'get', {'token_id': 'TW0000'}, {}),
+            ('exit_success', 'get', {'token_id': 'TW0000'}, {}),
+            ('password_reset', 'post', {}, {'email': 'staff@example.com'}),
+            ('password_reset_done', 'get', {}, {}),
+            ('password_reset_confirm', 'get', {'uidb64': uid, 'token': token}, {}),
+            ('password_reset_complete', 'get', {}, {}),
+            ('reports_analytics', 'get', {}, {}),
+            ('reports_analytics', 'get', {}, {'date_filter': '30days'}),
+            ('daily_report', 'get', {}, {}),
+            ('weekly_report', 'get', {}, {}),
+            ('monthly_report', 'get', {}, {}),
+            ('export_excel', 'get', {}, {'date_filter': '30days'}),
+            ('snapshot_analytics', 'get', {}, {}),
+            ('occupancy_timeline', 'get', {}, {'date_filter': '30days'}),
+            ('occupancy_chart', 'get', {}, {}),
+            ('session_history', 'get', {}, {'limit': 1000}),
+            ('readiness', 'get', {}, {}),
+            ('profile_list', 'get', {}, {}),
+            ('profile_download', 'get', {'profile_id': 'missing', 'kind': 'json'}, {}),
+            ('db_pool_stats', 'get', {}, {}),
+            ('logout_view', 'get', {}, {}),
+        ]
+
+    def test_every_route_has_a_budget_and_a_case(self):
+        names = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual(names - set(QUERY_BUDGETS), set())
+        self.assertEqual(names - {case[0] for case in self.route_cases()}, set())
+
+    def test_routes_within_budget(self):
+        warm_up()
+        slots.load_allocators()
+        for url_name, method, kwargs, data in self.route_cases():
+            with self.subTest(url_name=url_name, data=data):
+                url = reverse(url_name, kwargs=kwargs)
+                with query_budget(url_name):
+                    response = getattr(self.client, method)(url, data)
+                self.assertLess(response.status_code, 500)
+
+    def test_exports_read_only_the_days_without_a_stored_part(self):
+        call_command('build_report_parts', stdout=io.StringIO())
+        for url_name in ('weekly_report', 'monthly_report'):
+            with query_budget(url_name) as usage:
+                self.client.get(reverse(url_name))
+            # Today's sessions of both classes, plus session and user rows
+            self.assertLessEqual(usage.rows, 2 * 7 + 20)
+
+    def test_overrun_fails(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            with query_budget('password_reset_done'):
+                list(TwoWheelerEntry.objects.all())
+
+
+@override_settings(PARKING_LOTS={'main': {'name': 'Main Lot', 'zones': {'A': {'TW': 1}, 'B': {'TW': 1}}}})
+class SlotAllocationTests(TestCase):
+    def setUp(self):
+        slots._allocators.clear()
+        self.client.force_login(User.objects.create_user('staff', password='pw'))
+
+    def test_entry_assigns_bay_refuses_when_full_and_exit_releases(self):
+        first = self.client.post(reverse('two_wheeler_entry'), {'vehicle_no': 'KA01AA0001'})
+        self.assertIn('slot=A-001', first['Location'])
+        second = self.client.post(reverse('two_wheeler_entry'), {'vehicle_no': 'KA01AA0002'})
+        self.assertIn('slot=B-001', second['Location'])
+
+        refused = self.client.post(reverse('two_wheeler_entry'), {'vehicle_no': 'KA01AA0003'})
+        self.assertEqual(refused.status_code, 200)
+        self.assertEqual(TwoWheelerEntry.objects.count(), 2)
+
+        token = TwoWheelerEntry.objects.get(slot='A-001').token_id
+        self.client.post(reverse('two_wheeler_exit', kwargs={'token_id': token}))
+        self.assertFalse(ParkingSlot.objects.filter(token_id=token).exists())
+
+        third = self.client.post(reverse('two_wheeler_entry'), {'vehicle_no': 'KA01AA0003'})
+        self.assertIn('slot=A-001', third['Location'])
+
+    def test_workers_never_share_a_bay(self):
+        gate_a = slots.SlotAllocator('main', 'TW')
+        gate_b = slots.SlotAllocator('main', 'TW')
+        gate_a.load()
+        gate_b.load()
+
+        self.assertEqual(gate_a.allocate('TW0001'), 'A-001')
+        # gate_b's bitmap still shows A-001 free; the conditional update skips it
+        self.assertEqual(gate_b.allocate('TW0002'), 'B-001')
+        with self.assertRaises(slots.LotFull):
+            gate_a.allocate('TW0003')
+
+        gate_b.release('TW0001', 'A-001')
+        # gate_a learns about the freed bay when its bitmap runs dry
+        self.assertEqual(gate_a.allocate('TW0003'), 'A-001')
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class DuplicateEntryTests(TestCase):
+    databases = {'default', 'journal'}
+
+    def setUp(self):
+        plates.plate_cache().clear()
+        self.client.force_login(User.objects.create_user('staff', password='pw'))
+
+    def enter(self, vehicle_no):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('two_wheeler_entry'), {'vehicle_no': vehicle_no})
+
+    def test_parked_plate_is_refused_until_exit(self):
+        self.assertEqual(self.enter('KA-01 AB 1234').status_code, 302)
+        self.assertEqual(self.enter('ka01ab1234').status_code, 200)
+        self.assertEqual(TwoWheelerEntry.objects.count(), 1)
+
+        token = TwoWheelerEntry.objects.get().token_id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('two_wheeler_exit', kwargs={'token_id': token}))
+        self.assertEqual(self.enter('KA01AB1234').status_code, 302)
+        self.assertEqual(TwoWheelerEntry.objects.filter(exit_time__isnull=True).count(), 1)
+
+    def test_constraint_catches_a_cache_miss(self):
+        plates.rebuild_parked_plates('main')
+        self.enter('KA01AB1234')
+        plates.plate_cache().delete(plates._key('main', 'TW', 'KA01AB1234'))
+        response = self.enter('KA01AB1234')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(TwoWheelerEntry.objects.count(), 1)
+
+        plates.rebuild_parked_plates('main')
+        self.assertIsNotNone(plates.parked_token('TW', 'main', 'KA01AB1234'))
+
+    def test_miss_is_not_trusted_until_plates_are_loaded(self):
+        self.enter('KA01AB1234')
+        token = TwoWheelerEntry.objects.get().token_id
+        plates.plate_cache().clear()
+        self.assertEqual(plates.parked_token('TW', 'main', 'KA01AB1234'), token)
+        self.assertIsNone(plates.parked_token('TW', 'main', 'KA01AB9999'))
+
+        plates.rebuild_parked_plates('main')
+        with self.assertNumQueries(0):
+            self.assertIsNone(plates.parked_token('TW', 'main', 'KA01AB9999'))
+
+    def test_plate_cache_must_not_list_its_directory_on_writes(self):
+        self.assertEqual(check_plate_cache(None), [])
+        file_cache = {**LOCMEM_CACHE, 'plates': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/plates',
+        }}
+        for caches_setting, error in ((file_cache, 'parking.E002'), ({'default': LOCMEM_CACHE['default']}, 'parking.E001')):
+            with self.subTest(error=error), override_settings(CACHES=caches_setting):
+                self.assertEqual([problem.id for problem in check_plate_cache(None)], [error])
+
+    def test_offline_gate_duplicate_is_synced_and_flagged(self):
+        self.enter('KA01AB1234')
+        record_entry('TW', 'main', 'KA 01 AB 1234')
+        self.assertEqual(sync_journal(), {'synced': 1})
+
+        journal = GateJournalEntry.objects.get()
+        self.assertIn('already parked', journal.note)
+        self.assertEqual(TwoWheelerEntry.objects.filter(open_plate='KA01AB1234').count(), 1)
+        self.assertEqual(TwoWheelerEntry.objects.filter(exit_time__isnull=True).count(), 2)
+
+
+class ReportPartsTests(TemporaryPartsMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('staff', password='pw')
+        now = timezone.now()
+        today = timezone.localtime(now).replace(hour=9, minute=0, second=0, microsecond=0)
+        sessions = []
+        for day in range(10):
+            # An hour before the same time of day: the weekly report's
+            # 7 x 24h window holds days 0-6
+            entry_time = now - timedelta(days=day, hours=1)
+            sessions.append(TwoWheelerEntry(
+                token_id=f"TW{day:04d}", vehicle_no=f"KA01TW{day:04d}", entry_time=entry_time,
+                exit_time=entry_time + timedelta(hours=1), amount=30,
+            ))
+        # Still parked since three days ago: that day stays live
+        sessions.append(TwoWheelerEntry(
+            token_id="TWOPEN", vehicle_no="KA02TW0001", entry_time=today - timedelta(days=3),
+        ))
+        TwoWheelerEntry.objects.bulk_create(sessions)
+        FourWheelerEntry.objects.create(
+            token_id="FW0001", vehicle_no="KA01FW0001", entry_time=today - timedelta(days=2),
+            exit_time=today - timedelta(days=2) + timedelta(hours=2), amount=100,
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def weekly_report(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('weekly_report'))
+        self.assertEqual(response.status_code, 200)
+        session_queries = [q for q in queries if 'wheelerentry' in q['sql']]
+        summary = pd.read_excel(io.BytesIO(response.content), sheet_name=None)
+        return dict(zip(summary['Summary']['Metric'], summary['Summary']['Value'])), summary, session_queries
+
+    def test_closed_days_are_stored_once_and_reused(self):
+        values, sheets, _ = self.weekly_report()
+        self.assertEqual(values['Total Two Wheelers'], 8)
+        self.assertEqual(values['Total Four Wheelers'], 1)
+        self.assertEqual(float(values['Total Revenue']), 7 * 30 + 100)
+        self.assertEqual(len(sheets['Two Wheelers']), 8)
+
+        today = timezone.localdate()
+        self.assertIsNotNone(load_part('main', today - timedelta(days=1)))
+        self.assertIsNone(load_part('main', today - timedelta(days=3)))
+        self.assertIsNone(load_part('main', today))
+
+        again, _, second_queries = self.weekly_report()
+        self.assertEqual(again, {**values, 'Generated On': again['Generated On']})
+        # Today, the day with a parked vehicle and the rest of the day
+        # the window starts in: one query per class each
+        self.assertEqual(len(second_queries), 6)
+
+    def test_unreadable_part_is_rebuilt(self):
+        self.weekly_report()
+        day = timezone.localdate() - timedelta(days=1)
+        path = Path(self.parts_dir) / 'main' / f'{day.isoformat()}.json.gz'
+        self.assertIsNotNone(load_part('main', day))
+        for content in (b'', b'not gzip', gzip.compress(b'{"version": 3}'), gzip.compress(b'[1, 2]')):
+            path.write_bytes(content)
+            self.assertIsNone(load_part('main', day))
+        values, _, _ = self.weekly_report()
+        self.assertEqual(values['Total Two Wheelers'], 8)
+        self.assertIsNotNone(load_part('main', day))
+
+    def test_edit_to_a_closed_day_invalidates_its_part(self):
+        self.weekly_report()
+        entry = TwoWheelerEntry.objects.get(token_id="TW0001")
+        self.assertIsNotNone(load_part('main', timezone.localdate(entry.entry_time)))
+
+        TwoWheelerEntry.objects.filter(pk=entry.pk).update(amount=60)
+        invalidate_report_days('main', [entry.entry_time])
+        self.assertIsNone(load_part('main', timezone.localdate(entry.entry_time)))
+
+        values, _, _ = self.weekly_report()
+        self.assertEqual(float(values['Two Wheeler Revenue']), 7 * 30 + 30)
+
+
+class SessionHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('staff', password='pw')
+        start = timezone.now() - timedelta(days=2)
+        for model, prefix in ((TwoWheelerEntry, 'TW'), (FourWheelerEntry, 'FW')):
+            model.objects.bulk_create([
+                model(
+                    token_id=f"{prefix}{n:04d}", vehicle_no=f"KA01{prefix}{n:04d}",
+                    # Pairs of sessions share an entry time, within and across classes
+                    entry_time=start + timedelta(minutes=n // 2),
+                    exit_time=start + timedelta(minutes=n // 2, hours=1) if n % 3 else None,
+                    amount=30 if n % 3 else None,
+                )
+                for n in range(25)
+            ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def pull_pages(self, **params):
+        tokens, pages, cursor = [], 0, None
+        while True:
+            response = self.client.get(reverse('session_history'), {**params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            tokens += [session['token_id'] for session in body['sessions']]
+            cursor, pages = body['next_cursor'], pages + 1
+            if not body['has_more']:
+                return tokens, pages, cursor
+
+    def test_pages_cover_every_session_once_in_key_order(self):
+        tokens, pages, _ = self.pull_pages(limit=7)
+        self.assertEqual(len(tokens), 50)
+        self.assertEqual(len(set(tokens)), 50)
+        self.assertEqual(pages, 8)
+        self.assertEqual(tokens[:4], ['TW0000', 'TW0001', 'FW0000', 'FW0001'])
+
+        closed, _, _ = self.pull_pages(order='exit', limit=5)
+        self.assertEqual(len(closed), 2 * 16)
+
+    def test_cursor_picks_up_new_sessions(self):
+        _, _, cursor = self.pull_pages(**{'class': 'FW', 'status': 'open'})
+        FourWheelerEntry.objects.create(token_id="FWNEW", vehicle_no="KA09FW0001")
+        body = self.client.get(reverse('session_history'), {'class': 'FW', 'status': 'open', 'cursor': cursor}).json()
+        self.assertEqual([session['token_id'] for session in body['sessions']], ['FWNEW'])
+
+    def test_page_cost_does_not_grow_with_depth(self):
+        _, _, cursor = self.pull_pages(limit=45)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('session_history'), {'limit': 5, 'cursor': cursor})
+        session_queries = [q['sql'] for q in queries if 'wheelerentry' in q['sql']]
+        self.assertEqual(len(session_queries), 2)
+        self.assertTrue(all('LIMIT 6' in sql and 'OFFSET' not in sql for sql in session_queries))
+
+    @skipUnless(connection.vendor == 'sqlite', "reads SQLite's query plan")
+    def test_open_sessions_are_read_without_the_closed_history(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('session_history'), {'status': 'open', 'limit': 5})
+        session_queries = [q['sql'] for q in queries if 'wheelerentry' in q['sql']]
+        self.assertEqual(len(session_queries), 2)
+        for sql in session_queries:
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = ' '.join(row[-1] for row in cursor.fetchall())
+            self.assertIn('_lot_open_entry_idx (lot=? AND exit_time=?)', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_ndjson_stream_and_projection(self):
+        response = self.client.get(reverse('session_history'), {'format': 'ndjson', 'fields': 'class,token_id'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(lines), 51)
+        self.assertEqual(lines[0], {'class': 'TW', 'token_id': 'TW0000'})
+        self.assertEqual(set(lines[-1]), {'next_cursor'})
+
+        tokens, _, _ = self.pull_pages(limit=50)
+        self.assertEqual([line['token_id'] for line in lines[:-1]], tokens)
+
+    def test_bad_parameters_are_rejected(self):
+        for params in ({'cursor': 'nonsense'}, {'order': 'exit', 'status': 'open'}, {'fields': 'password'},
+                       {'since': 'yesterday'}, {'lot': 'nowhere'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(reverse('session_history'), params).status_code, 400)
+        exit_cursor = self.client.get(reverse('session_history'), {'order': 'exit', 'limit': 1}).json()['next_cursor']
+        self.assertEqual(self.client.get(reverse('session_history'), {'cursor': exit_cursor}).status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CachedAuthTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('gate', password='pw')
+        self.client.login(username='gate', password='pw')
+
+    def test_gate_requests_skip_session_and_user_queries(self):
+        self.client.get(reverse('two_wheeler_exit_search'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('two_wheeler_entry'), {'vehicle_no': 'KA05AB1234'})
+            self.client.get(response['Location'])
+        tables = ' '.join(q['sql'] for q in queries)
+        self.assertNotIn('django_session', tables)
+        self.assertNotIn('auth_user', tables)
+        # The success message rides in a cookie
+        self.assertIn('messages', response.cookies)
+
+    def test_password_change_logs_out_other_sessions(self):
+        self.client.get(reverse('two_wheeler_exit_search'))
+        self.user.set_password('changed')
+        self.user.save()
+        response = self.client.get(reverse('two_wheeler_exit_search'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('login', response['Location'])
+
+
+@override_settings(PARKING_LOTS=ZONED_LOTS)
+class OccupancyTimelineTests(TestCase):
+    def test_sweep_levels_peak_and_time_at_capacity(self):
+        # One vehicle inside from before the window until 50s; at 70s an
+        # exit and two entries share the same second
+        result = sweep(
+            np.array([10, 70, 70]), np.array([50, 70, 150]), initial=1,
+            start_ts=0, end_ts=180, capacity=2, resolution=60,
+        )
+        self.assertEqual(result['series'], [2, 2, 2])
+        self.assertEqual((result['peak'], result['peak_at']), (2, 10))
+        self.assertEqual(result['seconds_at_capacity'], 40 + 80)
+
+    def test_timeline_matches_a_brute_force_count(self):
+        user = User.objects.create_user('staff', password='pw')
+        start = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=5)
+        sessions = []
+        for n in range(40):
+            entry_time = start + timedelta(minutes=7 * n - 60)
+            exit_time = entry_time + timedelta(minutes=25 + 11 * (n % 5)) if n % 6 else None
+            sessions.append(TwoWheelerEntry(token_id=f"TW{n:04d}", vehicle_no=f"KA01TW{n:04d}",
+                                            entry_time=entry_time, exit_time=exit_time, amount=30))
+        TwoWheelerEntry.objects.bulk_create(sessions)
+        backfill_events()
+        rebuild_projections()
+
+        self.client.force_login(user)
+        timeline = self.client.get(reverse('occupancy_timeline'), {'date_filter': 'today'}).json()
+        window_start = datetime.fromisoformat(timeline['start'])
+        series = timeline['classes']['TW']['series']
+        for minute in range(0, len(series), 13):
+            moment = window_start + timedelta(minutes=minute)
+            inside = sum(1 for s in sessions if s.entry_time <= moment and (s.exit_time is None or s.exit_time > moment))
+            self.assertGreaterEqual(series[minute], inside)
+        brute_peak = max(
+            sum(1 for s in sessions if s.entry_time <= t and (s.exit_time is None or s.exit_time > t))
+            for t in [window_start] + [s.entry_time for s in sessions if s.entry_time >= window_start]
+        )
+        self.assertEqual(timeline['classes']['TW']['peak'], brute_peak)
+        self.assertEqual(timeline['classes']['TW']['capacity'], 100)
+        self.assertEqual(timeline['total']['peak'], brute_peak)
+
+        self.assertEqual(self.client.get(reverse('occupancy_timeline'), {'resolution': '7'}).status_code, 400)
+        chart = self.client.get(reverse('occupancy_chart'))
+        self.assertEqual(chart['Content-Type'], 'image/png')
+
+
+@override_settings(PARKING_LOTS={'main': {'name': 'Main Lot'}, 'annex': {'name': 'Annex'}})
+class SessionImportTests(TemporaryPartsMixin, TestCase):
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def write_csv(self, rows):
+        path = self.directory / 'legacy.csv'
+        with open(path, 'w', newline='') as handle:
+            writer = csv.writer(handle)
+            writer.writerow(['class', 'token_id', 'vehicle_no', 'phone_number', 'entry_time', 'exit_time', 'amount'])
+            writer.writerows(rows)
+        return path
+
+    def legacy_rows(self, count):
+        start = datetime(2024, 3, 1, 8, 0)
+        return [
+            ['TW' if n % 2 else 'FW', f"L{n:05d}", f"KA01L{n:05d}", '', start + timedelta(minutes=n),
+             start + timedelta(minutes=n, hours=2), '30.00']
+            for n in range(count)
+        ]
+
+    def test_csv_import_validates_and_reserves_tokens(self):
+        TwoWheelerEntry.objects.create(token_id="L00001", vehicle_no="KA09XX0001")
+        rows = self.legacy_rows(6)
+        rows[2][2] = ''                                   # no vehicle number
+        rows[3][1] = ''                                   # no token
+        rows[4][5] = rows[4][6] = ''                      # still parked
+        path = self.write_csv(rows)
+
+        call_command('import_sessions', str(path), '--batch-size', '4', '--allow-open', stdout=io.StringIO())
+
+        run = ImportRun.objects.get()
+        self.assertEqual((run.position, run.imported, run.rejected, run.retokened), (6, 5, 1, 2))
+        self.assertIsNotNone(run.finished_at)
+        self.assertEqual(TwoWheelerEntry.objects.filter(vehicle_no__startswith='KA01L').count(), 3)
+        # L00001 was taken in the lot, so that row got a fresh token
+        self.assertFalse(TwoWheelerEntry.objects.filter(vehicle_no='KA01L00001', token_id='L00001').exists())
+        self.assertEqual(FourWheelerEntry.objects.get(vehicle_no='KA01L00004').open_plate, 'KA01L00004')
+        self.assertEqual(ParkingEvent.objects.count(), 5 + 4)
+        with open(str(path) + '.rejects.csv') as handle:
+            self.assertIn('vehicle_no is missing', handle.read())
+
+    def test_open_rows_and_odd_amounts(self):
+        rows = self.legacy_rows(4)
+        rows[0][6] = '0.00'                               # free session
+        rows[1][6] = 'NaN'
+        rows[2][5] = rows[2][6] = ''                      # still parked
+        path = self.write_csv(rows)
+
+        out = io.StringIO()
+        call_command('import_sessions', str(path), stdout=out)
+
+        run = ImportRun.objects.get()
+        self.assertEqual((run.imported, run.rejected), (2, 2))
+        self.assertEqual(FourWheelerEntry.objects.get(token_id='L00000').amount, Decimal('0.00'))
+        self.assertFalse(FourWheelerEntry.objects.filter(exit_time__isnull=True).exists())
+        self.assertIn('1 rows have no exit time', out.getvalue())
+        with open(str(path) + '.rejects.csv') as handle:
+            reasons = handle.read()
+        self.assertIn('amount is not a number', reasons)
+        self.assertIn('session is still open', reasons)
+
+        # The rejects file loads the open session once it is allowed
+        call_command('import_sessions', str(path) + '.rejects.csv', '--allow-open', stdout=io.StringIO())
+        self.assertEqual(FourWheelerEntry.objects.get(exit_time__isnull=True).vehicle_no, 'KA01L00002')
+
+    def test_part_rebuilt_before_the_commit_is_dropped(self):
+        day = timezone.localdate() - timedelta(days=3)
+        entry_time = timezone.make_aware(datetime.combine(day, datetime.min.time())) + timedelta(hours=9)
+        TwoWheelerEntry.objects.create(token_id="TW0001", vehicle_no="KA01AA0001", entry_time=entry_time,
+                                       exit_time=entry_time + timedelta(hours=1), amount=30)
+        stale = day_parts('main', day, day)[0][0]
+        path = self.write_csv([['TW', 'L00001', 'KA01L00001', '', entry_time.replace(tzinfo=None),
+                                (entry_time + timedelta(hours=2)).replace(tzinfo=None), '60.00']])
+        save = ImportRun.save
+
+        def racing_save(run, *args, **kwargs):
+            # A report that read the day before the import commits
+            save_part('main', stale)
+            return save(run, *args, **kwargs)
+
+        with mock.patch.object(ImportRun, 'save', racing_save), self.captureOnCommitCallbacks(execute=True):
+            call_command('import_sessions', str(path), stdout=io.StringIO())
+        self.assertIsNone(load_part('main', day))
+        self.assertEqual(day_parts('main', day, day)[0][0]['summary']['TW']['sessions'], 2)
+
+    def test_failed_run_resumes_after_last_committed_batch(self):
+        path = self.write_csv(self.legacy_rows(10))
+        load = SessionImporter.load
+        calls = []
+
+        def failing_load(importer, batch):
+            calls.append(batch)
+            if len(calls) == 2:
+                raise RuntimeError("connection lost")
+            return load(importer, batch)
+
+        with mock.patch.object(SessionImporter, 'load', failing_load):
+            with self.assertRaises(RuntimeError):
+                call_command('import_sessions', str(path), '--batch-size', '4', '--drop-indexes', stdout=io.StringIO())
+        self.assertEqual(ImportRun.objects.get().position, 4)
+        self.assertEqual(TwoWheelerEntry.objects.count() + FourWheelerEntry.objects.count(), 4)
+
+        out = io.StringIO()
+        call_command('import_sessions', str(path), '--batch-size', '4', stdout=out)
+        self.assertIn('Resuming', out.getvalue())
+        self.assertEqual(TwoWheelerEntry.objects.count() + FourWheelerEntry.objects.count(), 10)
+        call_command('import_sessions', str(path), stdout=out)
+        self.assertIn('already imported', out.getvalue())
+        self.assertEqual(TwoWheelerEntry.objects.count() + FourWheelerEntry.objects.count(), 10)
+
+    def test_excel_report_round_trips_into_another_lot(self):
+        user = User.objects.create_user('staff', password='pw')
+        now = timezone.now().replace(microsecond=0)
+        for n in range(3):
+            TwoWheelerEntry.objects.create(token_id=f"TW{n:04d}", vehicle_no=f"KA01TW{n:04d}",
+                                           entry_time=now - timedelta(hours=n + 2), exit_time=now - timedelta(hours=1),
+                                           amount=30)
+        FourWheelerEntry.objects.create(token_id="FW0001", vehicle_no="KA01FW0001", entry_time=now - timedelta(hours=1))
+        self.client.force_login(user)
+        path = self.directory / 'report.xlsx'
+        path.write_bytes(self.client.get(reverse('weekly_report')).content)
+
+        call_command('import_sessions', str(path), '--lot', 'annex', '--allow-open', stdout=io.StringIO())
+
+        self.assertEqual(TwoWheelerEntry.objects.filter(lot='annex').count(), 3)
+        imported = FourWheelerEntry.objects.get(lot='annex')
+        self.assertEqual((imported.token_id, imported.exit_time), ("FW0001", None))
+        original = TwoWheelerEntry.objects.get(lot='main', token_id="TW0001")
+        copy = TwoWheelerEntry.objects.get(lot='annex', token_id="TW0001")
+        self.assertEqual((copy.entry_time, copy.amount), (original.entry_time, original.amount))
+
+
+class PooledConnectionTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.addCleanup(close_pools)
+        self.handler = ConnectionHandler({'default': {'ENGINE': 'django.db.backends.sqlite3'}, 'pooled': {
+            'ENGINE': 'parking.db.sqlite3',
+            'NAME': str(Path(directory) / 'pooled.sqlite3'),
+            'OPTIONS': {'pool': {'min_size': 1, 'max_size': 2, 'timeout': 0.5, 'check_after': 0}},
+        }})
+
+    def wrapper(self):
+        wrapper = self.handler.create_connection('pooled')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def query(self, wrapper):
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return wrapper.connection
+
+    def test_connections_are_shared_and_bounded(self):
+        first, second, third = self.wrapper(), self.wrapper(), self.wrapper()
+        raw = self.query(first)
+        first.close()
+        self.assertIs(self.query(second), raw)
+        self.query(first)
+        with self.assertRaises(OperationalError):
+            self.query(third)
+
+        third.inc_thread_sharing()
+        waiter = threading.Thread(target=self.query, args=(third,))
+        waiter.start()
+        while not first.pool.stats()['waiting']:
+            time.sleep(0.001)
+        first.close()
+        waiter.join()
+
+        stats = first.pool.stats()
+        self.assertEqual((stats['connects'], stats['checkouts'], stats['reused']), (2, 4, 2))
+        self.assertEqual((stats['in_use'], stats['peak_in_use'], stats['timeouts']), (2, 2, 1))
+        self.assertEqual(stats['waits'], 1)
+
+    def test_broken_and_in_transaction_connections_are_replaced(self):
+        wrapper = self.wrapper()
+        raw = self.query(wrapper)
+        wrapper.close()
+        raw.close()                                        # dropped by the server while idle
+        replacement = self.query(wrapper)
+        self.assertIsNot(replacement, raw)
+        with mock.patch('django.db.transaction.get_connection', return_value=wrapper):
+            with transaction.atomic(using='pooled'):
+                self.query(wrapper)
+                wrapper.close()                            # e.g. a worker shutting down mid-request
+        self.assertNotEqual(self.query(wrapper), replacement)
+
+        stats = wrapper.pool.stats()
+        self.assertEqual((stats['connects'], stats['failed_checks'], stats['discarded']), (3, 1, 2))
+
+    def test_pool_needs_per_request_connections(self):
+        self.handler.settings['pooled']['CONN_MAX_AGE'] = 60
+        with self.assertRaises(ImproperlyConfigured):
+            self.query(self.wrapper())
+        self.client.force_login(User.objects.create_user('admin', password='pw', is_staff=True))
+        self.assertEqual(self.client.get(reverse('db_pool_stats')).json()['pools'], [])
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('root', password='pw'))
+
+    def test_changelist_filters_do_not_scan_the_table(self):
+        now = timezone.now()
+        TwoWheelerEntry.objects.create(token_id="TW0001", vehicle_no="KA01AA0001", entry_time=now)
+        TwoWheelerEntry.objects.create(token_id="TW0002", vehicle_no="KA01AA0002",
+                                       entry_time=now - timedelta(days=40))
+        url = reverse('admin:parking_twowheelerentry_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query['sql'] for query in queries if 'DISTINCT' in query['sql'].upper()])
+
+        response = self.client.get(url, {'lot': 'main', 'entered': '7days'})
+        self.assertEqual([entry.token_id for entry in response.context['cl'].result_list], ["TW0001"])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('admin:parking_parkingevent_changelist'))
+        self.assertFalse([query['sql'] for query in queries if 'DISTINCT' in query['sql'].upper()])
+
+    def test_entry_time_drill_down_and_bounded_pages(self):
+        old = timezone.make_aware(datetime(2024, 3, 5, 10, 0))
+        TwoWheelerEntry.objects.create(token_id="TW0001", vehicle_no="KA01AA0001", entry_time=old)
+        TwoWheelerEntry.objects.create(token_id="TW0002", vehicle_no="KA01AA0002", entry_time=timezone.now())
+        url = reverse('admin:parking_twowheelerentry_changelist')
+
+        def drill(value):
+            response = self.client.get(url, {'entered': value})
+            choices = [choice['display'] for choice in response.context['cl'].filter_specs[2].choices(response.context['cl'])]
+            return [entry.token_id for entry in response.context['cl'].result_list], choices
+
+        tokens, choices = drill('2024')
+        self.assertEqual(tokens, ["TW0001"])
+        self.assertIn('Mar 2024', choices)
+        self.assertIn(str(timezone.localdate().year), choices)
+        tokens, choices = drill('2024-03')
+        self.assertEqual(tokens, ["TW0001"])
+        # Days start at the first entry
+        self.assertEqual(choices[-1], '05 Mar 2024')
+        self.assertNotIn('04 Mar 2024', choices)
+        self.assertEqual(drill('2024-03-04')[0], [])
+        self.assertIn('e=1', self.client.get(url, {'entered': '2024-13'})['Location'])
+
+        with mock.patch.object(EstimatedCountPaginator, 'MAX_PAGES', 1), \
+                mock.patch.object(admin.site._registry[TwoWheelerEntry], 'list_per_page', 1):
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertIn('e=1', self.client.get(url, {'p': 2})['Location'])
+
+
+GATE_NODE = {'ENABLED': True, 'NODE_ID': '07'}
+
+
+@override_settings(CACHES=LOCMEM_CACHE, PARKING_GATE_NODE=GATE_NODE)
+class GateJournalSyncTests(TestCase):
+    databases = {'default', 'journal'}
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('staff', password='pw'))
+
+    def test_node_sessions_reach_the_central_database_once(self):
+        response = self.client.post(reverse('two_wheeler_entry'), {'vehicle_no': 'KA01AB1234'})
+        token = GateJournalEntry.objects.get().token_id
+        self.assertRedirects(response, reverse('entry_success', kwargs={'token_id': token}),
+                             fetch_redirect_response=False)
+        self.assertTrue(token.startswith('TW-07'))
+        self.assertFalse(TwoWheelerEntry.objects.exists())
+        self.client.post(reverse('two_wheeler_exit', kwargs={'token_id': token}))
+
+        self.assertEqual(sync_journal(batch_size=1), {'synced': 2})
+        session = TwoWheelerEntry.objects.get(token_id=token)
+        self.assertIsNotNone(session.exit_time)
+        self.assertIsNone(session.open_plate)
+        self.assertEqual(list(ParkingEvent.objects.filter(token_id=token).values_list('kind', flat=True)),
+                         ['entry', 'exit'])
+
+        # A run that failed after the central commit is recognised on retry
+        GateJournalEntry.objects.update(status=GateJournalEntry.PENDING)
+        self.assertEqual(sync_journal(), {'synced': 2})
+        self.assertEqual(set(GateJournalEntry.objects.values_list('note', flat=True)), {'already applied'})
+        self.assertEqual(TwoWheelerEntry.objects.count(), 1)
+        self.assertEqual(ParkingEvent.objects.count(), 2)
+
+    def test_node_id_is_checked_at_start_up(self):
+        self.assertEqual(check_gate_node_id(None), [])
+        for node_id in ('1', '012', 'a1', '0-', 7, None):
+            with self.subTest(node_id=node_id), override_settings(PARKING_GATE_NODE={**GATE_NODE, 'NODE_ID': node_id}):
+                self.assertEqual([problem.id for problem in check_gate_node_id(None)], ['parking.E003'])
+        with override_settings(PARKING_GATE_NODE={'ENABLED': False, 'NODE_ID': 'nope'}):
+            self.assertEqual(check_gate_node_id(None), [])
+
+    def test_conflicts_are_flagged_and_unknown_entries_wait(self):
+        now = timezone.now()
+        central = TwoWheelerEntry.objects.create(token_id="TW-070001", vehicle_no="KA01CC0001",
+                                                 entry_time=now - timedelta(hours=2))
+        closed = TwoWheelerEntry.objects.create(token_id="TW0002", vehicle_no="KA01CC0002",
+                                                entry_time=now - timedelta(hours=2), exit_time=now, amount=60)
+        GateJournalEntry.objects.create(kind=GateJournalEntry.ENTRY, vehicle_class='TW', token_id=central.token_id,
+                                        vehicle_no="KA01DD0001", entry_time=now)
+        GateJournalEntry.objects.create(kind=GateJournalEntry.EXIT, vehicle_class='TW', token_id=closed.token_id,
+                                        vehicle_no=closed.vehicle_no, entry_time=closed.entry_time,
+                                        exit_time=now - timedelta(minutes=5), amount=60)
+        GateJournalEntry.objects.create(kind=GateJournalEntry.EXIT, vehicle_class='TW', token_id="TW-080001",
+                                        vehicle_no="KA01EE0001", entry_time=now - timedelta(hours=1),
+                                        exit_time=now, amount=30)
+
+        self.assertEqual(sync_journal(), {'conflict': 2, 'pending': 1})
+        notes = dict(GateJournalEntry.objects.values_list('token_id', 'note'))
+        self.assertIn('token already used centrally', notes[central.token_id])
+        self.assertIn('already exited centrally', notes[closed.token_id])
+        self.assertIn('waiting for entry', notes["TW-080001"])
+        closed.refresh_from_db()
+        self.assertEqual(closed.exit_time, now)
+
+    @override_settings(PARKING_LOTS={'main': {'name': 'Main Lot', 'zones': {'A': {'TW': 1}}}})
+    def test_synced_sessions_take_and_free_bays(self):
+        slots._allocators.clear()
+        self.addCleanup(slots._allocators.clear)
+        central = TwoWheelerEntry.objects.create(token_id="TW0001", vehicle_no="KA01CC0001",
+                                                 slot=slots.allocate_slot('main', 'TW', "TW0001"))
+        record_exit('TW', central, timezone.now(), 30)
+        self.assertEqual(sync_journal(), {'synced': 1})
+        self.assertFalse(ParkingSlot.objects.filter(token_id__isnull=False).exists())
+
+        first = record_entry('TW', 'main', 'KA01DD0001')
+        second = record_entry('TW', 'main', 'KA01DD0002')
+        self.assertEqual(sync_journal(), {'synced': 1, 'conflict': 1})
+        self.assertEqual(TwoWheelerEntry.objects.get(token_id=first.token_id).slot, 'A-001')
+        self.assertEqual(ParkingSlot.objects.get(token_id__isnull=False).token_id, first.token_id)
+        second.refresh_from_db()
+        self.assertEqual(second.note, 'no free bay in the lot')
+
+
+TWO_LOTS = {'main': {'name': 'Main Lot'}, 'annex': {'name': 'Annex', 'database': 'default'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE, PARKING_LOTS=TWO_LOTS)
+class LotRoutingTests(TestCase):
+    databases = {'default', 'journal'}
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('staff', password='pw'))
+
+    def select(self, lot):
+        return self.client.post(reverse('select_lot'), {'lot': lot})
+
+    def test_terminal_works_on_the_selected_lot_only(self):
+        self.select('annex')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('two_wheeler_entry'), {'vehicle_no': 'KA01AB1234'})
+        entry = TwoWheelerEntry.objects.get()
+        self.assertEqual(entry.lot, 'annex')
+        self.assertEqual(self.client.get(reverse('homepage')).context['two_wheeler_count'], 1)
+
+        self.select('main')
+        self.assertEqual(self.client.get(reverse('homepage')).context['two_wheeler_count'], 0)
+        self.client.post(reverse('two_wheeler_exit', kwargs={'token_id': entry.token_id}))
+        entry.refresh_from_db()
+        self.assertIsNone(entry.exit_time)
+
+        self.select('nowhere')
+        self.assertEqual(self.client.get(reverse('homepage')).context['lot'], 'main')
+
+    def test_lot_sessions_use_the_lot_database(self):
+        with override_settings(PARKING_LOTS={**TWO_LOTS, 'annex': {'name': 'Annex', 'database': 'annexdb'}}):
+            self.assertEqual(lot_entries(TwoWheelerEntry, 'annex').db, 'annexdb')
+            self.assertEqual(lot_entries(TwoWheelerEntry, 'main').db, 'default')
+            self.assertEqual(lot_database('unknown'), 'default')
+
+    @override_settings(PARKING_LOTS={**TWO_LOTS, 'annex': {'name': 'Annex', 'database': 'journal'}})
+    def test_admin_reads_and_writes_the_lot_database(self):
+        # Any second alias will do; give it the session and event tables
+        editor = _editor('annex')
+        editor.create_model(TwoWheelerEntry)
+        editor.create_model(ParkingEvent)
+        entry = TwoWheelerEntry.objects.using('journal').create(
+            lot='annex', token_id="TW0001", vehicle_no="KA01AN0001", entry_time=timezone.now() - timedelta(hours=2),
+        )
+        self.client.force_login(User.objects.create_superuser('root', password='pw'))
+        changelist = reverse('admin:parking_twowheelerentry_changelist')
+        response = self.client.get(changelist, {'lot': 'annex'})
+        self.assertEqual([row.token_id for row in response.context['cl'].result_list], ["TW0001"])
+        self.assertEqual(list(self.client.get(changelist).context['cl'].result_list), [])
+
+        filters = '?' + urlencode({'_changelist_filters': 'lot=annex'})
+        change = reverse('admin:parking_twowheelerentry_change', args=[entry.pk]) + filters
+        self.assertEqual(self.client.get(change).status_code, 200)
+        exit_time = timezone.localtime()
+        response = self.client.post(change, {
+            'vehicle_no': entry.vehicle_no, 'phone_number': '',
+            'exit_time_0': exit_time.strftime('%Y-%m-%d'), 'exit_time_1': exit_time.strftime('%H:%M:%S'),
+            'amount': '60.00',
+        })
+        self.assertEqual(response.status_code, 302)
+        entry.refresh_from_db()
+        self.assertEqual(entry.amount, Decimal('60.00'))
+        self.assertEqual(ParkingEvent.objects.using('journal').get().kind, ParkingEvent.EXIT)
+
+        self.client.post(reverse('admin:parking_twowheelerentry_delete', args=[entry.pk]) + filters, {'post': 'yes'})
+        self.assertFalse(TwoWheelerEntry.objects.using('journal').exists())
+        self.assertFalse(ParkingEvent.objects.exists())
+
+
+def projection_state():
+    return (
+        sorted(OccupancyProjection.objects.filter(parked__gt=0).values_list('lot', 'vehicle_class', 'parked')),
+        sorted(HourlyRollup.objects.exclude(entries=0, exits=0, revenue=0)
+               .values_list('lot', 'vehicle_class', 'hour', 'entries', 'exits', 'revenue')),
+        sorted(OpenSession.objects.values_list('lot', 'vehicle_class', 'token_id')),
+    )
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class EventProjectionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('staff', password='pw'))
+
+    def test_consumed_projections_equal_a_full_replay(self):
+        tokens = []
+        for n in range(4):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('two_wheeler_entry'), {'vehicle_no': f'KA01AB{n:04d}'})
+            tokens.append(TwoWheelerEntry.objects.latest('id').token_id)
+            apply_pending()
+        for token in tokens[:2]:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('two_wheeler_exit', kwargs={'token_id': token}))
+        apply_pending()
+
+        live = projection_state()
+        self.assertEqual(live[0], [('main', 'TW', 2)])
+        self.assertEqual([token for _, _, token in live[2]], sorted(tokens[2:]))
+        rebuild_projections()
+        self.assertEqual(projection_state(), live)
+
+    def test_dashboards_fold_a_bounded_backlog(self):
+        for n in range(5):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('two_wheeler_entry'), {'vehicle_no': f'KA01AB{n:04d}'})
+        with mock.patch('parking.events.REQUEST_FOLD_LIMIT', 2):
+            self.client.get(reverse('homepage'))
+        self.assertEqual(OpenSession.objects.count(), 2)
+        self.assertEqual(apply_pending(), 3)
+
+    def test_a_consumer_that_loses_the_checkpoint_insert_locks_the_winner(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('two_wheeler_entry'), {'vehicle_no': 'KA01AB0001'})
+        first = QuerySet.first
+        calls = []
+
+        def racing_first(queryset):
+            # The first lookup misses a row another consumer inserts right after
+            calls.append(queryset.model)
+            return None if len(calls) == 1 else first(queryset)
+
+        with mock.patch.object(QuerySet, 'first', racing_first):
+            self.assertEqual(apply_pending(), 1)
+        self.assertEqual(ProjectionCheckpoint.objects.get().last_event_id, ParkingEvent.objects.get().id)
+
+    @override_settings(PARKING_LOTS=ZONED_LOTS)
+    def test_admin_changes_are_recorded_as_events(self):
+        slots._allocators.clear()
+        tokens = []
+        for n in range(3):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('two_wheeler_entry'), {'vehicle_no': f'KA01AB{n:04d}'})
+            tokens.append(TwoWheelerEntry.objects.latest('id').token_id)
+        apply_pending()
+        self.client.force_login(User.objects.create_superuser('root', password='pw'))
+        self.assertEqual(self.client.get(reverse('admin:parking_twowheelerentry_add')).status_code, 403)
+
+        closed = TwoWheelerEntry.objects.get(token_id=tokens[0])
+        exit_time = timezone.localtime(closed.entry_time + timedelta(hours=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('admin:parking_twowheelerentry_change', args=[closed.pk]), {
+                'vehicle_no': closed.vehicle_no, 'phone_number': '',
+                'exit_time_0': exit_time.strftime('%Y-%m-%d'), 'exit_time_1': exit_time.strftime('%H:%M:%S'),
+                'amount': '30.00',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(ParkingEvent.objects.filter(kind=ParkingEvent.EXIT).count(), 1)
+
+        deleted = TwoWheelerEntry.objects.get(token_id=tokens[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:parking_twowheelerentry_delete', args=[deleted.pk]), {'post': 'yes'})
+            self.client.post(reverse('admin:parking_twowheelerentry_changelist'), {
+                'action': 'delete_selected', '_selected_action': [closed.pk], 'post': 'yes',
+            })
+        self.assertEqual(ParkingEvent.objects.filter(kind=ParkingEvent.VOID).count(), 2)
+        self.assertIsNone(plates.parked_token('TW', 'main', deleted.open_plate))
+        self.assertEqual(list(ParkingSlot.objects.exclude(token_id=None).values_list('token_id', flat=True)),
+                         [tokens[2]])
+
+        apply_pending()
+        live = projection_state()
+        self.assertEqual(live[0], [('main', 'TW', 1)])
+        self.assertEqual([(entries, exits, revenue) for *_, entries, exits, revenue in live[1]],
+                         [(1, 0, Decimal('0'))])
+        self.assertEqual([token for _, _, token in live[2]], [tokens[2]])
+        rebuild_projections()
+        self.assertEqual(projection_state(), live)
+
+    def test_event_committed_late_into_a_gap_is_applied(self):
+        now = timezone.now()
+        def event(pk, token):
+            return ParkingEvent(id=pk, lot='main', vehicle_class='TW', kind=ParkingEvent.ENTRY, token_id=token,
+                                occurred_at=now, recorded_at=now - timedelta(minutes=10))
+
+        ParkingEvent.objects.bulk_create([event(1, "TW0001"), event(3, "TW0003")])
+        self.assertEqual(apply_pending(), 2)
+        self.assertEqual([gap[:2] for gap in ProjectionCheckpoint.objects.get().gaps], [[2, 2]])
+
+        # A transaction that stayed open for minutes commits id 2
+        ParkingEvent.objects.bulk_create([event(2, "TW0002")])
+        self.assertEqual(apply_pending(), 1)
+        self.assertEqual(parked_counts('main')['TW'], 3)
+        self.assertEqual(ProjectionCheckpoint.objects.get().gaps, [])
+
+        ParkingEvent.objects.bulk_create([event(5, "TW0005")])
+        apply_pending()
+        with mock.patch('parking.events.time.time', return_value=time.time() + 7 * 3600):
+            apply_pending()
+        self.assertEqual(ProjectionCheckpoint.objects.get().gaps, [])
+
+
+def snapshot_rows(lot='main'):
+    columns = load_snapshot(lot)
+    return list(zip(*(columns[name].tolist() for name in ('exit_ts', 'entry_ts', 'vehicle_class', 'amount'))))
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        override = override_settings(PARKING_SNAPSHOT_DIR=directory)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.now = timezone.now().replace(microsecond=0)
+
+    def closed_session(self, token, exit_time, amount='30.00'):
+        entry = TwoWheelerEntry.objects.create(
+            token_id=token, vehicle_no=f'KA01{token}', entry_time=exit_time - timedelta(hours=2),
+            exit_time=exit_time, amount=Decimal(amount),
+        )
+        record_event(exit_event('TW', entry))
+        return entry
+
+    def test_build_appends_sessions_closed_since_the_watermark(self):
+        self.closed_session("TW0001", self.now - timedelta(days=3))
+        self.closed_session("TW0002", self.now - timedelta(days=2))
+        self.assertEqual(build_snapshot('main'), 2)
+        self.assertEqual(build_snapshot('main'), 0)
+
+        self.closed_session("TW0003", self.now - timedelta(hours=1))
+        self.assertEqual(build_snapshot('main'), 1)
+        appended = snapshot_rows()
+        self.assertEqual([row[0] for row in appended], sorted(row[0] for row in appended))
+        self.assertEqual(build_snapshot('main', rebuild=True), 3)
+        self.assertEqual(snapshot_rows(), appended)
+
+    def test_late_events_rewind_the_snapshot(self):
+        corrected = self.closed_session("TW0001", self.now - timedelta(days=3))
+        voided = self.closed_session("TW0002", self.now - timedelta(days=1))
+        self.assertEqual(build_snapshot('main'), 2)
+
+        # A gate journal sync, an admin correction and an admin deletion,
+        # all behind the watermark
+        self.closed_session("TW0003", self.now - timedelta(days=2), '45.00')
+        previous = corrected.amount
+        corrected.amount = Decimal('50.00')
+        corrected.save()
+        record_event(correction_event('TW', corrected, previous))
+        voided.delete()
+        record_event(void_event('TW', voided))
+
+        build_snapshot('main')
+        rows = snapshot_rows()
+        self.assertEqual([amount for *_, amount in rows], [5000, 4500])
+        build_snapshot('main', rebuild=True)
+        self.assertEqual(snapshot_rows(), rows)
+
+    def test_analytics_months_are_checked_and_capped(self):
+        self.client.force_login(User.objects.create_user('staff', password='pw'))
+        self.closed_session('TW0001', self.now - timedelta(days=2))
+        build_snapshot('main')
+        url = reverse('snapshot_analytics')
+        for months in ('soon', '1.5', ''):
+            with self.subTest(months=months):
+                self.assertEqual(self.client.get(url, {'months': months}).status_code, 400)
+        body = self.client.get(url, {'months': '100000000'}).json()
+        span = datetime.fromisoformat(body['end']) - datetime.fromisoformat(body['start'])
+        self.assertEqual(span, timedelta(days=30 * MAX_MONTHS))
+        self.assertEqual(body['sessions'], 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ConditionalGetTests(TestCase):
+    databases = {'default', 'journal'}
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('staff', password='pw'))
+
+    def test_unchanged_dashboard_is_answered_with_304_until_a_write(self):
+        url = reverse('homepage')
+        first = self.client.get(url)['ETag']
+        # The first page set the CSRF cookie its forms carry
+        etag = self.client.get(url, HTTP_IF_NONE_MATCH=first)['ETag']
+        self.assertNotEqual(etag, first)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('two_wheeler_entry'), {'vehicle_no': 'KA01AB1234'})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_changes_with_the_csrf_token(self):
+        url = reverse('homepage')
+        self.client.get(url)
+        etag = self.client.get(url)['ETag']
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'x' * 32
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(PARKING_ADMISSION={'MAX_BACKGROUND': 1, 'QUEUE_TIMEOUT': 0, 'MIN_GATE_SAMPLES': 20})
+class AdmissionControlTests(TestCase):
+    def setUp(self):
+        self.middleware = AdmissionControlMiddleware(lambda request: HttpResponse('ok'))
+        self.report = RequestFactory().get(reverse('reports_analytics'))
+
+    def gate_requests(self, count, seconds):
+        now = time.monotonic()
+        self.middleware.gate_latencies.extend((now, seconds) for _ in range(count))
+
+    def test_slow_gates_shed_reports_once_there_are_enough_samples(self):
+        self.gate_requests(19, 2.0)
+        self.assertEqual(self.middleware(self.report).status_code, 200)
+
+        self.gate_requests(1, 2.0)
+        response = self.middleware(self.report)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '10')
+
+    def test_reports_over_the_concurrency_limit_are_shed(self):
+        self.gate_requests(50, 0.05)
+        self.middleware.slots.acquire()
+        self.assertEqual(self.middleware(self.report).status_code, 503)
+        self.middleware.slots.release()
+        self.assertEqual(self.middleware(self.report).status_code, 200)
+        self.assertEqual(self.middleware(RequestFactory().get(reverse('homepage'))).status_code, 200)
+
+    def test_session_history_streams_hold_a_background_slot(self):
+        self.gate_requests(50, 0.05)
+        middleware = AdmissionControlMiddleware(lambda request: StreamingHttpResponse(iter([b'{}\n'])))
+        history = RequestFactory().get(reverse('session_history'), {'format': 'ndjson'})
+        stream = middleware(history)
+        self.assertEqual(b''.join(stream.streaming_content), b'{}\n')
+        self.assertEqual(middleware(history).status_code, 503)
+        stream.close()
+        self.assertEqual(middleware(history).status_code, 200)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        override = override_settings(PARKING_PROFILING={'DIR': self.directory, 'MAX_PROFILES': 2})
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_staff_request_is_profiled_into_the_ring(self):
+        self.client.force_login(User.objects.create_user('clerk', password='pw'))
+        response = self.client.get(reverse('reports_analytics'), {'_profile': '1'})
+        self.assertNotIn('X-Parking-Profile-Id', response)
+
+        self.client.force_login(User.objects.create_user('staff', password='pw', is_staff=True))
+        for _ in range(3):
+            response = self.client.get(reverse('reports_analytics'), HTTP_X_PARKING_PROFILE='1')
+        profile_id = response['X-Parking-Profile-Id']
+        summary = json.loads((Path(self.directory) / f'{profile_id}.json').read_text())
+        self.assertEqual(summary['url_name'], 'reports_analytics')
+        self.assertGreater(summary['queries'], 0)
+        self.assertEqual(set(summary['sections_ms']), {'matplotlib', 'pandas', 'numpy', 'orm'})
+        self.assertEqual(len(list(Path(self.directory).glob('*.json'))), 2)
+
+    def test_section_time_includes_c_functions(self):
+        values = np.random.rand(2_000_000)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        np.sort(values)
+        profiler.disable()
+        stats = pstats.Stats(profiler)
+        # The sort itself is a C method with no numpy filename
+        self.assertGreater(_section_times(stats)['numpy'], 0.8 * stats.total_tt)
+
+
+LOADTEST_SCENARIO = {
+    'name': 'smoke', 'seed': 1, 'duration_seconds': 1.5,
+    # One gate: the in-memory SQLite test database locks on concurrent writes
+    'gates': {'count': 1, 'vehicle_mix': {'TW': 0.5, 'FW': 0.5}, 'dwell_seconds': [0, 0.05],
+              'think_seconds': [0, 0.05]},
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class LoadTestCommandTests(LiveServerTestCase):
+    def setUp(self):
+        User.objects.create_user('gate', password='pw')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.scenario = Path(directory) / 'smoke.json'
+        self.scenario.write_text(json.dumps(LOADTEST_SCENARIO))
+        self.output = Path(directory) / 'results.json'
+
+    def run_loadtest(self):
+        call_command('loadtest', str(self.scenario), base_url=self.live_server_url, username='gate',
+                     password='pw', output=str(self.output), stdout=io.StringIO())
+        return {row['url_name']: row for row in json.loads(self.output.read_text())['results']}
+
+    def test_repeated_runs_complete_gate_cycles_without_errors(self):
+        for _ in range(2):
+            results = self.run_loadtest()
+            entries = results['two_wheeler_entry']['requests'] + results['four_wheeler_entry']['requests']
+            self.assertGreater(entries, 0)
+            self.assertEqual(sum(row['errors'] for row in results.values()), 0, results)
+        vehicles = [*TwoWheelerEntry.objects.values_list('vehicle_no', flat=True),
+                    *FourWheelerEntry.objects.values_list('vehicle_no', flat=True)]
+        self.assertEqual(len({vehicle_no[:6] for vehicle_no in vehicles}), 2)  # one nonce per run
+
+    def test_refused_entry_counts_as_an_error(self):
+        results = LoadTestResults()
+        results.record('two_wheeler_entry', 0.01, 302, expected=302)
+        results.record('two_wheeler_entry', 0.01, 200, expected=302)
+        results.record('homepage', 0.01, 200)
+        errors = {row['url_name']: row['errors'] for row in results.summary(1.0)}
+        self.assertEqual(errors, {'two_wheeler_entry': 1, 'homepage': 0})
+
+
+class FlakyStep:
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise OperationalError("database is starting up")
+        return 'ok'
+
+
+@override_settings(PARKING_WARMUP={'ATTEMPTS': 2, 'RETRY_DELAY': 0, 'RECHECK_SECONDS': 0})
+class WarmupTests(TestCase):
+    def setUp(self):
+        saved = {**warmup.WARMUP_STATE, 'steps': dict(warmup.WARMUP_STATE['steps'])}
+        self.addCleanup(warmup.WARMUP_STATE.update, saved)
+        warmup.WARMUP_STATE.update(status='pending', rechecks=0, recheck_at=None, steps={})
+        logger = mock.patch.object(warmup, 'logger')  # the failures are expected
+        logger.start()
+        self.addCleanup(logger.stop)
+
+    def warm(self, **steps):
+        with mock.patch.object(warmup, 'STEPS', list(steps.items())):
+            warm_up()
+            return self.client.get(reverse('readiness'))
+
+    def test_transient_failure_is_retried(self):
+        databases = FlakyStep(failures=1)
+        response = self.warm(databases=databases)
+        self.assertEqual(response.json()['status'], 'ready')
+        self.assertEqual(response.json()['steps']['databases']['attempts'], 2)
+
+    def test_optional_step_failure_degrades(self):
+        response = self.warm(matplotlib=FlakyStep(failures=5), databases=FlakyStep(failures=0))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'degraded')
+
+    def test_failed_warm_up_is_rechecked_until_it_passes(self):
+        databases = FlakyStep(failures=3)
+        with mock.patch.object(warmup, 'STEPS', [('databases', databases)]):
+            warm_up()
+            self.assertEqual(warmup.warmup_status()['status'], 'failed')
+            self.assertEqual(self.client.get(reverse('readiness')).status_code, 503)
+            response = self.client.get(reverse('readiness'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((databases.calls, response.json()['rechecks']), (4, 2))
 
-# Create your tests here.
@@ -6,6 +6,7 @@ urlpatterns = [
     path('', views.homepage, name='homepage'),
     path('login/', views.login_view, name='login_view'),
     path('logout/', views.logout_view, name='logout_view'),
+    path('lot/', views.select_lot, name='select_lot'),
     
     # Two Wheeler URLs
     path('two-wheeler-entry/', views.two_wheeler_entry, name='two_wheeler_entry'),
@@ -33,4 +34,18 @@ urlpatterns = [
     path('reports/weekly/', views.generate_weekly_report, name='weekly_report'),
     path('reports/monthly/', views.generate_monthly_report, name='monthly_report'),
     path('reports/export-excel/', views.export_to_excel, name='export_excel'),
+    path('reports/history/', views.snapshot_analytics, name='snapshot_analytics'),
+    path('reports/occupancy/', views.occupancy_timeline, name='occupancy_timeline'),
+    path('reports/occupancy.png', views.occupancy_chart, name='occupancy_chart'),
+    
+    # Integrations
+    path('api/sessions/', views.session_history, name='session_history'),
+    
+    # Health checks
+    path('ready/', views.readiness, name='readiness'),
+    
+    # Staff tools
+    path('admin-tools/profiles/', views.profile_list, name='profile_list'),
+    path('admin-tools/profiles/<str:profile_id>.<str:kind>', views.profile_download, name='profile_download'),
+    path('admin-tools/db-pools/', views.db_pool_stats, name='db_pool_stats'),
 ]
\ No newline at end of file
@@ -3,15 +3,38 @@ from django.utils import timezone
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from .models import TwoWheelerEntry, FourWheelerEntry
-from .forms import TwoWheelerEntryForm, FourWheelerEntryForm, LoginForm
+from .forms import TwoWheelerEntryForm, FourWheelerEntryForm, LoginForm, LotSelectForm, OutboxPasswordResetForm
+from .db.pool import pool_stats
+from .data_version import dashboard_etag, dashboard_last_modified
+from .events import catch_up, entry_event, exit_event, parked_counts, record_event, revenue_since, rollups
+from .gate import gate_node_enabled, record_entry, find_open_session, record_exit, find_exit
+from .occupancy import RESOLUTIONS as OCCUPANCY_RESOLUTIONS, occupancy_timeline as build_occupancy_timeline
+from .profiling import profile_dir, recent_profiles
+from .session_history import HistoryQuery, InvalidQuery, history_page, stream_history
+from .report_parts import ROW_FIELDS as REPORT_ROW_FIELDS, assemble_report
+from .plates import mark_left, mark_parked, normalize_plate, open_session_token, parked_token
+from .slots import LotFull, allocate_slot, release_slot
+from .warmup import READY_STATUSES, recheck as recheck_warmup, warmup_status
+from .snapshot import (
+    MAX_MONTHS, load_snapshot, select_range, duration_distribution, daily_peak_occupancy, revenue_by_weekday_hour,
+)
+from .xlsx import render_rows, write_workbook
+from .lots import SESSION_KEY as LOT_SESSION_KEY, current_lot, lot_database, lot_entries
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.views import PasswordResetView, PasswordResetConfirmView
-from django.urls import reverse_lazy
-from django.http import JsonResponse, HttpResponse
+from django.urls import reverse, reverse_lazy
+from django.utils.http import urlencode
+from django.http import JsonResponse, HttpResponse, FileResponse, Http404, StreamingHttpResponse
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.db import IntegrityError, transaction
 from django.db.models import Sum, Count, Q
+import os
 import random
 import string
-import pandas as pd
 from datetime import datetime, timedelta
 import io
 import base64
@@ -67,6 +90,7 @@ class CustomPasswordResetView(PasswordResetView):
     Custom password reset view
     """
     template_name = 'password_reset.html'
+    form_class = OutboxPasswordResetForm
     email_template_name = 'password_reset_email.html'
     subject_template_name = 'password_reset_subject.txt'
     success_url = reverse_lazy('password_reset_done')
@@ -104,18 +128,28 @@ def password_reset_complete(request):
 # UTILITY FUNCTIONS
 # ================================
 
-def generate_token_id(prefix):
+def generate_token_id(prefix, lot):
     """
-    Generate unique token ID for vehicles
+    Generate unique token ID for vehicles within a lot
     """
     while True:
         rand_str = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
         token_id = f"{prefix}{rand_str}"
         # Check if token exists in either model
-        if (not TwoWheelerEntry.objects.filter(token_id=token_id).exists() and 
-            not FourWheelerEntry.objects.filter(token_id=token_id).exists()):
+        if (not lot_entries(TwoWheelerEntry, lot).filter(token_id=token_id).exists() and 
+            not lot_entries(FourWheelerEntry, lot).filter(token_id=token_id).exists()):
             return token_id
 
+def redirect_to_entry_success(entry):
+    """
+    Redirect to the entry success page, carrying the assigned bay
+    """
+    url = reverse('entry_success', kwargs={'token_id': entry.token_id})
+    slot = getattr(entry, 'slot', '')
+    if slot:
+        url += '?' + urlencode({'slot': slot})
+    return redirect(url)
+
 def calculate_amount(entry_time, exit_time, rate_per_hour):
     """
     Calculate parking amount based on duration
@@ -129,29 +163,30 @@ def calculate_amount(entry_time, exit_time, rate_per_hour):
 # ================================
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=dashboard_etag('day'), last_modified_func=dashboard_last_modified('day'))
 def homepage(request):
     """
     Homepage view - shows dashboard with statistics
     """
+    lot = current_lot(request)
+    database = lot_database(lot)
+    
+    # Bring the projections up to date with the event log
+    catch_up(database)
+    
     # Get current parking stats
-    two_wheeler_count = TwoWheelerEntry.objects.filter(exit_time__isnull=True).count()
-    four_wheeler_count = FourWheelerEntry.objects.filter(exit_time__isnull=True).count()
+    parked = parked_counts(lot, database)
+    two_wheeler_count = parked['TW']
+    four_wheeler_count = parked['FW']
     
     # Get today's revenue
     today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    today_revenue_two = TwoWheelerEntry.objects.filter(
-        exit_time__isnull=False,
-        exit_time__gte=today_start
-    ).aggregate(total=Sum('amount'))['total'] or 0
-    
-    today_revenue_four = FourWheelerEntry.objects.filter(
-        exit_time__isnull=False,
-        exit_time__gte=today_start
-    ).aggregate(total=Sum('amount'))['total'] or 0
-    
-    total_today_revenue = today_revenue_two + today_revenue_four
+    total_today_revenue = revenue_since(lot, today_start, database)
     
     context = {
+        'lot': lot,
+        'lot_form': LotSelectForm(initial={'lot': lot}),
         'two_wheeler_count': two_wheeler_count,
         'four_wheeler_count': four_wheeler_count,
         'total_vehicles': two_wheeler_count + four_wheeler_count,
@@ -159,6 +194,20 @@ def homepage(request):
     }
     return render(request, 'homepage.html', context)
 
+@login_required
+def select_lot(request):
+    """
+    Switch the lot this terminal works on
+    """
+    if request.method == 'POST':
+        form = LotSelectForm(request.POST)
+        if form.is_valid():
+            request.session[LOT_SESSION_KEY] = form.cleaned_data['lot']
+            messages.success(request, f"Now working on lot {form.cleaned_data['lot']}.")
+        else:
+            messages.error(request, 'Unknown parking lot.')
+    return redirect('homepage')
+
 # ================================
 # TWO WHEELER VIEWS
 # ================================
@@ -171,12 +220,37 @@ def two_wheeler_entry(request):
     if request.method == 'POST':
         form = TwoWheelerEntryForm(request.POST)
         if form.is_valid():
-            entry = form.save(commit=False)
-            entry.token_id = generate_token_id('TW')
-            entry.entry_time = timezone.now()
-            entry.save()
+            lot = current_lot(request)
+            if gate_node_enabled():
+                entry = record_entry('TW', lot, form.cleaned_data['vehicle_no'], form.cleaned_data['phone_number'])
+            else:
+                entry = form.save(commit=False)
+                entry.lot = lot
+                entry.open_plate = normalize_plate(entry.vehicle_no) or None
+                parked = parked_token('TW', lot, entry.open_plate)
+                if parked:
+                    messages.error(request, f'{entry.vehicle_no} is already parked with token {parked}.')
+                    return render(request, 'two_wheeler_entry.html', {'form': form})
+                entry.token_id = generate_token_id('TW', lot)
+                entry.entry_time = timezone.now()
+                try:
+                    with transaction.atomic(using=lot_database(lot)):
+                        entry.slot = allocate_slot(lot, 'TW', entry.token_id)
+                        entry.save(using=lot_database(lot))
+                        record_event(entry_event('TW', entry))
+                        mark_parked('TW', entry)
+                except LotFull:
+                    messages.error(request, 'No two-wheeler bays are free. Entry refused.')
+                    return render(request, 'two_wheeler_entry.html', {'form': form})
+                except IntegrityError:
+                    # The cache missed a parked plate; the constraint did not
+                    parked = open_session_token('TW', lot, entry.open_plate)
+                    if parked is None:
+                        raise
+                    messages.error(request, f'{entry.vehicle_no} is already parked with token {parked}.')
+                    return render(request, 'two_wheeler_entry.html', {'form': form})
             messages.success(request, f'Two-wheeler entry created successfully! Token: {entry.token_id}')
-            return redirect('entry_success', token_id=entry.token_id)
+            return redirect_to_entry_success(entry)
         else:
             messages.error(request, 'Please correct the errors below.')
     else:
@@ -196,13 +270,30 @@ def two_wheeler_exit(request, token_id):
     """
     Process two-wheeler exit
     """
+    lot = current_lot(request)
     try:
-        entry = TwoWheelerEntry.objects.get(token_id=token_id, exit_time__isnull=True)
+        if gate_node_enabled():
+            entry = find_open_session('TW', lot, token_id)
+            if entry is None:
+                raise TwoWheelerEntry.DoesNotExist
+        else:
+            entry = lot_entries(TwoWheelerEntry, lot).get(token_id=token_id, exit_time__isnull=True)
         
         if request.method == 'POST':
-            entry.exit_time = timezone.now()
-            entry.amount = calculate_amount(entry.entry_time, entry.exit_time, 30)  # ₹30 per hour
-            entry.save()
+            exit_time = timezone.now()
+            amount = calculate_amount(entry.entry_time, exit_time, 30)  # ₹30 per hour
+            if gate_node_enabled():
+                entry = record_exit('TW', entry, exit_time, amount)
+            else:
+                plate = entry.open_plate
+                entry.exit_time = exit_time
+                entry.amount = amount
+                entry.open_plate = None
+                with transaction.atomic(using=lot_database(lot)):
+                    entry.save(using=lot_database(lot))
+                    release_slot(lot, 'TW', entry.token_id, entry.slot)
+                    mark_left('TW', entry, plate)
+                    record_event(exit_event('TW', entry))
             messages.success(request, f'Exit processed successfully! Amount: ₹{entry.amount}')
             return redirect('exit_success', token_id=entry.token_id)
         
@@ -242,12 +333,37 @@ def four_wheeler_entry(request):
     if request.method == 'POST':
         form = FourWheelerEntryForm(request.POST)
         if form.is_valid():
-            entry = form.save(commit=False)
-            entry.token_id = generate_token_id('FW')
-            entry.entry_time = timezone.now()
-            entry.save()
+            lot = current_lot(request)
+            if gate_node_enabled():
+                entry = record_entry('FW', lot, form.cleaned_data['vehicle_no'], form.cleaned_data['phone_number'])
+            else:
+                entry = form.save(commit=False)
+                entry.lot = lot
+                entry.open_plate = normalize_plate(entry.vehicle_no) or None
+                parked = parked_token('FW', lot, entry.open_plate)
+                if parked:
+                    messages.error(request, f'{entry.vehicle_no} is already parked with token {parked}.')
+                    return render(request, 'four_wheeler_entry.html', {'form': form})
+                entry.token_id = generate_token_id('FW', lot)
+                entry.entry_time = timezone.now()
+                try:
+                    with transaction.atomic(using=lot_database(lot)):
+                        entry.slot = allocate_slot(lot, 'FW', entry.token_id)
+                        entry.save(using=lot_database(lot))
+                        record_event(entry_event('FW', entry))
+                        mark_parked('FW', entry)
+                except LotFull:
+                    messages.error(request, 'No four-wheeler bays are free. Entry refused.')
+                    return render(request, 'four_wheeler_entry.html', {'form': form})
+                except IntegrityError:
+                    # The cache missed a parked plate; the constraint did not
+                    parked = open_session_token('FW', lot, entry.open_plate)
+                    if parked is None:
+                        raise
+                    messages.error(request, f'{entry.vehicle_no} is already parked with token {parked}.')
+                    return render(request, 'four_wheeler_entry.html', {'form': form})
             messages.success(request, f'Four-wheeler entry created successfully! Token: {entry.token_id}')
-            return redirect('entry_success', token_id=entry.token_id)
+            return redirect_to_entry_success(entry)
         else:
             messages.error(request, 'Please correct the errors below.')
     else:
@@ -267,13 +383,30 @@ def four_wheeler_exit(request, token_id):
     """
     Process four-wheeler exit
     """
+    lot = current_lot(request)
     try:
-        entry = FourWheelerEntry.objects.get(token_id=token_id, exit_time__isnull=True)
+        if gate_node_enabled():
+            entry = find_open_session('FW', lot, token_id)
+            if entry is None:
+                raise FourWheelerEntry.DoesNotExist
+        else:
+            entry = lot_entries(FourWheelerEntry, lot).get(token_id=token_id, exit_time__isnull=True)
         
         if request.method == 'POST':
-            entry.exit_time = timezone.now()
-            entry.amount = calculate_amount(entry.entry_time, entry.exit_time, 50)  # ₹50 per hour
-            entry.save()
+            exit_time = timezone.now()
+            amount = calculate_amount(entry.entry_time, exit_time, 50)  # ₹50 per hour
+            if gate_node_enabled():
+                entry = record_exit('FW', entry, exit_time, amount)
+            else:
+                plate = entry.open_plate
+                entry.exit_time = exit_time
+                entry.amount = amount
+                entry.open_plate = None
+                with transaction.atomic(using=lot_database(lot)):
+                    entry.save(using=lot_database(lot))
+                    release_slot(lot, 'FW', entry.token_id, entry.slot)
+                    mark_left('FW', entry, plate)
+                    record_event(exit_event('FW', entry))
             messages.success(request, f'Exit processed successfully! Amount: ₹{entry.amount}')
             return redirect('exit_success', token_id=entry.token_id)
         
@@ -310,20 +443,25 @@ def entry_success(request, token_id):
     """
     Show success page after vehicle entry
     """
-    return render(request, 'entry_success.html', {'token_id': token_id})
+    return render(request, 'entry_success.html', {'token_id': token_id, 'slot': request.GET.get('slot', '')})
 
 @login_required
 def exit_success(request, token_id):
     """
     Show success page after vehicle exit with payment details
     """
+    lot = current_lot(request)
+    
+    # Exits recorded on a gate node live in the journal until synced
+    journal_exit = find_exit(lot, token_id) if gate_node_enabled() else None
+    
     # Determine which model to use based on token prefix
     if token_id.startswith('TW'):
-        entry = get_object_or_404(TwoWheelerEntry, token_id=token_id)
+        entry = journal_exit or get_object_or_404(lot_entries(TwoWheelerEntry, lot), token_id=token_id)
         vehicle_type = "Two Wheeler"
         rate = "₹30 per hour"
     else:
-        entry = get_object_or_404(FourWheelerEntry, token_id=token_id)
+        entry = journal_exit or get_object_or_404(lot_entries(FourWheelerEntry, lot), token_id=token_id)
         vehicle_type = "Four Wheeler"
         rate = "₹50 per hour"
     
@@ -338,14 +476,10 @@ def exit_success(request, token_id):
 # REPORTS & ANALYTICS VIEWS
 # ================================
 
-@login_required
-def reports_analytics(request):
+def date_filter_range(date_filter):
     """
-    Reports and analytics dashboard with charts and filters
+    (start, end) for a dashboard date filter; unknown values mean 7 days
     """
-    # Get date range from request or default to last 7 days
-    date_filter = request.GET.get('date_filter', '7days')
-    
     end_date = timezone.now()
     if date_filter == 'today':
         start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -356,18 +490,37 @@ def reports_analytics(request):
         start_date = end_date - timedelta(days=30)
     else:  # 7days default
         start_date = end_date - timedelta(days=7)
+    return start_date, end_date
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=dashboard_etag('hour'), last_modified_func=dashboard_last_modified('hour'))
+def reports_analytics(request):
+    """
+    Reports and analytics dashboard with charts and filters
+    """
+    # Get date range from request or default to last 7 days
+    date_filter = request.GET.get('date_filter', '7days')
+    start_date, end_date = date_filter_range(date_filter)
+    
+    lot = current_lot(request)
+    database = lot_database(lot)
+    
+    # Bring the projections up to date with the event log
+    catch_up(database)
     
     # Get current parking stats
-    two_wheeler_count = TwoWheelerEntry.objects.filter(exit_time__isnull=True).count()
-    four_wheeler_count = FourWheelerEntry.objects.filter(exit_time__isnull=True).count()
+    parked = parked_counts(lot, database)
+    two_wheeler_count = parked['TW']
+    four_wheeler_count = parked['FW']
     
     # Get revenue data for the period
-    two_wheeler_revenue = TwoWheelerEntry.objects.filter(
+    two_wheeler_revenue = lot_entries(TwoWheelerEntry, lot).filter(
         exit_time__isnull=False,
         entry_time__gte=start_date
     ).aggregate(total=Sum('amount'))['total'] or 0
     
-    four_wheeler_revenue = FourWheelerEntry.objects.filter(
+    four_wheeler_revenue = lot_entries(FourWheelerEntry, lot).filter(
         exit_time__isnull=False,
         entry_time__gte=start_date
     ).aggregate(total=Sum('amount'))['total'] or 0
@@ -375,18 +528,24 @@ def reports_analytics(request):
     total_revenue = two_wheeler_revenue + four_wheeler_revenue
     
     # Get vehicle counts for the period
-    two_wheeler_entries = TwoWheelerEntry.objects.filter(entry_time__gte=start_date).count()
-    four_wheeler_entries = FourWheelerEntry.objects.filter(entry_time__gte=start_date).count()
+    entries_by_class = dict(
+        rollups(lot, start_date, using=database)
+        .values_list('vehicle_class')
+        .annotate(total=Sum('entries'))
+    )
+    two_wheeler_entries = entries_by_class.get('TW', 0)
+    four_wheeler_entries = entries_by_class.get('FW', 0)
     total_entries = two_wheeler_entries + four_wheeler_entries
     
     # Generate charts
-    revenue_chart = generate_revenue_chart(start_date, end_date)
-    vehicle_distribution_chart = generate_vehicle_distribution_chart(start_date, end_date)
-    hourly_trend_chart = generate_hourly_trend_chart(start_date, end_date)
+    revenue_chart = generate_revenue_chart(start_date, end_date, lot)
+    vehicle_distribution_chart = generate_vehicle_distribution_chart(start_date, end_date, lot)
+    hourly_trend_chart = generate_hourly_trend_chart(start_date, end_date, lot)
     
     context = {
         'page_title': 'Reports & Analytics',
         'user': request.user,
+        'lot': lot,
         'two_wheeler_count': two_wheeler_count,
         'four_wheeler_count': four_wheeler_count,
         'total_vehicles': two_wheeler_count + four_wheeler_count,
@@ -433,41 +592,118 @@ def export_to_excel(request):
     """
     return generate_excel_report(request, 'custom')
 
+@login_required
+def snapshot_analytics(request):
+    """
+    Long-range analytics (duration distribution, daily peak occupancy,
+    revenue by weekday and hour) computed from the columnar snapshot
+    """
+    lot = current_lot(request)
+    columns = load_snapshot(lot)
+    
+    end_date = columns['watermark']
+    try:
+        months = min(max(1, int(request.GET.get('months', 3))), MAX_MONTHS)
+    except ValueError:
+        return JsonResponse({'error': 'months must be a whole number'}, status=400)
+    start_date = end_date - timedelta(days=30 * months)
+    
+    in_range = select_range(columns, start_date, end_date)
+    return JsonResponse({
+        'lot': lot,
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'sessions': len(in_range['exit_ts']),
+        'duration_distribution': duration_distribution(in_range),
+        'daily_peak_occupancy': daily_peak_occupancy(columns, start_date, end_date),
+        'revenue_by_weekday_hour': revenue_by_weekday_hour(in_range),
+    })
+
+@login_required
+def session_history(request):
+    """
+    Session history for integrations, keyset-paged by entry or exit time.
+    JSON pages by default; format=ndjson streams every row after the cursor.
+    """
+    lot = request.GET.get('lot') or current_lot(request)
+    if lot not in settings.PARKING_LOTS:
+        return JsonResponse({'error': f"unknown lot {lot!r}"}, status=400)
+    try:
+        query = HistoryQuery(lot, request.GET)
+    except InvalidQuery as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    
+    if request.GET.get('format') == 'ndjson':
+        response = StreamingHttpResponse(stream_history(query), content_type='application/x-ndjson')
+        response['Cache-Control'] = 'no-store'
+        return response
+    return JsonResponse(history_page(query))
+
+@login_required
+def occupancy_timeline(request):
+    """
+    Vehicles inside over time (per minute by default), with peak and time
+    at capacity, for the dashboard date filter
+    """
+    try:
+        timeline = occupancy_for_request(request)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse(timeline)
+
+@login_required
+def occupancy_chart(request):
+    """
+    Occupancy timeline as a PNG chart; 15-minute buckets unless asked
+    otherwise, which keep the peaks and draw far faster than minutes
+    """
+    try:
+        timeline = occupancy_for_request(request, default_resolution='15')
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return HttpResponse(base64.b64decode(generate_occupancy_chart(timeline)), content_type='image/png')
+
+def occupancy_for_request(request, default_resolution='1'):
+    """
+    Occupancy timeline for the request's lot and date filter. Raises
+    ValueError for an unsupported resolution.
+    """
+    resolution = request.GET.get('resolution', default_resolution)
+    if not resolution.isdigit() or int(resolution) not in OCCUPANCY_RESOLUTIONS:
+        raise ValueError(f"resolution must be one of {OCCUPANCY_RESOLUTIONS} minutes")
+    
+    lot = current_lot(request)
+    start_date, end_date = date_filter_range(request.GET.get('date_filter', 'today'))
+    
+    # Bring the projections up to date with the event log
+    catch_up(lot_database(lot))
+    return build_occupancy_timeline(lot, start_date, end_date, int(resolution))
+
 # ================================
 # CHART GENERATION FUNCTIONS
 # ================================
 
-def generate_revenue_chart(start_date, end_date):
+def generate_revenue_chart(start_date, end_date, lot):
     """
     Generate revenue trend chart
     """
     try:
-        # Get daily revenue data
-        dates = []
-        two_wheeler_revenue = []
-        four_wheeler_revenue = []
+        # Get daily revenue data from the hourly rollups (day buckets start
+        # at the hour of start_date)
+        days = int((end_date - start_date) / timedelta(days=1)) + 1
+        dates = [start_date + timedelta(days=day) for day in range(days)]
+        two_wheeler_revenue = [0] * days
+        four_wheeler_revenue = [0] * days
         
-        current_date = start_date
-        while current_date <= end_date:
-            next_date = current_date + timedelta(days=1)
-            
-            two_rev = TwoWheelerEntry.objects.filter(
-                exit_time__isnull=False,
-                exit_time__gte=current_date,
-                exit_time__lt=next_date
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            four_rev = FourWheelerEntry.objects.filter(
-                exit_time__isnull=False,
-                exit_time__gte=current_date,
-                exit_time__lt=next_date
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            dates.append(current_date)
-            two_wheeler_revenue.append(two_rev)
-            four_wheeler_revenue.append(four_rev)
-            
-            current_date = next_date
+        rows = rollups(lot, start_date, end_date, using=lot_database(lot)).values_list(
+            'vehicle_class', 'hour', 'revenue'
+        )
+        for vehicle_class, hour, revenue in rows:
+            day = min(days - 1, max(0, int((hour - start_date) / timedelta(days=1))))
+            if vehicle_class == 'TW':
+                two_wheeler_revenue[day] += revenue
+            else:
+                four_wheeler_revenue[day] += revenue
         
         # Create chart
         plt.figure(figsize=(10, 6))
@@ -495,13 +731,18 @@ def generate_revenue_chart(start_date, end_date):
     except Exception as e:
         return generate_placeholder_chart("Revenue Chart - Data Not Available")
 
-def generate_vehicle_distribution_chart(start_date, end_date):
+def generate_vehicle_distribution_chart(start_date, end_date, lot):
     """
     Generate vehicle distribution pie chart
     """
     try:
-        two_wheeler_count = TwoWheelerEntry.objects.filter(entry_time__gte=start_date).count()
-        four_wheeler_count = FourWheelerEntry.objects.filter(entry_time__gte=start_date).count()
+        entries_by_class = dict(
+            rollups(lot, start_date, using=lot_database(lot))
+            .values_list('vehicle_class')
+            .annotate(total=Sum('entries'))
+        )
+        two_wheeler_count = entries_by_class.get('TW', 0)
+        four_wheeler_count = entries_by_class.get('FW', 0)
         
         # Only generate chart if we have data
         if two_wheeler_count == 0 and four_wheeler_count == 0:
@@ -531,7 +772,7 @@ def generate_vehicle_distribution_chart(start_date, end_date):
     except Exception as e:
         return generate_placeholder_chart("Vehicle Distribution - Error")
 
-def generate_hourly_trend_chart(start_date, end_date):
+def generate_hourly_trend_chart(start_date, end_date, lot):
     """
     Generate hourly trend chart
     """
@@ -540,17 +781,15 @@ def generate_hourly_trend_chart(start_date, end_date):
         two_wheeler_hourly = [0] * 24
         four_wheeler_hourly = [0] * 24
         
-        # Get two wheeler entries by hour
-        two_entries = TwoWheelerEntry.objects.filter(entry_time__gte=start_date)
-        for entry in two_entries:
-            hour = entry.entry_time.hour
-            two_wheeler_hourly[hour] += 1
-        
-        # Get four wheeler entries by hour
-        four_entries = FourWheelerEntry.objects.filter(entry_time__gte=start_date)
-        for entry in four_entries:
-            hour = entry.entry_time.hour
-            four_wheeler_hourly[hour] += 1
+        # Get entries by hour of day from the hourly rollups
+        rows = rollups(lot, start_date, using=lot_database(lot)).values_list(
+            'vehicle_class', 'hour', 'entries'
+        )
+        for vehicle_class, hour, entries in rows:
+            if vehicle_class == 'TW':
+                two_wheeler_hourly[hour.hour] += entries
+            else:
+                four_wheeler_hourly[hour.hour] += entries
         
         plt.figure(figsize=(10, 6))
         plt.bar([h - 0.2 for h in hours], two_wheeler_hourly, width=0.4, label='Two Wheelers', color='#10b981')
@@ -577,6 +816,44 @@ def generate_hourly_trend_chart(start_date, end_date):
     except Exception as e:
         return generate_placeholder_chart("Hourly Trend - Error")
 
+def generate_occupancy_chart(timeline):
+    """
+    Generate occupancy over time chart
+    """
+    try:
+        start = datetime.fromisoformat(timeline['start'])
+        step = timedelta(minutes=timeline['resolution_minutes'])
+        total = timeline['total']
+        times = [start + step * n for n in range(len(total['series']))]
+        
+        plt.figure(figsize=(12, 6))
+        plt.plot(times, total['series'], color='#667eea', linewidth=1, label='All vehicles')
+        for vehicle_class, label, color in (('TW', 'Two Wheelers', '#10b981'), ('FW', 'Four Wheelers', '#ef4444')):
+            plt.plot(times, timeline['classes'][vehicle_class]['series'], color=color, linewidth=1, label=label)
+        if total['capacity']:
+            plt.axhline(total['capacity'], color='#6b7280', linestyle='--', label='Capacity')
+        plt.title(f"Occupancy (peak {total['peak']})", fontsize=14, fontweight='bold')
+        plt.xlabel('Time (UTC)')
+        plt.ylabel('Vehicles Inside')
+        plt.legend()
+        plt.grid(True, alpha=0.3)
+        plt.gcf().autofmt_xdate()
+        plt.tight_layout()
+        
+        # Convert to base64
+        buffer = io.BytesIO()
+        plt.savefig(buffer, format='png', dpi=100, bbox_inches='tight')
+        buffer.seek(0)
+        image_png = buffer.getvalue()
+        buffer.close()
+        
+        graphic = base64.b64encode(image_png).decode('utf-8')
+        plt.close()
+        
+        return graphic
+    except Exception as e:
+        return generate_placeholder_chart("Occupancy - Error")
+
 def generate_placeholder_chart(message):
     """
     Generate a placeholder chart when data is not available
@@ -600,74 +877,64 @@ def generate_excel_report(request, report_type):
     """
     Generate Excel report based on type
     """
-    end_date = timezone.now()
+    lot = current_lot(request)
+    now = timezone.now()
+    end_day = timezone.localdate(now)
+    today_start = timezone.make_aware(datetime.combine(end_day, datetime.min.time()))
     
+    # Daily and yesterday cover local days; the others the last 7 or 30
+    # days up to now, as they always have
     if report_type == 'daily':
-        start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        filename = f"daily_report_{end_date.strftime('%Y%m%d')}.xlsx"
+        start = today_start
+        filename = f"{lot}_daily_report_{now.strftime('%Y%m%d')}.xlsx"
     elif report_type == 'weekly':
-        start_date = end_date - timedelta(days=7)
-        filename = f"weekly_report_{end_date.strftime('%Y%m%d')}.xlsx"
+        start = now - timedelta(days=7)
+        filename = f"{lot}_weekly_report_{now.strftime('%Y%m%d')}.xlsx"
     elif report_type == 'monthly':
-        start_date = end_date - timedelta(days=30)
-        filename = f"monthly_report_{end_date.strftime('%Y%m')}.xlsx"
+        start = now - timedelta(days=30)
+        filename = f"{lot}_monthly_report_{now.strftime('%Y%m')}.xlsx"
     else:  # custom
         date_filter = request.GET.get('date_filter', '7days')
         if date_filter == 'today':
-            start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
+            start = today_start
         elif date_filter == 'yesterday':
-            start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
-            end_date = start_date + timedelta(days=1)
+            end_day = end_day - timedelta(days=1)
+            start = timezone.make_aware(datetime.combine(end_day, datetime.min.time()))
         elif date_filter == '30days':
-            start_date = end_date - timedelta(days=30)
+            start = now - timedelta(days=30)
         else:  # 7days
-            start_date = end_date - timedelta(days=7)
-        filename = f"parking_report_{end_date.strftime('%Y%m%d')}.xlsx"
+            start = now - timedelta(days=7)
+        filename = f"{lot}_parking_report_{now.strftime('%Y%m%d')}.xlsx"
     
-    # Get data
-    two_wheeler_data = TwoWheelerEntry.objects.filter(entry_time__gte=start_date)
-    four_wheeler_data = FourWheelerEntry.objects.filter(entry_time__gte=start_date)
+    # Closed days come from stored per-day parts; only today (and the
+    # rest of the first day) is queried and rendered
+    summary, rows = assemble_report(lot, start, end_day)
+    two_wheeler, four_wheeler = summary['TW'], summary['FW']
     
-    # Create Excel file
-    output = io.BytesIO()
+    # Summary sheet
+    summary_rows = [
+        ('Parking Lot', lot),
+        ('Total Two Wheelers', two_wheeler['sessions']),
+        ('Total Four Wheelers', four_wheeler['sessions']),
+        ('Total Vehicles', two_wheeler['sessions'] + four_wheeler['sessions']),
+        ('Two Wheeler Revenue', two_wheeler['revenue']),
+        ('Four Wheeler Revenue', four_wheeler['revenue']),
+        ('Total Revenue', two_wheeler['revenue'] + four_wheeler['revenue']),
+        ('Report Period', f"{timezone.localtime(start).strftime('%Y-%m-%d')} to {end_day.strftime('%Y-%m-%d')}"),
+        ('Generated On', timezone.now().strftime('%Y-%m-%d %H:%M:%S')),
+    ]
+    sheets = [('Summary', [render_rows([('Metric', 'Value')] + summary_rows)])]
     
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        # Summary sheet
-        summary_data = {
-            'Metric': ['Total Two Wheelers', 'Total Four Wheelers', 'Total Vehicles', 
-                      'Two Wheeler Revenue', 'Four Wheeler Revenue', 'Total Revenue',
-                      'Report Period', 'Generated On'],
-            'Value': [
-                two_wheeler_data.count(),
-                four_wheeler_data.count(),
-                two_wheeler_data.count() + four_wheeler_data.count(),
-                two_wheeler_data.filter(exit_time__isnull=False).aggregate(Sum('amount'))['amount__sum'] or 0,
-                four_wheeler_data.filter(exit_time__isnull=False).aggregate(Sum('amount'))['amount__sum'] or 0,
-                (two_wheeler_data.filter(exit_time__isnull=False).aggregate(Sum('amount'))['amount__sum'] or 0) +
-                (four_wheeler_data.filter(exit_time__isnull=False).aggregate(Sum('amount'))['amount__sum'] or 0),
-                f"{start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}",
-                timezone.now().strftime('%Y-%m-%d %H:%M:%S')
-            ]
-        }
-        df_summary = pd.DataFrame(summary_data)
-        df_summary.to_excel(writer, sheet_name='Summary', index=False)
-        
-        # Two Wheeler sheet
-        two_wheeler_list = list(two_wheeler_data.values(
-            'token_id', 'vehicle_no', 'phone_number', 'entry_time', 'exit_time', 'amount'
-        ))
-        if two_wheeler_list:
-            df_two = pd.DataFrame(two_wheeler_list)
-            df_two.to_excel(writer, sheet_name='Two Wheelers', index=False)
-        
-        # Four Wheeler sheet
-        four_wheeler_list = list(four_wheeler_data.values(
-            'token_id', 'vehicle_no', 'phone_number', 'entry_time', 'exit_time', 'amount'
-        ))
-        if four_wheeler_list:
-            df_four = pd.DataFrame(four_wheeler_list)
-            df_four.to_excel(writer, sheet_name='Four Wheelers', index=False)
+    # Vehicle sheets
+    header = render_rows([REPORT_ROW_FIELDS])
+    if two_wheeler['sessions']:
+        sheets.append(('Two Wheelers', [header] + rows['TW']))
+    if four_wheeler['sessions']:
+        sheets.append(('Four Wheelers', [header] + rows['FW']))
     
+    # Create Excel file
+    output = io.BytesIO()
+    write_workbook(output, sheets)
     output.seek(0)
     
     response = HttpResponse(
@@ -682,3 +949,52 @@ def generate_excel_report(request, report_type):
 
 
 
+
+
+# ================================
+# HEALTH CHECKS
+# ================================
+
+def readiness(request):
+    """
+    Report worker warm-up status; 503 until the worker is warm. A failed
+    warm-up is retried from here when its recheck is due.
+    """
+    recheck_warmup()
+    status = warmup_status()
+    return JsonResponse(status, status=200 if status['status'] in READY_STATUSES else 503)
+
+# ================================
+# STAFF TOOLS
+# ================================
+
+@staff_member_required
+def profile_list(request):
+    """
+    List the most recent request profiles
+    """
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Request profiles',
+        'profiles': recent_profiles(),
+    }
+    return render(request, 'admin/parking/profiles.html', context)
+
+@staff_member_required
+def profile_download(request, profile_id, kind):
+    """
+    Download a saved profile as pstats, collapsed stacks or JSON summary
+    """
+    if kind not in ('pstats', 'collapsed', 'json') or '/' in profile_id or profile_id.startswith('.'):
+        raise Http404
+    path = profile_dir() / f'{profile_id}.{kind}'
+    if not path.exists():
+        raise Http404
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name)
+
+@staff_member_required
+def db_pool_stats(request):
+    """
+    Connection pool size, utilisation and wait times of this worker process
+    """
+    return JsonResponse({'pid': os.getpid(), 'pools': pool_stats()})
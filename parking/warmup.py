@@ -0,0 +1,257 @@
+"""
+Worker warm-up, run when server/wsgi.py or server/asgi.py loads the app.
+
+A cold worker pays for importing the views (matplotlib, numpy), loading
+matplotlib's font cache, compiling the large templates, connecting to
+the databases and building the free-bay bitmaps on its first requests. warm_up() does that work up front
+and records how it went in WARMUP_STATE, which /ready/ reports so a load
+balancer only routes to warm workers.
+
+Each step is tried ATTEMPTS times with a doubling delay. When a required
+step still fails the worker is 'failed', and /ready/ runs the failed steps
+again every RECHECK_SECONDS (doubling) until they pass. Optional steps
+only save first-request latency; their failure leaves the worker
+'degraded', which still counts as ready.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.template import TemplateDoesNotExist, TemplateSyntaxError
+from django.template.loader import get_template
+from django.urls import reverse, resolve
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+WARMUP_DEFAULTS = {
+    'ENABLED': True,
+    # Warm in a background thread so the worker starts accepting at once
+    # (/ready/ answers 503 until done). Database connections are per
+    # thread, so in the background the database step only checks
+    # connectivity, unless the database is pooled (parking.db).
+    'BACKGROUND': False,
+    'ATTEMPTS': 3,              # tries per step at start-up
+    'RETRY_DELAY': 0.5,         # seconds before the second try, doubled after each
+    'RECHECK_SECONDS': 10,      # /ready/ retries failed steps this often, doubled up to MAX_RECHECK_SECONDS
+    'MAX_RECHECK_SECONDS': 300,
+}
+
+TEMPLATE_ROOT = Path(__file__).resolve().parent / 'templates'
+
+WARMUP_STATE = {
+    'status': 'pending',     # pending, warming, ready, degraded, failed
+    'started_at': None,
+    'finished_at': None,
+    'rechecks': 0,
+    'recheck_at': None,
+    'steps': {},
+}
+READY_STATUSES = ('ready', 'degraded')
+_lock = threading.Lock()
+
+def warmup_config():
+    return {**WARMUP_DEFAULTS, **getattr(settings, 'PARKING_WARMUP', {})}
+
+# ================================
+# STEPS
+# ================================
+
+def warm_urls():
+    """
+    Resolve the URLconf, which imports the views and their heavy
+    dependencies
+    """
+    resolve(reverse('homepage'))
+    return 'urlconf loaded'
+
+def warm_templates():
+    """
+    Compile every app template into the cached loader
+    """
+    compiled = 0
+    for path in sorted(TEMPLATE_ROOT.rglob('*.html')):
+        try:
+            get_template(path.relative_to(TEMPLATE_ROOT).as_posix())
+        except (TemplateDoesNotExist, TemplateSyntaxError) as exc:
+            logger.warning("Warm-up could not compile %s: %s", path.name, exc)
+            continue
+        compiled += 1
+    return f"{compiled} templates"
+
+def warm_matplotlib():
+    """
+    Load the font cache and render one chart through the Agg backend
+    """
+    from matplotlib import font_manager
+
+    from .views import generate_placeholder_chart
+
+    generate_placeholder_chart("Warming up")
+    return f"{len(font_manager.fontManager.ttflist)} fonts"
+
+def warm_databases():
+    """
+    Open (and check) a connection to every configured database, and fill
+    the pools of pooled ones (parking.db)
+    """
+    opened = []
+    for alias in connections:
+        connection = connections[alias]
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if getattr(connection, 'pool', None) is not None:
+            connection.fill_pool()
+            opened.append(f"{alias} ({connection.pool.stats()['open']} pooled)")
+        else:
+            opened.append(alias)
+    return ', '.join(opened)
+
+def warm_caches():
+    """
+    Touch every cache backend, seed the per-lot data versions and load the
+    parked plates
+    """
+    from .data_version import data_version
+    from .plates import rebuild_parked_plates
+
+    for alias in settings.CACHES:
+        caches[alias].get('parking:warmup')
+    plates = 0
+    for lot in settings.PARKING_LOTS:
+        data_version(lot)
+        plates += rebuild_parked_plates(lot)
+    return f"{', '.join(settings.CACHES)}; {plates} parked plates"
+
+def warm_slots():
+    """
+    Build the free-bay bitmaps from the database
+    """
+    from .slots import load_allocators
+
+    return f"{load_allocators()} bitmaps"
+
+STEPS = [
+    ('urls', warm_urls),
+    ('templates', warm_templates),
+    ('matplotlib', warm_matplotlib),
+    ('databases', warm_databases),
+    ('slots', warm_slots),
+    ('caches', warm_caches),
+]
+# Steps a worker can serve without, only slower
+OPTIONAL_STEPS = {'templates', 'matplotlib'}
+
+# ================================
+# RUNNING
+# ================================
+
+def _run_step(name, step, attempts=1, delay=0):
+    started = time.perf_counter()
+    for attempt in range(1, attempts + 1):
+        try:
+            detail = step()
+        except Exception as exc:
+            # A failed step must never stop the worker from starting
+            logger.exception("Warm-up step %s failed (attempt %d of %d)", name, attempt, attempts)
+            result = {'ok': False, 'error': str(exc)}
+            if attempt < attempts:
+                time.sleep(delay * 2 ** (attempt - 1))
+        else:
+            result = {'ok': True, 'detail': detail}
+            break
+    result['attempts'] = attempt
+    result['ms'] = round((time.perf_counter() - started) * 1000, 1)
+    with _lock:
+        WARMUP_STATE['steps'][name] = result
+    return result['ok']
+
+def _release_pooled_connections():
+    """
+    Give pooled connections back rather than hold them in the warm-up
+    thread for good
+    """
+    for connection in connections.all(initialized_only=True):
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        if getattr(connection, 'pool', None) is not None:
+            connection.close()
+
+def _finish(config):
+    with _lock:
+        failed = {name for name, result in WARMUP_STATE['steps'].items() if not result['ok']}
+        if failed - OPTIONAL_STEPS:
+            WARMUP_STATE['status'] = 'failed'
+            delay = min(config['RECHECK_SECONDS'] * 2 ** WARMUP_STATE['rechecks'], config['MAX_RECHECK_SECONDS'])
+            WARMUP_STATE['recheck_at'] = timezone.now() + timedelta(seconds=delay)
+        else:
+            WARMUP_STATE['status'] = 'degraded' if failed else 'ready'
+            WARMUP_STATE['recheck_at'] = None
+        WARMUP_STATE['finished_at'] = timezone.now()
+    logger.info("Warm-up %s: %s", WARMUP_STATE['status'], WARMUP_STATE['steps'])
+
+def _run_all():
+    config = warmup_config()
+    for name, step in STEPS:
+        _run_step(name, step, config['ATTEMPTS'], config['RETRY_DELAY'])
+    _release_pooled_connections()
+    _finish(config)
+
+def recheck():
+    """
+    Run the failed steps of a failed warm-up again once its recheck is
+    due. Called by /ready/.
+    """
+    config = warmup_config()
+    with _lock:
+        if WARMUP_STATE['status'] != 'failed' or timezone.now() < WARMUP_STATE['recheck_at']:
+            return
+        WARMUP_STATE['status'] = 'warming'
+        WARMUP_STATE['rechecks'] += 1
+        failed = {name for name, result in WARMUP_STATE['steps'].items() if not result['ok']}
+    for name, step in STEPS:
+        if name in failed:
+            _run_step(name, step)
+    _release_pooled_connections()
+    _finish(config)
+
+def warm_up():
+    """
+    Warm the worker according to PARKING_WARMUP. Safe to call more than
+    once; only the first call does anything.
+    """
+    config = warmup_config()
+    with _lock:
+        if WARMUP_STATE['status'] != 'pending':
+            return
+        if not config['ENABLED']:
+            WARMUP_STATE['status'] = 'ready'
+            return
+        WARMUP_STATE['status'] = 'warming'
+        WARMUP_STATE['started_at'] = timezone.now()
+
+    if config['BACKGROUND']:
+        threading.Thread(target=_run_all, name='parking-warmup', daemon=True).start()
+    else:
+        _run_all()
+
+def warmup_status():
+    with _lock:
+        return {**WARMUP_STATE, 'steps': dict(WARMUP_STATE['steps'])}
+
+def _drop_inherited_connections():
+    """
+    A worker forked from a preloaded master must not share the master's
+    database sockets; forget them so the worker opens its own
+    """
+    for conn in connections.all(initialized_only=True):
+        conn.connection = None
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_drop_inherited_connections)
@@ -0,0 +1,112 @@
+"""
+Minimal XLSX writer for the Excel reports.
+
+Rows are rendered once into SpreadsheetML <row> fragments with inline
+strings and no cell references, so fragments rendered at different times
+can be concatenated into one sheet as they are. Report parts store the
+fragments of closed days; building a workbook is then mostly zipping
+bytes that already exist.
+"""
+import re
+import zipfile
+from datetime import datetime, timedelta
+from decimal import Decimal
+from xml.sax.saxutils import escape, quoteattr
+
+from django.utils import timezone
+
+EXCEL_EPOCH = datetime(1899, 12, 30)
+DATETIME_STYLE = 1
+# Characters XML 1.0 does not allow
+ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+STYLES = (
+    f'{XML_HEADER}<styleSheet xmlns="{MAIN_NS}">'
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd hh:mm:ss"/></numFmts>'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+def _cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.make_naive(value)
+        serial = (value - EXCEL_EPOCH) / timedelta(days=1)
+        return f'<c s="{DATETIME_STYLE}"><v>{serial!r}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    text = escape(ILLEGAL_XML.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+def render_rows(rows):
+    """
+    SpreadsheetML fragment (bytes) for an iterable of row tuples
+    """
+    return ''.join(
+        '<row>' + ''.join(_cell(value) for value in row) + '</row>' for row in rows
+    ).encode('utf-8')
+
+def write_workbook(output, sheets):
+    """
+    Write an .xlsx to the binary file `output`. `sheets` is a list of
+    (name, [row fragments]) in tab order.
+    """
+    content_types = ''.join(
+        f'<Override PartName="/xl/worksheets/sheet{n}.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for n in range(1, len(sheets) + 1)
+    )
+    sheet_list = ''.join(
+        f'<sheet name={quoteattr(name)} sheetId="{n}" r:id="rId{n}"/>'
+        for n, (name, _) in enumerate(sheets, start=1)
+    )
+    sheet_rels = ''.join(
+        f'<Relationship Id="rId{n}" Type="{REL_NS}/worksheet" Target="worksheets/sheet{n}.xml"/>'
+        for n in range(1, len(sheets) + 1)
+    )
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as package:
+        package.writestr('[Content_Types].xml', (
+            f'{XML_HEADER}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/styles.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            f'{content_types}</Types>'
+        ))
+        package.writestr('_rels/.rels', (
+            f'{XML_HEADER}<Relationships xmlns="{PACKAGE_REL_NS}">'
+            f'<Relationship Id="rId1" Type="{REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>'
+        ))
+        package.writestr('xl/workbook.xml', (
+            f'{XML_HEADER}<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}">'
+            f'<sheets>{sheet_list}</sheets></workbook>'
+        ))
+        package.writestr('xl/_rels/workbook.xml.rels', (
+            f'{XML_HEADER}<Relationships xmlns="{PACKAGE_REL_NS}">{sheet_rels}'
+            f'<Relationship Id="rId{len(sheets) + 1}" Type="{REL_NS}/styles" Target="styles.xml"/>'
+            '</Relationships>'
+        ))
+        package.writestr('xl/styles.xml', STYLES)
+        for n, (_, fragments) in enumerate(sheets, start=1):
+            with package.open(f'xl/worksheets/sheet{n}.xml', 'w') as sheet:
+                sheet.write(f'{XML_HEADER}<worksheet xmlns="{MAIN_NS}"><sheetData>'.encode('utf-8'))
+                for fragment in fragments:
+                    sheet.write(fragment)
+                sheet.write(b'</sheetData></worksheet>')
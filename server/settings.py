@@ -42,10 +42,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'parking.middleware.AdmissionControlMiddleware',
+    'parking.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'parking.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -73,9 +76,13 @@ WSGI_APPLICATION = 'server.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# The default database is pooled: each worker process keeps up to max_size
+# connections and lends them to its threads per request, so requests skip
+# the connect handshake (see parking.db.pool; pool stats per worker at
+# /admin-tools/db-pools/). Use 'parking.db.sqlite3' to try it locally.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'parking.db.mysql',
         'NAME': 'parking',
         'USER': 'root',               
         'PASSWORD': 'dilli2004',			
@@ -83,9 +90,126 @@ DATABASES = {
         'PORT': '3306',
         'OPTIONS': {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
-            'charset': 'utf8mb4'
-    }
+            'charset': 'utf8mb4',
+            'pool': {
+                'min_size': 2,      # opened at warm-up
+                'max_size': 10,     # per worker process; keep workers x max_size below max_connections
+                'timeout': 5,       # seconds a request waits for a free connection
+                'check_after': 30,  # ping connections idle for longer than this
+            },
+    },
+        # Connections return to the pool at the end of each request
+        'CONN_MAX_AGE': 0,
+},
+    # Local write-ahead journal used when this server runs as a gate node
+    'journal': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'gate_journal.sqlite3',
+    },
+}
+
+DATABASE_ROUTERS = ['parking.routers.GateJournalRouter']
+
+# Parking lots served by this deployment. Each lot's sessions may be routed
+# to their own database alias (run `migrate --database <alias>` for it).
+# A lot with 'zones' gets numbered bays per vehicle class, e.g.
+#     'zones': {'A': {'TW': 120, 'FW': 40}, 'B': {'FW': 60}}
+# and refuses entries once they are all taken (see parking.slots).
+PARKING_LOTS = {
+    'main': {'name': 'Main Lot', 'database': 'default'},
+}
+PARKING_DEFAULT_LOT = 'main'
+
+# Columnar snapshot of closed sessions used by the long-range analytics
+# (refresh with `python manage.py build_snapshot`, e.g. nightly)
+PARKING_SNAPSHOT_DIR = BASE_DIR / 'snapshots'
+
+# Immutable per-day parts the Excel reports are assembled from; prebuild
+# them nightly with `python manage.py build_report_parts`
+PARKING_REPORT_PARTS_DIR = BASE_DIR / 'report_parts'
+
+# Admission control between gate and report traffic, see
+# parking.middleware.ADMISSION_DEFAULTS for the URL classes and limits.
+# Limits are per worker process: MAX_BACKGROUND needs threaded or async
+# workers (gunicorn --threads, ASGI) to have any effect.
+PARKING_ADMISSION = {
+    'MAX_BACKGROUND': 2,
+    'GATE_LATENCY_THRESHOLD_MS': 500,
+    'RETRY_AFTER': 10,
+}
+
+# Worker warm-up at WSGI/ASGI load; /ready/ reports its status
+PARKING_WARMUP = {
+    'ENABLED': True,
+    'BACKGROUND': False,
+}
+
+# Per-URL query budgets live in parking/budgets.py; the tests fail on
+# overrun. Set WARN to log overruns from live traffic as well.
+PARKING_QUERY_BUDGETS = {
+    'WARN': False,
+}
+
+# Staff-only request profiling (X-Parking-Profile: 1 or ?_profile=1).
+# Results are kept in a ring of MAX_PROFILES under DIR and listed at
+# /admin-tools/profiles/
+PARKING_PROFILING = {
+    'SAMPLE_RATE': 1.0,
+    'MAX_PROFILES': 50,
+    'DIR': BASE_DIR / 'profiles',
 }
+
+# Gate node mode: entries and exits are written to the local journal and
+# pushed to the central database with `python manage.py sync_gate_journal`.
+# NODE_ID must be two characters from 0-9 and A-Z (a system check refuses
+# anything else) and unique per gate node; tokens issued by the node look
+# like TW-01000A7 and never collide with central tokens.
+PARKING_GATE_NODE = {
+    'ENABLED': False,
+    'NODE_ID': '01',
+}
+
+# Cache shared by all workers on this host. It holds the dashboard
+# data-version stamps and the cached users and sessions, so it must not be
+# per-process, and must not cull: once MAX_ENTRIES is reached the file
+# cache deletes a random third of its keys. Keep MAX_ENTRIES well above
+# staff + sessions. With more than one host switch to
+# 'django.core.cache.backends.redis.RedisCache' (LOCATION 'redis://...').
+#
+# 'plates' holds one key per parked vehicle for the already-parked guard
+# (parking.plates). Its writes must stay O(1) as it fills, so it is a
+# per-worker LocMemCache, or the RedisCache above; never the file cache,
+# which lists its directory on every write.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache',
+        'OPTIONS': {'MAX_ENTRIES': 200000},
+    },
+    'plates': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'parking-plates',
+        'OPTIONS': {'MAX_ENTRIES': 200000},
+    },
+}
+
+# Gate terminals authenticate every request: keep sessions and users in
+# the cache so that costs no queries. cached_db still writes sessions
+# through to the database, so a cache flush does not log anyone out.
+# Messages travel in a signed cookie and never rewrite the session.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+# ModelBackend stays listed so sessions started before the switch remain
+# valid until their next login
+AUTHENTICATION_BACKENDS = [
+    'parking.auth.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+PARKING_USER_CACHE = {
+    'CACHE': 'default',
+    'TIMEOUT': 300,     # upper bound on staleness for updates that skip save()
 }
 
 # Password validation
@@ -155,6 +279,14 @@ EMAIL_HOST_PASSWORD = 'your-app-password'
 
 DEFAULT_FROM_EMAIL = 'noreply@titanxparking.com'
 
+# Password reset mail is queued in the outbox table and delivered through
+# EMAIL_BACKEND by `python manage.py send_outbox --interval 10`
+PARKING_OUTBOX = {
+    'BATCH_SIZE': 50,
+    'MAX_ATTEMPTS': 6,
+    'BACKOFF_SECONDS': 30,
+}
+
 # Login/Logout URLs
 LOGIN_URL = 'login_view'
 LOGIN_REDIRECT_URL = 'homepage'
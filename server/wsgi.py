@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
 
 application = get_wsgi_application()
+
+# Import views, compile templates, load fonts and open database connections
+# before the first request (see parking.warmup and PARKING_WARMUP)
+from parking.warmup import warm_up  # noqa: E402
+
+warm_up()